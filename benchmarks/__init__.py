@@ -0,0 +1,11 @@
+import os
+
+def prepare_environment(**overrides: str):
+    """Минимальное окружение для импорта модулей бота без настоящих токенов и БД.
+
+    Конфиг читается при импорте, поэтому вызывать до импорта bot.config и parser.*.
+    """
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.update(overrides)
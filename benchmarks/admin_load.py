@@ -0,0 +1,368 @@
+"""Нагрузочный прогон админ-бота: синтетические нажатия и сообщения через Dispatcher.
+
+Заполняет локальную базу тысячами аккаунтов, чатов, прокси и списков ключевых
+слов, затем по кругу прогоняет сценарий админки (меню, списки, выбор чатов
+для парсинга, FSM-диалог добавления чата, /search, /status, /media_rules)
+через настоящий Dispatcher и обработчики bot/handlers/admin.py. Bot API
+заменён FakeBotSession. Для каждого шага считаются задержка обработки и
+число SQL-запросов, в том числе запросов хранилища FSM. Обновления подаются
+по одному, поэтому запросы однозначно относятся к своему шагу.
+
+    python -m benchmarks.admin_load --chats 5000 --rounds 10 --json admin.json
+    python -m benchmarks.admin_load --fsm-storage memory --filter keyword
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from benchmarks import prepare_environment
+from benchmarks.micro import RUSSIAN_WORDS, ENGLISH_WORDS, environment
+from benchmarks.pipeline import percentile, peak_rss_mb
+
+ADMIN = {"id": 1, "is_bot": False, "first_name": "Admin"}
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bot"}
+ADMIN_CHAT = {"id": 1, "type": "private"}
+
+@dataclass
+class Step:
+    """Одно действие сценария: нажатие кнопки (callback) или сообщение (message)."""
+
+    name: str
+    kind: str
+    data: str
+
+@dataclass
+class StepStats:
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    fsm_queries: List[int] = field(default_factory=list)
+    db_seconds: List[float] = field(default_factory=list)
+    api_calls: List[int] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    unhandled: int = 0
+
+    def summary(self) -> Dict:
+        calls = len(self.latencies)
+        mean = lambda values: round(sum(values) / len(values), 2) if values else 0
+        return {
+            "calls": calls,
+            "latency_ms": {
+                "p50": round(percentile(self.latencies, 50) * 1000, 2),
+                "p90": round(percentile(self.latencies, 90) * 1000, 2),
+                "p99": round(percentile(self.latencies, 99) * 1000, 2),
+                "max": round(max(self.latencies, default=0) * 1000, 2),
+            },
+            "queries": {"mean": mean(self.queries), "max": max(self.queries, default=0)},
+            "fsm_queries": {"mean": mean(self.fsm_queries), "max": max(self.fsm_queries, default=0)},
+            "db_ms": {"mean": mean([seconds * 1000 for seconds in self.db_seconds])},
+            "bot_api_calls": {"mean": mean(self.api_calls)},
+            "errors": dict(self.errors),
+            "unhandled": self.unhandled,
+        }
+
+class QueryCounter:
+    """Счётчик SQL-запросов движка и времени в них; запросы FSM считаются отдельно."""
+
+    def __init__(self):
+        self.queries = 0
+        self.fsm_queries = 0
+        self.seconds = 0.0
+
+    def install(self, engine):
+        from sqlalchemy import event
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        if "fsm_states" in statement:
+            self.fsm_queries += 1
+        context._admin_load_started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_admin_load_started", None)
+        if started is not None:
+            self.seconds += time.perf_counter() - started
+
+    def snapshot(self):
+        return self.queries, self.fsm_queries, self.seconds
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон админ-бота через Dispatcher")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=2000, help="Целевых чатов")
+    parser.add_argument("--proxies", type=int, default=200)
+    parser.add_argument("--keyword-lists", type=int, default=300)
+    parser.add_argument("--keywords-per-list", type=int, default=30)
+    parser.add_argument("--archive", type=int, default=20000, help="Сообщений в архиве для /search")
+    parser.add_argument("--rounds", type=int, default=5, help="Сколько раз пройти сценарий")
+    parser.add_argument("--warmup-rounds", type=int, default=1, help="Проходы без замера")
+    parser.add_argument("--filter", default="", help="Только шаги, в имени которых есть эта подстрока")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bot-latency", type=float, default=0.0, help="Медиана задержки Bot API, секунды")
+    parser.add_argument("--fsm-storage", choices=["database", "memory"], default="database")
+    parser.add_argument("--database-url", help="База для прогона; по умолчанию временный файл SQLite. Заполняется, только если в ней нет аккаунтов")
+    parser.add_argument("--keep-db", action="store_true", help="Не удалять временную базу после прогона")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="Куда записать результат в JSON; '-' — в stdout")
+    return parser
+
+async def seed(args, rng: random.Random) -> bool:
+    """Заполняет пустую базу; False, если данные уже есть и используются как есть."""
+    from sqlalchemy import insert, select, func
+    from database.db import engine
+    from database.models import Account, Proxy, TargetChat, KeywordList, KeywordFilter, ArchivedMessage
+
+    async with engine.begin() as conn:
+        if await conn.scalar(select(func.count()).select_from(Account.__table__)):
+            return False
+        if args.proxies:
+            await conn.execute(insert(Proxy.__table__), [
+                {"host": f"10.0.{index // 250}.{index % 250 + 1}", "port": 1080, "user": f"user{index}", "password": "secret", "type": "socks5"}
+                for index in range(args.proxies)
+            ])
+        if args.accounts:
+            await conn.execute(insert(Account.__table__), [
+                {"phone_number": f"+7900{index:07d}", "api_id": 100000 + index, "api_hash": f"{index:032x}", "proxy_id": rng.randint(1, args.proxies) if args.proxies and rng.random() < 0.5 else None}
+                for index in range(args.accounts)
+            ])
+        if args.chats:
+            await conn.execute(insert(TargetChat.__table__), [
+                {"chat_id": f"-100{1_000_000 + index}", "title": f"{rng.choice(RUSSIAN_WORDS).capitalize()} {rng.choice(RUSSIAN_WORDS)} {index}" if rng.random() < 0.8 else None}
+                for index in range(args.chats)
+            ])
+        if args.keyword_lists:
+            await conn.execute(insert(KeywordList.__table__), [
+                {"account_id": rng.randint(1, max(1, args.accounts)), "name": f"Список {index}", "enabled": rng.random() < 0.7}
+                for index in range(args.keyword_lists)
+            ])
+            keywords = []
+            for list_id in range(1, args.keyword_lists + 1):
+                words = RUSSIAN_WORDS if list_id % 2 else ENGLISH_WORDS
+                for index in range(args.keywords_per_list):
+                    keywords.append({"keyword_list_id": list_id, "keyword": f"{rng.choice(words)}{index}", "enabled": True})
+            if keywords:
+                await conn.execute(insert(KeywordFilter.__table__), keywords)
+        if args.archive:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            statuses = ("forwarded", "forwarded", "filtered", "duplicate", "failed")
+            await conn.execute(insert(ArchivedMessage.__table__), [
+                {
+                    "account_id": 1, "chat_id": -1001000000 - index % max(1, args.chats), "chat_title": "Архив",
+                    "message_id": index, "date": now - datetime.timedelta(seconds=index * 30),
+                    "text": " ".join(rng.choice(RUSSIAN_WORDS) for _ in range(rng.randint(5, 60))),
+                    "forward_status": rng.choice(statuses),
+                }
+                for index in range(args.archive)
+            ])
+    return True
+
+async def first_ids() -> Dict[str, Optional[int]]:
+    from sqlalchemy import select, func
+    from database.db import engine
+    from database.models import Account, Proxy, TargetChat, KeywordList
+
+    async with engine.connect() as conn:
+        return {
+            name: await conn.scalar(select(func.min(model.id)))
+            for name, model in (("account", Account), ("proxy", Proxy), ("chat", TargetChat), ("keyword_list", KeywordList))
+        }
+
+def build_scenario(ids: Dict[str, Optional[int]], round_number: int) -> List[Step]:
+    from bot.callbacks import (
+        StatusPageCallback, SearchPageCallback, BindProxyAccountCallback, DeliveryModeCallback, ToggleKeywordListCallback,
+        EditKeywordListCallback, ParseAccountCallback, ToggleChatCallback
+    )
+
+    callback = lambda name, data=None: Step(name, "callback", data or name)
+    message = lambda name, text: Step(name, "message", text)
+    account_id, chat_id, list_id = ids["account"], ids["chat"], ids["keyword_list"]
+    steps = [
+        message("/start", "/start"),
+        callback("menu_accounts"), callback("list_accounts"), callback("delete_account"), callback("check_account"),
+        callback("back_to_main"),
+        callback("menu_proxy"), callback("list_proxies"), callback("delete_proxy"), callback("bind_proxy"),
+    ]
+    if account_id:
+        steps.append(callback("bind_proxy_account", BindProxyAccountCallback(id=account_id).pack()))
+    steps += [
+        callback("menu_chats"), callback("list_target_chats"), callback("delete_target_chat"),
+        callback("delivery_mode"), callback("delivery_mode_selected", DeliveryModeCallback(mode="bot").pack()),
+        # FSM-диалог добавления целевого чата: новый чат в каждом проходе
+        callback("add_target_chat"),
+        message("fsm:target_chat_id", f"-100{9_000_000 + round_number}"),
+        message("fsm:target_chat_title", f"Нагрузочный чат {round_number}"),
+        callback("menu_parsing"), callback("status_page", StatusPageCallback(page=0).pack()), message("/status", "/status"),
+        callback("keyword_list_menu"), callback("list_keyword_lists"), callback("edit_keyword_list"),
+        callback("delete_keyword_list"), callback("toggle_keyword_list"),
+    ]
+    if list_id:
+        # Два переключения подряд возвращают список в исходное состояние
+        toggle = ToggleKeywordListCallback(id=list_id).pack()
+        steps += [callback("toggle_keyword_list_selected", toggle), callback("toggle_keyword_list_selected", toggle)]
+        steps += [callback("edit_keyword_list_selected", EditKeywordListCallback(id=list_id).pack()), callback("back_to_keyword_menu")]
+    steps += [callback("toggle_filter"), callback("toggle_filter"), callback("start_parsing")]
+    if account_id:
+        steps.append(callback("parse_account", ParseAccountCallback(id=account_id).pack()))
+        if chat_id:
+            toggle = ToggleChatCallback(account_id=account_id, chat_id=chat_id).pack()
+            steps += [callback("toggle_chat", toggle), callback("toggle_chat", toggle)]
+    steps += [
+        callback("back_to_main"),
+        message("/search", "/search продам"), callback("search_page", SearchPageCallback(page=1).pack()),
+        message("/media_rules", "/media_rules"), message("/media_rules set", "/media_rules max_size=20 kinds=photo,video,text"),
+        message("/media_rules set", "/media_rules reset"),
+    ]
+    return steps
+
+class UpdateFactory:
+    """Синтетические Update от одного администратора в личном чате с ботом."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def build(self, step: Step):
+        from aiogram.types import Update
+        self.update_id += 1
+        now = int(time.time())
+        if step.kind == "callback":
+            payload = {"callback_query": {
+                "id": str(self.update_id), "from": ADMIN, "chat_instance": "admin_load", "data": step.data,
+                "message": {"message_id": 1, "date": now, "chat": ADMIN_CHAT, "from": BOT_USER, "text": "Меню"},
+            }}
+        else:
+            payload = {"message": {"message_id": self.update_id, "date": now, "chat": ADMIN_CHAT, "from": ADMIN, "text": step.data}}
+        return Update.model_validate({"update_id": self.update_id, **payload}, context={"bot": self.bot})
+
+async def run(args) -> Dict:
+    from loguru import logger
+    from aiogram import Bot, Dispatcher
+    from aiogram.dispatcher.event.bases import UNHANDLED
+    from database.db import engine, init_db
+    from bot.config import BOT_TOKEN
+    from bot.storage import create_storage
+    from bot.handlers.admin import router as admin_router
+    from benchmarks.fakes import FakeBotSession, Latency
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    rng = random.Random(args.seed)
+    await init_db()
+    started = time.perf_counter()
+    seeded = await seed(args, rng)
+    seed_seconds = time.perf_counter() - started
+    print(f"База {'заполнена' if seeded else 'уже содержит данные, заполнение пропущено'} за {seed_seconds:.1f} с", file=sys.stderr)
+    ids = await first_ids()
+
+    session = FakeBotSession(seed=args.seed, latency=Latency(args.bot_latency))
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = Dispatcher(storage=create_storage())
+    dp.include_router(admin_router)
+    counter = QueryCounter()
+    counter.install(engine)
+    updates = UpdateFactory(bot)
+
+    stats: Dict[str, StepStats] = {}
+    total_started = time.perf_counter()
+    measured = 0
+    for round_number in range(args.warmup_rounds + args.rounds):
+        warmup = round_number < args.warmup_rounds
+        if round_number == args.warmup_rounds:
+            total_started = time.perf_counter()
+        for step in build_scenario(ids, round_number):
+            # Шаги вне фильтра всё равно выполняются: от них зависит состояние FSM следующих
+            record = not warmup and args.filter in step.name
+            update = updates.build(step)
+            queries, fsm_queries, db_seconds = counter.snapshot()
+            api_calls = sum(session.calls.values())
+            step_started = time.perf_counter()
+            error = None
+            try:
+                response = await dp.feed_update(bot, update)
+            except Exception as e:
+                response, error = None, type(e).__name__
+            elapsed = time.perf_counter() - step_started
+            if not record:
+                continue
+            measured += 1
+            entry = stats.setdefault(step.name, StepStats())
+            entry.latencies.append(elapsed)
+            entry.queries.append(counter.queries - queries)
+            entry.fsm_queries.append(counter.fsm_queries - fsm_queries)
+            entry.db_seconds.append(counter.seconds - db_seconds)
+            entry.api_calls.append(sum(session.calls.values()) - api_calls)
+            if error:
+                entry.errors[error] += 1
+            elif response is UNHANDLED:
+                entry.unhandled += 1
+    duration = time.perf_counter() - total_started
+
+    await dp.storage.close()
+    await bot.session.close()
+    await engine.dispose()
+    steps = {name: entry.summary() for name, entry in stats.items()}
+    return {
+        "environment": environment(),
+        "config": vars(args),
+        "dataset": {name: getattr(args, name) for name in ("accounts", "chats", "proxies", "keyword_lists", "keywords_per_list", "archive")} if seeded else "existing",
+        "seed_seconds": round(seed_seconds, 2),
+        "updates": measured,
+        "duration_seconds": round(duration, 3),
+        "updates_per_second": round(measured / duration, 2) if duration > 0 else 0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "bot_api_calls": dict(session.calls),
+        # Самые медленные шаги первыми
+        "steps": dict(sorted(steps.items(), key=lambda item: item[1]["latency_ms"]["p50"], reverse=True)),
+    }
+
+def format_report(result: Dict) -> str:
+    lines = [
+        f"Обновлений: {result['updates']} за {result['duration_seconds']} с, {result['updates_per_second']} в секунду, пиковый RSS {result['peak_rss_mb']} МБ",
+        f"{'шаг':28} {'вызовов':>7} {'p50 мс':>9} {'p99 мс':>9} {'макс мс':>9} {'SQL':>8} {'из них FSM':>10} {'БД мс':>8} {'Bot API':>7}",
+    ]
+    for name, step in result["steps"].items():
+        latency = step["latency_ms"]
+        problems = ""
+        if step["errors"] or step["unhandled"]:
+            problems = f"  ошибки: {step['errors']}, без обработчика: {step['unhandled']}"
+        lines.append(
+            f"{name:28} {step['calls']:>7} {latency['p50']:>9.2f} {latency['p99']:>9.2f} {latency['max']:>9.2f} "
+            f"{step['queries']['mean']:>8g} {step['fsm_queries']['mean']:>10g} {step['db_ms']['mean']:>8.2f} {step['bot_api_calls']['mean']:>7g}{problems}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    directory = None
+    database_url = args.database_url
+    if not database_url:
+        directory = tempfile.mkdtemp(prefix="admin_load_")
+        database_url = f"sqlite+aiosqlite:///{os.path.join(directory, 'admin_load.db')}"
+    prepare_environment(DATABASE_URL=database_url, FSM_STORAGE=args.fsm_storage)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if directory and not args.keep_db:
+            shutil.rmtree(directory, ignore_errors=True)
+        elif directory:
+            print(f"База сохранена: {database_url}", file=sys.stderr)
+    print(format_report(result), file=sys.stderr)
+    if args.json == "-":
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
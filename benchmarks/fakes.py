@@ -0,0 +1,313 @@
+"""Локальные заменители Telegram для бенчмарков: клиент Telethon и Bot API.
+
+Задержки, ошибки, FloodWait и размеры медиа задаются распределениями и
+генерируются из random.Random с фиксированным seed, поэтому одна и та же
+конфигурация даёт одинаковую последовательность событий.
+"""
+import asyncio
+import datetime
+import itertools
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from aiohttp.client_exceptions import ClientConnectionError
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telethon.tl.functions.messages import GetPeerDialogsRequest
+from telethon.tl.types import (
+    PeerChannel, InputPeerChannel, Channel, ChatPhotoEmpty, MessageMediaPhoto, MessageMediaDocument, Photo, PhotoSize, Document,
+    DocumentAttributeVideo, DocumentAttributeFilename
+)
+
+@dataclass
+class Latency:
+    """Задержка в секундах: логнормальное распределение с медианой median и разбросом sigma."""
+
+    median: float = 0.0
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(0, self.sigma) * self.median
+
+@dataclass
+class Faults:
+    """Вероятности сбоев одного вызова."""
+
+    error_rate: float = 0.0  # Сетевая ошибка
+    flood_rate: float = 0.0  # FloodWait
+    flood_seconds: int = 1
+
+@dataclass
+class MediaProfile:
+    """Доли типов сообщений и размеры медиа (логнормально, медиана в байтах)."""
+
+    photo_ratio: float = 0.2
+    video_ratio: float = 0.05
+    document_ratio: float = 0.05
+    photo_size: int = 150_000
+    video_size: int = 5_000_000
+    document_size: int = 500_000
+    sigma: float = 0.6
+
+    def sample(self, rng: random.Random, media_id: int):
+        roll = rng.random()
+        if roll < self.photo_ratio:
+            size = self._size(rng, self.photo_size)
+            photo = Photo(id=media_id, access_hash=0, file_reference=b"", date=None, sizes=[PhotoSize(type="y", w=1280, h=960, size=size)], dc_id=2)
+            return MessageMediaPhoto(photo=photo)
+        roll -= self.photo_ratio
+        if roll < self.video_ratio:
+            size = self._size(rng, self.video_size)
+            attributes = [DocumentAttributeVideo(duration=10, w=1280, h=720)]
+            return MessageMediaDocument(document=Document(id=media_id, access_hash=0, file_reference=b"", date=None, mime_type="video/mp4", size=size, dc_id=4, attributes=attributes))
+        roll -= self.video_ratio
+        if roll < self.document_ratio:
+            size = self._size(rng, self.document_size)
+            attributes = [DocumentAttributeFilename(file_name=f"file_{media_id}.pdf")]
+            return MessageMediaDocument(document=Document(id=media_id, access_hash=0, file_reference=b"", date=None, mime_type="application/pdf", size=size, dc_id=2, attributes=attributes))
+        return None
+
+    def _size(self, rng: random.Random, median: int) -> int:
+        return max(1, int(rng.lognormvariate(0, self.sigma) * median))
+
+@dataclass
+class FakeMessage:
+    """Поля сообщения Telethon, которые читает парсер."""
+
+    id: int
+    chat_id: int
+    date: datetime.datetime
+    message: str
+    media: object = None
+    entities: Optional[list] = None
+    sender_id: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        return self.message
+
+WORDS = ["продам", "куплю", "квартира", "машина", "срочно", "недорого", "работа", "аренда", "москва", "новый", "обмен", "скидка"]
+
+class FakeChat:
+    """Канал-источник: сообщения появляются по расписанию с заданной частотой."""
+
+    def __init__(self, chat_id: int, rng: random.Random, media: MediaProfile, keywords_ratio: float = 1.0, username: str = None):
+        self.chat_id = chat_id
+        self.username = username
+        self.rng = rng
+        self.media = media
+        self.keywords_ratio = keywords_ratio
+        self.messages: List[FakeMessage] = []
+        self.published_at: Dict[int, float] = {}  # ID сообщения -> time.monotonic() публикации
+        self._ids = itertools.count(1)
+
+    def publish(self) -> FakeMessage:
+        message_id = next(self._ids)
+        media = self.media.sample(self.rng, self.chat_id * 1_000_000 + message_id)
+        words = self.rng.sample(WORDS, 4) if self.rng.random() < self.keywords_ratio else ["ничего", "интересного"]
+        # Номер сообщения в тексте не даёт дедупликации склеить разные сообщения
+        text = f"{' '.join(words)} #{self.chat_id}-{message_id} " + "".join(self.rng.choice("abcdefghij") for _ in range(32))
+        message = FakeMessage(
+            id=message_id,
+            chat_id=self.chat_id,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            message=text,
+            media=media,
+            sender_id=self.rng.randint(1, 1000)
+        )
+        self.messages.append(message)
+        self.published_at[message_id] = time.monotonic()
+        return message
+
+    @property
+    def head(self) -> int:
+        return self.messages[-1].id if self.messages else 0
+
+    async def produce(self, count: int, rate: float):
+        """Публикует count сообщений, rate сообщений в секунду (0 — все сразу)."""
+        for _ in range(count):
+            self.publish()
+            if rate > 0:
+                await asyncio.sleep(self.rng.expovariate(rate))
+
+class FakeTelegramClient:
+    """Заменитель TelegramClient для парсера: опрос истории, пакетные диалоги, скачивание."""
+
+    def __init__(self, chats: Dict[int, FakeChat], seed: int = 0, rpc_latency: Latency = None, download_bandwidth: float = 0, faults: Faults = None):
+        self.chats = chats
+        self.rng = random.Random(seed)
+        self.rpc_latency = rpc_latency or Latency()
+        self.download_bandwidth = download_bandwidth  # Байт в секунду на файл; 0 — мгновенно
+        self.faults = faults or Faults()
+        self.calls: Counter = Counter()
+        self.downloaded_bytes = 0
+
+    async def _rpc(self, name: str):
+        self.calls[name] += 1
+        await asyncio.sleep(self.rpc_latency.sample(self.rng))
+        if self.rng.random() < self.faults.flood_rate:
+            raise FloodWaitError(request=None, capture=self.faults.flood_seconds)
+        if self.rng.random() < self.faults.error_rate:
+            raise ConnectionError(f"{name}: обрыв соединения (имитация)")
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_input_entity(self, peer):
+        return InputPeerChannel(channel_id=utils.resolve_id(int(peer))[0], access_hash=0)
+
+    async def get_entity(self, peer):
+        # Как Telethon: по имени пользователя или ID возвращается сущность Channel с непомеченным id
+        await self._rpc("ResolveUsername")
+        chat = next((chat for chat in self.chats.values() if peer in (chat.username, chat.chat_id, str(chat.chat_id))), None)
+        if chat is None:
+            raise ValueError(f"Чат {peer} не найден")
+        return Channel(id=utils.resolve_id(chat.chat_id)[0], title=chat.username or str(chat.chat_id), photo=ChatPhotoEmpty(), date=None, access_hash=0, username=chat.username)
+
+    async def __call__(self, request):
+        if isinstance(request, GetPeerDialogsRequest):
+            await self._rpc("GetPeerDialogs")
+            dialogs = []
+            for input_peer in request.peers:
+                chat = self.chats.get(utils.get_peer_id(PeerChannel(input_peer.peer.channel_id)))
+                if chat:
+                    dialogs.append(SimpleNamespace(peer=PeerChannel(input_peer.peer.channel_id), top_message=chat.head))
+            return SimpleNamespace(dialogs=dialogs)
+        raise NotImplementedError(type(request).__name__)
+
+    async def get_messages(self, entity, limit: int = 1, min_id: int = 0, ids=None, reverse: bool = False):
+        await self._rpc("GetHistory" if ids is None else "GetMessages")
+        chat = self.chats[int(entity)]
+        if ids is not None:
+            return next((message for message in chat.messages if message.id == ids), None)
+        # Как в Telethon: без reverse самые новые limit сообщений выше min_id, от новых к старым,
+        # с reverse — самые старые, от старых к новым
+        newer = [message for message in chat.messages if message.id > (min_id or 0)]
+        return newer[:limit] if reverse else list(reversed(newer[-limit:]))
+
+    async def iter_messages(self, entity, limit: int = None, min_id: int = 0, reverse: bool = False):
+        for message in await self.get_messages(entity, limit=limit or 100, min_id=min_id, reverse=reverse):
+            yield message
+
+    async def download_media(self, media, file=None):
+        await self._rpc("GetFile")
+        size = _media_size(media)
+        if self.download_bandwidth > 0:
+            await asyncio.sleep(size / self.download_bandwidth)
+        self.downloaded_bytes += size
+        buffer = file if file is not None else BytesIO()
+        buffer.write(b"\0" * size)
+        return buffer
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        await self._rpc("ForwardMessages")
+        return SimpleNamespace(id=self.calls["ForwardMessages"])
+
+    async def send_message(self, entity, message="", file=None, **kwargs):
+        await self._rpc("SendMessage" if file is None else "SendMedia")
+        return SimpleNamespace(id=self.calls["SendMessage"] + self.calls["SendMedia"])
+
+def _media_size(media) -> int:
+    if isinstance(media, MessageMediaPhoto):
+        return media.photo.sizes[-1].size
+    if isinstance(media, MessageMediaDocument):
+        return media.document.size
+    return 0
+
+@dataclass
+class SentMessage:
+    chat_id: int
+    method: str
+    text: str
+    sent_at: float = field(default_factory=time.monotonic)
+
+class FakeBot:
+    """Заменитель aiogram Bot: методы отправки с задержкой, сетевыми ошибками и FloodWait."""
+
+    def __init__(self, seed: int = 0, latency: Latency = None, upload_bandwidth: float = 0, faults: Faults = None):
+        self.rng = random.Random(seed + 1)
+        self.latency = latency or Latency()
+        self.upload_bandwidth = upload_bandwidth
+        self.faults = faults or Faults()
+        self.calls: Counter = Counter()
+        self.sent: List[SentMessage] = []
+        self.uploaded_bytes = 0
+        self.id = 0
+
+    async def _send(self, method: str, chat_id, text: str = "", file=None, **kwargs):
+        self.calls[method] += 1
+        delay = self.latency.sample(self.rng)
+        size = len(file.data) if file is not None else 0
+        if size and self.upload_bandwidth > 0:
+            delay += size / self.upload_bandwidth
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.faults.flood_rate:
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=""), "Flood control exceeded", self.faults.flood_seconds)
+        if self.rng.random() < self.faults.error_rate:
+            raise ClientConnectionError(f"{method}: обрыв соединения (имитация)")
+        self.uploaded_bytes += size
+        self.sent.append(SentMessage(chat_id=chat_id, method=method, text=text or ""))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._send("sendMessage", chat_id, text)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        return await self._send("sendPhoto", chat_id, caption, photo)
+
+    async def send_video(self, chat_id, video, caption=None, **kwargs):
+        return await self._send("sendVideo", chat_id, caption, video)
+
+    async def send_audio(self, chat_id, audio, caption=None, **kwargs):
+        return await self._send("sendAudio", chat_id, caption, audio)
+
+    async def send_document(self, chat_id, document, caption=None, **kwargs):
+        return await self._send("sendDocument", chat_id, caption, document)
+
+    async def send_sticker(self, chat_id, sticker, **kwargs):
+        return await self._send("sendSticker", chat_id, "", sticker)
+
+class FakeBotSession(BaseSession):
+    """Сессия aiogram без сети: для настоящего Bot в нагрузочном прогоне админки.
+
+    Отвечает на sendMessage сообщением, на остальные методы — True, и считает
+    вызовы по имени метода Bot API.
+    """
+
+    def __init__(self, seed: int = 0, latency: Latency = None):
+        super().__init__()
+        self.rng = random.Random(seed + 2)
+        self.latency = latency or Latency()
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls[method.__api_method__] += 1
+        delay = self.latency.sample(self.rng)
+        if delay:
+            await asyncio.sleep(delay)
+        if isinstance(method, SendMessage):
+            chat = Chat(id=int(method.chat_id), type="private")
+            message = Message(message_id=next(self._message_ids), date=datetime.datetime.now(datetime.timezone.utc), chat=chat, text=method.text)
+            return message.as_(bot)
+        return True
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536, raise_for_status: bool = True):
+        raise NotImplementedError("Скачивание файлов Bot API не имитируется")
+        yield b""
+
+    async def close(self):
+        pass
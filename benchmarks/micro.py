@@ -0,0 +1,223 @@
+"""Микробенчмарки работы, которую парсер делает для каждого сообщения.
+
+Покрывают поиск ключевых слов, приведение к нижнему регистру, подпись, перевод
+сущностей в HTML, определение типа медиа, правила по метаданным и отпечаток для
+поиска почти-дубликатов. Корпус — русский и английский текст разной длины, генерируется из фиксированного seed.
+Для переписанных мест рядом замеряется прежняя реализация (legacy_*).
+
+    python -m benchmarks.micro --json micro.json
+    python -m benchmarks.micro --filter keywords --quick
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List
+from benchmarks import prepare_environment
+
+RUSSIAN_WORDS = (
+    "продам куплю квартира машина срочно недорого работа аренда москва новый обмен скидка доставка телефон "
+    "ремонт гараж дача участок торг цена вакансия зарплата опыт график офис центр район метро комната"
+).split()
+ENGLISH_WORDS = (
+    "sell buy apartment car urgent cheap job rent london new exchange discount delivery phone repair garage "
+    "house land price vacancy salary experience schedule office center district subway room bargain offer"
+).split()
+# Длины текста: короткое сообщение, обычная подпись, предел подписи, предел текстового сообщения
+TEXT_LENGTHS = {"short": 80, "caption": 1024, "long": 4096}
+KEYWORD_COUNTS = (10, 100, 1000, 10000)
+
+@dataclass
+class Result:
+    name: str
+    params: Dict[str, object]
+    ns_per_op: float
+    ops_per_second: float
+    loops: int
+    repeats: int
+
+def make_text(rng: random.Random, words: List[str], length: int) -> str:
+    parts = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        # Немного заглавных букв, пунктуации и ссылок, как в реальных объявлениях
+        if rng.random() < 0.1:
+            word = word.capitalize()
+        if rng.random() < 0.05:
+            word += rng.choice(".,!?-")
+        if rng.random() < 0.01:
+            word = f"https://t.me/{word}"
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:length]
+
+def make_keywords(rng: random.Random, words: List[str], count: int) -> List[str]:
+    # Реальные списки: отдельные слова и короткие фразы, большая часть в тексте не встречается
+    keywords = []
+    for index in range(count):
+        if index < len(words) and rng.random() < 0.5:
+            keywords.append(words[index])
+        else:
+            keywords.append(f"{rng.choice(words)}{index}" if rng.random() < 0.7 else f"{rng.choice(words)} {rng.choice(words)}")
+    return keywords
+
+def legacy_match(keywords: List[str], text: str) -> List[str]:
+    # Прежний фильтр: lower() у каждого ключевого слова на каждом сообщении
+    lowered_text = text.lower()
+    return [keyword for keyword in keywords if keyword.lower() in lowered_text]
+
+LEGACY_SPECIAL_CHARS = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
+
+def legacy_escape(text: str) -> str:
+    # Прежнее экранирование подписи: 18 последовательных replace
+    for char in LEGACY_SPECIAL_CHARS:
+        text = text.replace(char, f'\\{char}')
+    return text
+
+def measure(name: str, func: Callable[[], object], params: Dict[str, object], repeats: int, min_time: float) -> Result:
+    timer = timeit.Timer(func)
+    loops = 1
+    # Подбираем число повторов так, чтобы один замер длился не меньше min_time
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= min_time:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeats, number=loops)) / loops
+    return Result(name=name, params=params, ns_per_op=round(best * 1e9, 1), ops_per_second=round(1 / best, 1) if best else 0.0, loops=loops, repeats=repeats)
+
+def build_cases(rng: random.Random) -> List:
+    from telethon.tl.types import (
+        MessageMediaPhoto, MessageMediaDocument, Photo, PhotoSize, Document, DocumentAttributeFilename,
+        DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeImageSize, MessageEntityBold,
+        MessageEntityItalic, MessageEntityTextUrl, MessageEntityCode
+    )
+    from types import SimpleNamespace
+    from parser.filters import KeywordMatcher, MediaRules, MessageMeta, parse_media_rules
+    from parser.formatting import chat_signature, entities_to_html, format_message
+    from parser.sender import get_media_kind
+    from parser.dedup import normalize_text, simhash
+
+    cases = []
+    texts = {}
+    for language, words in (("ru", RUSSIAN_WORDS), ("en", ENGLISH_WORDS)):
+        for label, length in TEXT_LENGTHS.items():
+            texts[(language, label)] = make_text(rng, words, length)
+
+    # Поиск ключевых слов: новый матчер и прежний код
+    for language, words in (("ru", RUSSIAN_WORDS), ("en", ENGLISH_WORDS)):
+        for count in KEYWORD_COUNTS:
+            keywords = make_keywords(rng, words, count)
+            matcher = KeywordMatcher(keywords)
+            for label in TEXT_LENGTHS:
+                text = texts[(language, label)]
+                params = {"language": language, "keywords": count, "text": label, "chars": len(text)}
+                cases.append(("keywords.match", lambda matcher=matcher, text=text: matcher.match(text), params))
+                cases.append(("keywords.legacy_match", lambda keywords=keywords, text=text: legacy_match(keywords, text), params))
+
+    for (language, label), text in texts.items():
+        params = {"language": language, "text": label, "chars": len(text)}
+        cases.append(("text.lower", text.lower, params))
+        cases.append(("dedup.normalize_text", lambda text=text: normalize_text(text), params))
+
+    # Подпись: из кэша и построение заново
+    title = "Продажа квартир Москва | Недвижимость 24/7"
+    cases.append(("signature.cached", lambda: chat_signature(title), {"title_chars": len(title)}))
+    cases.append(("signature.build", lambda: chat_signature.__wrapped__(title), {"title_chars": len(title)}))
+    cases.append(("signature.legacy", lambda: legacy_escape(f"👍 Скопировано из [{title}](https://t.me/{title.replace(' ', '_')})"), {"title_chars": len(title)}))
+
+    # Сущности форматирования в HTML
+    for label in ("caption", "long"):
+        text = texts[("ru", label)]
+        for count in (0, 10, 100):
+            entities = []
+            for index in range(count):
+                offset = rng.randrange(0, max(1, len(text) - 20))
+                kind = (MessageEntityBold, MessageEntityItalic, MessageEntityCode)[index % 3]
+                entities.append(kind(offset=offset, length=rng.randint(1, 15)) if index % 10 else MessageEntityTextUrl(offset=offset, length=10, url="https://example.com/?a=1&b=2"))
+            # Telegram отдаёт непересекающиеся сущности; для замера пересечения не важны
+            message = SimpleNamespace(message=text, entities=entities or None)
+            signature = chat_signature(title)
+            params = {"text": label, "entities": count}
+            cases.append(("formatting.entities_to_html", lambda message=message: entities_to_html(message.message, message.entities), params))
+            cases.append(("formatting.format_message", lambda message=message, signature=signature: format_message(message, signature), params))
+
+    # Тип медиа по атрибутам документа
+    photo = MessageMediaPhoto(photo=Photo(id=1, access_hash=0, file_reference=b"", date=None, sizes=[PhotoSize(type="y", w=1280, h=960, size=150000)], dc_id=2))
+    video = MessageMediaDocument(document=Document(id=2, access_hash=0, file_reference=b"", date=None, mime_type="video/mp4", size=5000000, dc_id=2, attributes=[
+        DocumentAttributeFilename(file_name="video.mp4"), DocumentAttributeImageSize(w=1280, h=720), DocumentAttributeVideo(duration=30, w=1280, h=720)
+    ]))
+    audio = MessageMediaDocument(document=Document(id=3, access_hash=0, file_reference=b"", date=None, mime_type="audio/mpeg", size=4000000, dc_id=2, attributes=[
+        DocumentAttributeFilename(file_name="track.mp3"), DocumentAttributeAudio(duration=180)
+    ]))
+    document = MessageMediaDocument(document=Document(id=4, access_hash=0, file_reference=b"", date=None, mime_type="application/pdf", size=500000, dc_id=2, attributes=[
+        DocumentAttributeFilename(file_name="file.pdf")
+    ]))
+    rules = parse_media_rules("max_size=20 kinds=photo,video,text mime=image/*,video/* block=1,2,3")
+    for label, media in (("text", None), ("photo", photo), ("video", video), ("audio", audio), ("document", document)):
+        message = SimpleNamespace(id=1, media=media, message=texts[("ru", "caption")], sender_id=42)
+        params = {"media": label}
+        cases.append(("media.get_media_kind", lambda message=message: get_media_kind(message), params))
+        cases.append(("filters.message_meta", lambda message=message: MessageMeta.from_message(message), params))
+        meta = MessageMeta.from_message(message)
+        cases.append(("filters.media_rules_check", lambda meta=meta: rules.check(meta), params))
+    empty_rules = MediaRules()
+    cases.append(("filters.media_rules_check_empty", lambda: empty_rules.check(MessageMeta.from_message(SimpleNamespace(id=1, media=None, message="", sender_id=1))), {}))
+
+    # Отпечаток для поиска почти-дубликатов: нормализация и SimHash
+    for (language, label), text in texts.items():
+        cases.append(("dedup.fingerprint", lambda text=text: simhash(normalize_text(text)), {"language": language, "text": label, "chars": len(text)}))
+    return cases
+
+def environment() -> Dict[str, object]:
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_revision": revision,
+        "timestamp": int(time.time()),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей парсера")
+    parser.add_argument("--filter", default="", help="Только замеры, в имени которых есть эта подстрока")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Минимальная длительность одного замера, секунды")
+    parser.add_argument("--quick", action="store_true", help="Быстрый прогон: 3 повтора по 0.05 с")
+    parser.add_argument("--json", help="Куда записать результат в JSON; '-' — в stdout")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.repeats, args.min_time = 3, 0.05
+
+    prepare_environment()
+    cases = [case for case in build_cases(random.Random(args.seed)) if args.filter in case[0]]
+    results = []
+    for name, func, params in cases:
+        result = measure(name, func, params, args.repeats, args.min_time)
+        results.append(result)
+        details = " ".join(f"{key}={value}" for key, value in params.items())
+        print(f"{name:34} {details:55} {result.ns_per_op:>14,.1f} нс/оп", file=sys.stderr)
+
+    report = {"environment": environment(), "seed": args.seed, "results": [asdict(result) for result in results]}
+    if args.json == "-":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Сквозной бенчмарк парсера на поддельном Telegram.
+
+Запускает настоящие real_time_parsing_task под супервизором против
+FakeTelegramClient и FakeBot и ждёт, пока каждое опубликованное сообщение
+дойдёт до конечного статуса в архиве. Пример:
+
+    python -m benchmarks.pipeline --chats 4 --messages 500 --rate 50 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+from benchmarks import prepare_environment
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; 0 для пустого списка."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    # В Linux ru_maxrss в килобайтах, в macOS — в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+class ArchiveSink:
+    """Заменяет archive_writer: считает конечные статусы и задержку пересылки."""
+
+    def __init__(self, chats, expected: int):
+        self.chats = chats
+        self.expected = expected
+        self.statuses: Counter = Counter()
+        self.latencies: List[float] = []
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def reset(self, expected: int):
+        self.expected = expected
+        self.statuses.clear()
+        self.latencies.clear()
+        self.finished_at = None
+        self.done.clear()
+
+    def add(self, **record):
+        self.statuses[record["forward_status"]] += 1
+        if record["forward_status"] == "forwarded":
+            published_at = self.chats[record["chat_id"]].published_at[record["message_id"]]
+            self.latencies.append(time.monotonic() - published_at)
+        if sum(self.statuses.values()) >= self.expected:
+            self.finished_at = time.monotonic()
+            self.done.set()
+
+    def __len__(self):
+        return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк парсера на поддельном Telegram")
+    parser.add_argument("--chats", type=int, default=4, help="Чатов-источников на одном аккаунте")
+    parser.add_argument("--messages", type=int, default=200, help="Сообщений в каждом чате")
+    parser.add_argument("--rate", type=float, default=20, help="Сообщений в секунду в каждом чате; 0 — все сразу")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--photo-ratio", type=float, default=0.2)
+    parser.add_argument("--video-ratio", type=float, default=0.05)
+    parser.add_argument("--document-ratio", type=float, default=0.05)
+    parser.add_argument("--photo-size", type=int, default=150_000, help="Медиана размера фото, байт")
+    parser.add_argument("--video-size", type=int, default=5_000_000)
+    parser.add_argument("--document-size", type=int, default=500_000)
+    parser.add_argument("--rpc-latency", type=float, default=0.05, help="Медиана задержки RPC Telethon, секунды")
+    parser.add_argument("--bot-latency", type=float, default=0.08, help="Медиана задержки Bot API, секунды")
+    parser.add_argument("--download-bandwidth", type=float, default=20e6, help="Байт в секунду на одно скачивание")
+    parser.add_argument("--upload-bandwidth", type=float, default=10e6, help="Байт в секунду на одну загрузку ботом")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля вызовов с сетевой ошибкой")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Доля вызовов с FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--keywords", default="", help="Ключевые слова через запятую; пусто — без фильтра")
+    parser.add_argument("--keywords-ratio", type=float, default=1.0, help="Доля сообщений с ключевыми словами")
+    parser.add_argument("--delivery", choices=["bot", "copy", "forward"], default="bot")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="POLL_MIN_INTERVAL для прогона")
+    parser.add_argument("--timeout", type=float, default=300, help="Предел ожидания, секунды")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="Куда записать результат в JSON; '-' — в stdout")
+    return parser
+
+async def run(args) -> Dict:
+    from loguru import logger
+    from telethon import utils
+    from telethon.tl.types import PeerChannel
+    import parser.parser as pipeline
+    from database.models import TargetChat
+    from parser.delivery import DeliveryMode
+    from parser.stats import ParserStats
+    from parser.supervisor import supervise_parser
+    from benchmarks.fakes import FakeChat, FakeTelegramClient, FakeBot, Latency, Faults, MediaProfile
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    media = MediaProfile(
+        photo_ratio=args.photo_ratio, video_ratio=args.video_ratio, document_ratio=args.document_ratio,
+        photo_size=args.photo_size, video_size=args.video_size, document_size=args.document_size
+    )
+    chats = {}
+    for index in range(args.chats):
+        chat_id = utils.get_peer_id(PeerChannel(1000 + index))
+        chats[chat_id] = FakeChat(chat_id, random.Random(args.seed * 1000 + index), media, args.keywords_ratio, username=f"bench_{index}")
+    faults = Faults(error_rate=args.error_rate, flood_rate=args.flood_rate, flood_seconds=args.flood_seconds)
+    client = FakeTelegramClient(chats, seed=args.seed, rpc_latency=Latency(args.rpc_latency), download_bandwidth=args.download_bandwidth, faults=faults)
+    bot = FakeBot(seed=args.seed, latency=Latency(args.bot_latency), upload_bandwidth=args.upload_bandwidth, faults=faults)
+
+    # Разогрев: по одному сообщению в чате, чтобы парсеры запомнили последнее сообщение
+    for chat in chats.values():
+        chat.publish()
+    expected = args.chats * args.messages
+    sink = ArchiveSink(chats, args.chats)
+    pipeline.archive_writer = sink
+    keywords = [keyword.strip() for keyword in args.keywords.split(",") if keyword.strip()]
+
+    tasks = []
+    for chat in chats.values():
+        # ID чата получаем так же, как start_real_time_parsing, а не берём готовый помеченный
+        chat_id = await pipeline.resolve_chat_id(client, chat.username)
+        target_chat = TargetChat(id=0, chat_id=chat_id, title=chat.username)
+        stats = ParserStats(account_id=1, chat=target_chat.title, chat_id=chat_id)
+        run_parser = lambda target_chat=target_chat, stats=stats: pipeline.real_time_parsing_task(
+            client, 1, target_chat, bot, -100999, keywords, bool(keywords), stats=stats, delivery_mode=DeliveryMode(args.delivery)
+        )
+        tasks.append(asyncio.create_task(supervise_parser(run_parser, stats, base_delay=0.1, max_delay=2)))
+
+    # Без известного последнего сообщения парсер читает только первую страницу истории
+    await asyncio.wait_for(sink.done.wait(), timeout=args.timeout)
+    sink.reset(expected)
+    started = time.monotonic()
+    producers = asyncio.gather(*(chat.produce(args.messages, args.rate) for chat in chats.values()))
+    try:
+        await asyncio.wait_for(sink.done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    finished = sink.finished_at or time.monotonic()
+    for task in tasks:
+        task.cancel()
+    producers.cancel()
+    await asyncio.gather(*tasks, producers, return_exceptions=True)
+
+    duration = finished - started
+    terminal = sum(sink.statuses.values())
+    return {
+        "config": vars(args),
+        "messages": expected,
+        "statuses": dict(sink.statuses),
+        "lost": expected - terminal,
+        "duration_seconds": round(duration, 3),
+        "messages_per_second": round(terminal / duration, 2) if duration > 0 else 0,
+        "forward_latency_seconds": {
+            "p50": round(percentile(sink.latencies, 50), 4),
+            "p90": round(percentile(sink.latencies, 90), 4),
+            "p99": round(percentile(sink.latencies, 99), 4),
+            "max": round(max(sink.latencies, default=0), 4),
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "telethon_rpc": dict(client.calls),
+        "bot_api_calls": dict(bot.calls),
+        "downloaded_mb": round(client.downloaded_bytes / 1024 / 1024, 2),
+        "uploaded_mb": round(bot.uploaded_bytes / 1024 / 1024, 2),
+    }
+
+def format_report(result: Dict) -> str:
+    latency = result["forward_latency_seconds"]
+    lines = [
+        f"Сообщений: {result['messages']}, статусы: {result['statuses']}, потеряно: {result['lost']}",
+        f"Время: {result['duration_seconds']} с, {result['messages_per_second']} сообщ./с",
+        f"Задержка пересылки: p50 {latency['p50']} с, p90 {latency['p90']} с, p99 {latency['p99']} с, max {latency['max']} с",
+        f"Пиковый RSS: {result['peak_rss_mb']} МБ",
+        f"RPC Telethon: {result['telethon_rpc']}",
+        f"Вызовы Bot API: {result['bot_api_calls']}",
+        f"Скачано: {result['downloaded_mb']} МБ, загружено ботом: {result['uploaded_mb']} МБ",
+    ]
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    prepare_environment(POLL_MIN_INTERVAL=str(args.poll_interval))
+    result = asyncio.run(run(args))
+    print(format_report(result), file=sys.stderr)
+    if args.json == "-":
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Прогон режима вебхука против локальной заглушки Bot API.
+
+Поднимает server.create_app на тестовом сервере aiohttp, а бота направляет
+на FakeBotAPI так же, как TELEGRAM_API_URL в bot/main.py. Проверяет, что
+create_app не запускается без WEBHOOK_SECRET, что /healthz отвечает, что
+запросы без секрета или с неверным секретом получают 401 и не доходят до
+Dispatcher, а обновление с верным секретом подтверждается сразу и
+обрабатывается в фоне. Затем подаёт пачку обновлений параллельно и меряет
+задержку ответа вебхука и время до ответа бота в заглушке. При непройденной
+проверке код выхода 1.
+
+    python -m benchmarks.webhook --updates 500 --concurrency 100 --handler-delay 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from typing import Dict, List
+from benchmarks import prepare_environment
+from benchmarks.pipeline import percentile, peak_rss_mb
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+ADMIN = {"id": 1, "is_bot": False, "first_name": "Admin"}
+
+class FakeBotAPI:
+    """Локальная заглушка Bot API: принимает методы по адресу /bot<токен>/<метод>.
+
+    Запоминает вызовы sendMessage и отвечает на них сообщением, на остальные
+    методы — True.
+    """
+
+    def __init__(self):
+        self.calls: List[Dict] = []
+        self.received = asyncio.Condition()
+        self._message_ids = itertools.count(1)
+
+    def app(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request):
+        from aiohttp import web
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        result = True
+        if method.lower() == "sendmessage":
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        async with self.received:
+            self.calls.append({"method": method, "data": data, "at": time.monotonic()})
+            self.received.notify_all()
+        return web.json_response({"ok": True, "result": result})
+
+    async def wait_for(self, count: int, timeout: float) -> bool:
+        """Ждёт, пока заглушка получит count вызовов; False по таймауту."""
+        async with self.received:
+            try:
+                await asyncio.wait_for(self.received.wait_for(lambda: len(self.calls) >= count), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+def make_update(update_id: int, text: str) -> Dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": ADMIN["id"], "type": "private"},
+            "from": ADMIN,
+            "text": text,
+        },
+    }
+
+def build_dispatcher(handler_delay: float, handled: Dict[str, int]):
+    """Dispatcher с одним медленным обработчиком: ждёт handler_delay и отвечает тем же текстом."""
+    from aiogram import Dispatcher, Router, types
+
+    router = Router()
+
+    @router.message()
+    async def echo(message: types.Message):
+        handled["started"] += 1
+        await asyncio.sleep(handler_delay)
+        await message.bot.send_message(message.chat.id, f"echo {message.text}")
+        handled["finished"] += 1
+
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    @dp.startup()
+    async def on_startup():
+        handled["startup"] += 1
+
+    return dp
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Прогон режима вебхука против заглушки Bot API")
+    parser.add_argument("--updates", type=int, default=200, help="Обновлений в нагрузочной части")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов к вебхуку")
+    parser.add_argument("--handler-delay", type=float, default=0.2, help="Время работы обработчика, секунды")
+    parser.add_argument("--secret", default="benchmark-secret")
+    parser.add_argument("--timeout", type=float, default=60, help="Предел ожидания ответов бота, секунды")
+    parser.add_argument("--json", help="Куда записать результат в JSON; '-' — в stdout")
+    return parser
+
+async def run(args) -> Dict:
+    from aiohttp.test_utils import TestClient, TestServer
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from bot.config import BOT_TOKEN, WEBHOOK_PATH
+    import server
+
+    checks: Dict[str, bool] = {}
+    handled = {"startup": 0, "started": 0, "finished": 0}
+    api = FakeBotAPI()
+    api_client = TestClient(TestServer(api.app()))
+    await api_client.start_server()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(str(api_client.make_url("")).rstrip("/")))
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = build_dispatcher(args.handler_delay, handled)
+
+    # Без секрета приложение не должно создаваться
+    saved_secret, server.WEBHOOK_SECRET = server.WEBHOOK_SECRET, ""
+    try:
+        server.create_app(dp, bot)
+        checks["refuses_without_secret"] = False
+    except RuntimeError:
+        checks["refuses_without_secret"] = True
+    finally:
+        server.WEBHOOK_SECRET = saved_secret
+
+    client = TestClient(TestServer(server.create_app(dp, bot)))
+    await client.start_server()
+    update_ids = itertools.count(1)
+    result: Dict = {}
+    try:
+        checks["startup_ran"] = handled["startup"] == 1
+
+        response = await client.get("/healthz")
+        checks["healthz"] = response.status == 200 and (await response.json()) == {"status": "ok"}
+
+        response = await client.post(WEBHOOK_PATH, json=make_update(next(update_ids), "без секрета"))
+        checks["missing_secret_401"] = response.status == 401
+        response = await client.post(WEBHOOK_PATH, json=make_update(next(update_ids), "чужой секрет"), headers={SECRET_HEADER: args.secret + "x"})
+        checks["wrong_secret_401"] = response.status == 401
+        await asyncio.sleep(args.handler_delay)
+        checks["rejected_not_dispatched"] = handled["started"] == 0 and not api.calls
+
+        # Верный секрет: ответ приходит раньше, чем обработчик закончит работу
+        started = time.monotonic()
+        response = await client.post(WEBHOOK_PATH, json=make_update(next(update_ids), "проверка"), headers={SECRET_HEADER: args.secret})
+        acknowledged = time.monotonic() - started
+        checks["valid_secret_200"] = response.status == 200
+        checks["handled_in_background"] = acknowledged < args.handler_delay and handled["finished"] == 0
+        delivered = await api.wait_for(1, args.timeout)
+        checks["reply_reached_bot_api"] = delivered and api.calls[0]["data"].get("text") == "echo проверка"
+
+        # Нагрузка: обработчики должны идти параллельно, а не по одному
+        api.calls.clear()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies: List[float] = []
+        statuses: Dict[int, int] = {}
+
+        async def post(update_id: int):
+            async with semaphore:
+                began = time.monotonic()
+                response = await client.post(WEBHOOK_PATH, json=make_update(update_id, f"сообщение {update_id}"), headers={SECRET_HEADER: args.secret})
+                latencies.append(time.monotonic() - began)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(post(next(update_ids)) for _ in range(args.updates)))
+        delivered = await api.wait_for(args.updates, args.timeout)
+        duration = time.monotonic() - started
+        checks["load_all_delivered"] = delivered and statuses == {200: args.updates}
+        # При последовательной обработке ушло бы updates * handler_delay
+        checks["load_concurrent"] = duration < args.updates * args.handler_delay / 2 if args.handler_delay else True
+        result = {
+            "updates": args.updates,
+            "concurrency": args.concurrency,
+            "handler_delay_seconds": args.handler_delay,
+            "duration_seconds": round(duration, 3),
+            "updates_per_second": round(args.updates / duration, 2) if duration else 0,
+            "ack_latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "max": round(max(latencies, default=0) * 1000, 2),
+            },
+            "statuses": statuses,
+        }
+    finally:
+        await client.close()
+        await bot.session.close()
+        await api_client.close()
+    result["checks"] = checks
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+def format_report(result: Dict) -> str:
+    lines = [f"{'✅' if passed else '❌'} {name}" for name, passed in result["checks"].items()]
+    if "duration_seconds" in result:
+        latency = result["ack_latency_ms"]
+        lines.append(
+            f"Обновлений: {result['updates']} за {result['duration_seconds']} с ({result['updates_per_second']} в секунду), "
+            f"ответ вебхука p50 {latency['p50']} мс, p99 {latency['p99']} мс, макс {latency['max']} мс"
+        )
+    lines.append(f"Пиковый RSS: {result['peak_rss_mb']} МБ")
+    return "\n".join(lines)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Секрет читается из конфига при импорте server, поэтому окружение готовим заранее
+    prepare_environment(BOT_MODE="webhook", WEBHOOK_SECRET=args.secret)
+    result = asyncio.run(run(args))
+    print(format_report(result), file=sys.stderr)
+    if args.json == "-":
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if not all(result["checks"].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import inspect
+import logging
+from typing import Awaitable, Callable, Dict, FrozenSet, NamedTuple, Optional, Type
+from aiogram import types
+from aiogram.filters.callback_data import CallbackData
+from database.db import get_db
+
+logger = logging.getLogger(__name__)
+
+# Фабрики callback_data для кнопок с параметрами.
+# Префиксы совпадают с прежним форматом "действие:ID", поэтому старые кнопки продолжают работать.
+class SearchPageCallback(CallbackData, prefix="search_page"):
+    page: int
+
+class StatusPageCallback(CallbackData, prefix="status_page"):
+    page: int
+
+class EditKeywordListCallback(CallbackData, prefix="edit_keyword_list"):
+    id: int
+
+class DeleteKeywordListCallback(CallbackData, prefix="delete_keyword_list"):
+    id: int
+
+class ToggleKeywordListCallback(CallbackData, prefix="toggle_keyword_list"):
+    id: int
+
+class DeleteAccountCallback(CallbackData, prefix="delete"):
+    id: int
+
+class CheckAccountCallback(CallbackData, prefix="check"):
+    id: int
+
+class DeleteProxyCallback(CallbackData, prefix="delete_proxy"):
+    id: int
+
+class BindProxyAccountCallback(CallbackData, prefix="bind_proxy_account"):
+    id: int
+
+class BindProxyCallback(CallbackData, prefix="bind_proxy_to_account"):
+    account_id: int
+    proxy_id: int
+
+class DeleteTargetChatCallback(CallbackData, prefix="delete_target"):
+    id: int
+
+class ParseAccountCallback(CallbackData, prefix="parse_account"):
+    id: int
+
+class ToggleChatCallback(CallbackData, prefix="toggle_chat"):
+    account_id: int
+    chat_id: int
+
+class ConfirmChatsCallback(CallbackData, prefix="confirm_chats"):
+    id: int
+
+class DeliveryModeCallback(CallbackData, prefix="delivery_mode"):
+    mode: str
+
+class _Route(NamedTuple):
+    handler: Callable[..., Awaitable]
+    factory: Optional[Type[CallbackData]]
+    params: FrozenSet[str]
+
+class CallbackDispatcher:
+    """Маршрутизация нажатий на кнопки по таблицам вместо цепочки проверок.
+
+    Точные значения callback_data ищутся в словаре целиком, параметризованные —
+    по префиксу до первого разделителя и разбираются фабрикой CallbackData.
+    Обработчик получает только те аргументы, которые объявил, а сессия БД
+    открывается лишь для обработчиков с параметром db.
+    """
+
+    def __init__(self, separator: str = ":"):
+        self.separator = separator
+        self._exact: Dict[str, _Route] = {}
+        self._prefixed: Dict[str, _Route] = {}
+
+    @staticmethod
+    def _route(handler, factory=None) -> _Route:
+        return _Route(handler, factory, frozenset(inspect.signature(handler).parameters))
+
+    def _register(self, table: Dict[str, _Route], key: str, route: _Route):
+        if key in table:
+            raise ValueError(f"Обработчик для callback_data '{key}' уже зарегистрирован")
+        table[key] = route
+
+    def exact(self, *values: str):
+        """Обработчик для кнопок с фиксированным callback_data."""
+        def decorator(handler):
+            for value in values:
+                self._register(self._exact, value, self._route(handler))
+            return handler
+        return decorator
+
+    def data(self, factory: Type[CallbackData]):
+        """Обработчик для кнопок фабрики; разобранные данные передаются в callback_data."""
+        def decorator(handler):
+            self._register(self._prefixed, factory.__prefix__, self._route(handler, factory))
+            return handler
+        return decorator
+
+    def prefix(self, prefix: str):
+        """Обработчик для произвольного хвоста после префикса; хвост передаётся в payload."""
+        def decorator(handler):
+            self._register(self._prefixed, prefix, self._route(handler))
+            return handler
+        return decorator
+
+    async def dispatch(self, callback: types.CallbackQuery, **context) -> bool:
+        """Вызывает обработчик для callback_data; False, если обработчик не найден."""
+        data = callback.data or ""
+        route = self._exact.get(data)
+        if route is None:
+            prefix, _, payload = data.partition(self.separator)
+            route = self._prefixed.get(prefix)
+            if route is None:
+                return False
+            if route.factory:
+                try:
+                    context["callback_data"] = route.factory.unpack(data)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"Некорректные callback_data '{data}': {e}")
+                    return False
+            else:
+                context["payload"] = payload
+
+        kwargs = {name: value for name, value in context.items() if name in route.params}
+        if "db" in route.params:
+            async with get_db() as db:
+                await route.handler(callback, db=db, **kwargs)
+        else:
+            await route.handler(callback, **kwargs)
+        return True
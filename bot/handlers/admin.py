@@ -1,20 +1,34 @@
-import logging
 import os
+import time
 import asyncio
+from typing import List, Type
 from aiogram import Router, types, Bot
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database.db import get_db
-from parser.client import create_client, authorize_client, complete_authorization
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from bot.callbacks import (
+    CallbackDispatcher, SearchPageCallback, StatusPageCallback, EditKeywordListCallback, DeleteKeywordListCallback, ToggleKeywordListCallback,
+    DeleteAccountCallback, CheckAccountCallback, DeleteProxyCallback, BindProxyAccountCallback, BindProxyCallback,
+    DeleteTargetChatCallback, ParseAccountCallback, ToggleChatCallback, ConfirmChatsCallback, DeliveryModeCallback
+)
+from database.db import get_db, dialect_insert
+from database.archive import search_archive
+from parser.client import client_manager, pending_authorizations, authorize_client, complete_authorization, check_account, check_accounts
+from parser.sessions import session_store
 from parser.parser import start_real_time_parsing, stop_parsing, active_parsers
+from parser.stats import ParserStats, parser_stats
+from parser.delivery import DeliveryMode, DELIVERY_MODE_TITLES, parse_delivery_mode
+from parser.filters import MediaRules, MEDIA_RULES_HELP, parse_media_rules
 from sqlalchemy import select, text
-from database.models import Account, Proxy, TargetChat, Settings, KeywordFilter, KeywordList
+from database.models import Account, Proxy, TargetChat, Settings, KeywordFilter, KeywordList, ForwardDestination, MediaRule
+from proxy.manager import proxy_manager
+from monitoring.profiling import profiler
 from loguru import logger
 
 router = Router()
-logger = logging.getLogger(__name__)
+callbacks = CallbackDispatcher()
 
 # Определение состояний для FSM
 class AddAccountForm(StatesGroup):
@@ -44,40 +58,40 @@ class EditKeywordListForm(StatesGroup):
     keywords = State()
 
 # Кнопки для выбора аккаунта или прокси
-def get_account_keyboard(accounts, action: str):
+def get_account_keyboard(accounts, factory: Type[CallbackData]):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     for account in accounts:
         if isinstance(account, dict) and "id" in account:
             text = f"ID: {account['id']}"
-            if action.startswith("delete"):
+            if factory.__prefix__.startswith("delete"):
                 text = f"ID: {account['id']} [Удалить]"
         else:
             text = f"ID: {account.id}"
-            if action.startswith("delete"):
+            if factory.__prefix__.startswith("delete"):
                 text = f"ID: {account.id} [Удалить]"
         button = InlineKeyboardButton(
             text=text,
-            callback_data=f"{action}:{account.id}"
+            callback_data=factory(id=account.id).pack()
         )
         keyboard.inline_keyboard.append([button])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
     return keyboard
 
 # Кнопки для выбора целевых чатов
-def get_target_chat_keyboard(chats, action: str):
+def get_target_chat_keyboard(chats, factory: Type[CallbackData]):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     for chat in chats:
         if isinstance(chat, dict) and "id" in chat:
             text = f"{chat.get('title', chat.get('chat_id'))} (ID: {chat['id']})"
-            if action.startswith("delete"):
+            if factory.__prefix__.startswith("delete"):
                 text = f"{chat.get('title', chat.get('chat_id'))} (ID: {chat['id']}) [Удалить]"
         else:
             text = f"{chat.title or chat.chat_id} (ID: {chat.id})"
-            if action.startswith("delete"):
+            if factory.__prefix__.startswith("delete"):
                 text = f"{chat.title or chat.chat_id} (ID: {chat.id}) [Удалить]"
         button = InlineKeyboardButton(
             text=text,
-            callback_data=f"{action}:{chat.id}"
+            callback_data=factory(id=chat.id).pack()
         )
         keyboard.inline_keyboard.append([button])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
@@ -98,24 +112,22 @@ def get_active_parsers_keyboard():
     return keyboard
 
 # Кнопки для выбора списка ключевых слов
-async def get_keyword_list_keyboard(lists, action: str):
+async def get_keyword_list_keyboard(lists, factory: Type[CallbackData]):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     for keyword_list in lists:
-        # Явно получаем значение enabled через запрос
-        async with get_db() as db:
-            result = await db.execute(select(KeywordList.enabled).where(KeywordList.id == keyword_list.id))
-            enabled = result.scalar() or False
+        # Списки только что выбраны из базы, enabled уже загружен — отдельная сессия на каждую кнопку не нужна
+        enabled = keyword_list.enabled or False
         status_icon = "🟢" if enabled else "🔴"
         text = f"{status_icon} {keyword_list.name} (ID: {keyword_list.id})"
-        if action.startswith("delete"):
+        if factory is DeleteKeywordListCallback:
             text = f"{status_icon} {keyword_list.name} (ID: {keyword_list.id}) [Удалить]"
-        elif action.startswith("toggle"):
+        elif factory is ToggleKeywordListCallback:
             text = f"{status_icon} {keyword_list.name} (ID: {keyword_list.id}) [{'Вкл' if enabled else 'Выкл'}]"
-        elif action.startswith("edit"):
+        elif factory is EditKeywordListCallback:
             text = f"{status_icon} {keyword_list.name} (ID: {keyword_list.id}) [Редактировать]"
         button = InlineKeyboardButton(
             text=text,
-            callback_data=f"{action}:{keyword_list.id}"
+            callback_data=factory(id=keyword_list.id).pack()
         )
         keyboard.inline_keyboard.append([button])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_keyword_menu")])
@@ -128,21 +140,46 @@ def get_accounts_menu():
         [InlineKeyboardButton(text="📋 Список аккаунтов", callback_data="list_accounts")],
         [InlineKeyboardButton(text="❌ Удалить аккаунт", callback_data="delete_account")],
         [InlineKeyboardButton(text="✅ Проверить аккаунт", callback_data="check_account")],
+        [InlineKeyboardButton(text="🩺 Проверить все аккаунты", callback_data="check_all_accounts")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
     ])
     return keyboard
 
+# Строка результата проверки аккаунта
+def format_account_check(report: dict) -> str:
+    line = f"ID: {report['account_id']} ({report['phone_number']}) — "
+    if report["flood_wait"]:
+        line = "⏳ " + line + f"FloodWait {report['flood_wait']} с"
+    elif report["error"]:
+        line = "⚠️ " + line + f"ошибка: {report['error']}"
+    elif report["authorized"]:
+        line = "✅ " + line + f"авторизован, {report['latency'] * 1000:.0f} мс"
+    else:
+        line = "❌ " + line + "не авторизован"
+    proxy_info = f"прокси ID {report['proxy_id']}" if report["proxy_id"] else "без прокси"
+    return f"{line}, {proxy_info}"
+
 # Подменю управления прокси
 def get_proxy_menu():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🌐 Добавить прокси", callback_data="add_proxy")],
         [InlineKeyboardButton(text="📋 Список прокси", callback_data="list_proxies")],
+        [InlineKeyboardButton(text="🩺 Проверить прокси", callback_data="check_proxies")],
         [InlineKeyboardButton(text="❌ Удалить прокси", callback_data="delete_proxy")],
         [InlineKeyboardButton(text="🔗 Привязать прокси к аккаунту", callback_data="bind_proxy")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
     ])
     return keyboard
 
+# Состояние прокси по последней проверке
+def format_proxy_health(proxy_id: int) -> str:
+    stats = proxy_manager.stats.get(proxy_id)
+    if not stats or stats.alive is None:
+        return "⚪ не проверялся"
+    if not stats.alive:
+        return f"🔴 не работает ({stats.last_error})"
+    return f"🟢 {stats.latency * 1000:.0f} мс"
+
 # Подменю управления чатами
 def get_chat_menu():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -150,6 +187,7 @@ def get_chat_menu():
         [InlineKeyboardButton(text="📋 Список целевых чатов", callback_data="list_target_chats")],
         [InlineKeyboardButton(text="❌ Удалить целевой чат", callback_data="delete_target_chat")],
         [InlineKeyboardButton(text="📥 Установить чат для пересылки", callback_data="set_forward_chat")],
+        [InlineKeyboardButton(text="🚚 Способ доставки", callback_data="delivery_mode")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
     ])
     return keyboard
@@ -169,18 +207,15 @@ def get_keyword_list_menu():
 # Подменю управления парсингом
 def get_parsing_menu():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-    # Показываем статус активных парсингов
-    active_status = []
-    if active_parsers:
-        for account_id in active_parsers.keys():
-            for target_chat_id in active_parsers[account_id].keys():
-                active_status.append(f"Аккаунт ID: {account_id}, Чат: {target_chat_id}")
-        if active_status:
-            keyboard.inline_keyboard.append([InlineKeyboardButton(text=f"🟢 Активные парсинги: {', '.join(active_status)}", callback_data="noop")])
-        else:
-            keyboard.inline_keyboard.append([InlineKeyboardButton(text="🔴 Нет активных парсингов", callback_data="noop")])
+    # Показываем число работающих и упавших парсеров; подробности — в /status
+    tasks = [task for chats in active_parsers.values() for task in chats.values()]
+    if tasks:
+        dead = sum(1 for task in tasks if task.done())
+        status_text = f"🟢 Активные парсинги: {len(tasks) - dead}" + (f", 🔴 упали: {dead}" if dead else "")
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text=status_text, callback_data=StatusPageCallback(page=0).pack())])
     else:
         keyboard.inline_keyboard.append([InlineKeyboardButton(text="🔴 Нет активных парсингов", callback_data="noop")])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="📊 Статус парсеров", callback_data=StatusPageCallback(page=0).pack())])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="▶️ Запустить парсинг", callback_data="start_parsing")])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="⏹️ Остановить парсинг", callback_data="stop_parsing")])
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="📋 Управление списками слов", callback_data="keyword_list_menu")])
@@ -188,6 +223,132 @@ def get_parsing_menu():
     keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
     return keyboard
 
+# Количество результатов поиска на странице
+SEARCH_PAGE_SIZE = 10
+
+# Текст страницы результатов поиска по архиву
+def format_search_results(messages, query: str, page: int):
+    if not messages:
+        return f"По запросу «{query}» ничего не найдено." if page == 0 else "Больше результатов нет."
+    status_icons = {"forwarded": "✅", "filtered": "🚫", "duplicate": "🔁", "failed": "❌"}
+    response = f"🔎 Результаты по запросу «{query}» (страница {page + 1}):\n\n"
+    for archived in messages:
+        snippet = (archived.text or "").replace("\n", " ")
+        if len(snippet) > 150:
+            snippet = snippet[:150] + "…"
+        chat_id = str(archived.chat_id)
+        link = f"https://t.me/c/{chat_id[4:]}/{archived.message_id}" if chat_id.startswith("-100") else f"ID сообщения: {archived.message_id}"
+        date = archived.date.strftime("%Y-%m-%d %H:%M") if archived.date else "—"
+        response += f"{status_icons.get(archived.forward_status, '•')} {date} | {archived.chat_title or chat_id}\n{snippet}\n{link}\n\n"
+    return response
+
+# Кнопки листания результатов поиска
+def get_search_keyboard(page: int, has_next: bool):
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=SearchPageCallback(page=page - 1).pack()))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=SearchPageCallback(page=page + 1).pack()))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[navigation] if navigation else [])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main")])
+    return keyboard
+
+# Количество парсеров на странице /status
+STATUS_PAGE_SIZE = 5
+
+# Предел длины текста сообщения Telegram в единицах UTF-16
+MESSAGE_LIMIT = 4096
+
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+# Разбивает длинный отчёт на части не длиннее limit, по возможности по границам строк
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        candidate = f"{current}\n{line}" if current else line
+        if utf16_length(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        # Строка длиннее предела режется по символам
+        while utf16_length(line) > limit:
+            end = limit // 2
+            while end < len(line) and utf16_length(line[:end + 1]) <= limit:
+                end += 1
+            chunks.append(line[:end])
+            line = line[end:]
+        current = line
+    if current or not chunks:
+        chunks.append(current)
+    return chunks
+
+# Показывает отчёт на месте сообщения с кнопками; продолжение приходит отдельными сообщениями, клавиатура — у последнего
+async def edit_long_text(message: types.Message, text: str, reply_markup=None):
+    chunks = split_text(text)
+    if len(chunks) == 1:
+        await message.edit_text(text, reply_markup=reply_markup)
+        return
+    await message.edit_text(chunks[0])
+    for chunk in chunks[1:-1]:
+        await message.answer(chunk)
+    await message.answer(chunks[-1], reply_markup=reply_markup)
+
+# Описание одного парсера для /status
+def format_parser_stats(stats: ParserStats) -> str:
+    if not stats.alive:
+        icon = "🔴"
+    elif stats.retry_in:
+        icon = "🔁"
+    else:
+        icon = "⏳" if stats.flood_wait_left else "🟢"
+    lines = [f"{icon} Аккаунт ID {stats.account_id} · {stats.chat}"]
+    if stats.last_message_id is not None:
+        lag = f"{stats.lag_messages} сообщ." if stats.lag_messages is not None else "—"
+        if stats.lag_seconds is not None:
+            lag += f" / {stats.lag_seconds:.0f} с"
+        lines.append(f"   последнее: #{stats.last_message_id}, отставание: {lag}")
+    else:
+        lines.append("   сообщений ещё не было")
+    lines.append(f"   скорость: {stats.messages_per_minute():.1f} сообщ./мин, переслано {stats.forwarded} из {stats.processed}")
+    if stats.flood_wait_left:
+        lines.append(f"   FloodWait: ещё {stats.flood_wait_left:.0f} с")
+    if stats.retry_in:
+        lines.append(f"   перезапуск через {stats.retry_in:.0f} с (перезапусков: {stats.restarts})")
+    elif stats.restarts:
+        lines.append(f"   перезапусков: {stats.restarts}")
+    if stats.last_error:
+        ago = time.monotonic() - stats.last_error_at
+        lines.append(f"   ⚠️ {ago:.0f} с назад: {stats.last_error[:200]}")
+    return "\n".join(lines)
+
+# Страница /status и кнопки листания
+def get_status_page(page: int):
+    entries = sorted(parser_stats.values(), key=lambda stats: (stats.alive, stats.account_id, stats.chat))
+    pages = max(1, (len(entries) + STATUS_PAGE_SIZE - 1) // STATUS_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    if not entries:
+        text = "Нет запущенных парсеров."
+    else:
+        dead = sum(1 for stats in entries if not stats.alive)
+        text = f"📊 Парсеры: {len(entries)}, работают: {len(entries) - dead}, упали: {dead} (страница {page + 1}/{pages})\n\n"
+        chunk = entries[page * STATUS_PAGE_SIZE:(page + 1) * STATUS_PAGE_SIZE]
+        text += "\n\n".join(format_parser_stats(stats) for stats in chunk)
+    # Время обновления меняет текст, иначе повторное «Обновить» даёт ошибку «message is not modified»
+    text += f"\n\nОбновлено: {time.strftime('%H:%M:%S')}"
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=StatusPageCallback(page=page - 1).pack()))
+    navigation.append(InlineKeyboardButton(text="🔄 Обновить", callback_data=StatusPageCallback(page=page).pack()))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=StatusPageCallback(page=page + 1).pack()))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        navigation,
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_parsing")]
+    ])
+    return text, keyboard
+
 # Главное меню
 def get_main_keyboard():
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -207,814 +368,954 @@ async def cmd_start(message: types.Message):
         logger.info("Команда /start получена")
         await message.answer("Добро пожаловать! Выберите категорию:", reply_markup=get_main_keyboard())
 
-# Обработчик нажатий на кнопки
-@router.callback_query()
-async def process_callback(callback: types.CallbackQuery, state: FSMContext, bot: Bot = None):
+# Поиск по архиву обработанных сообщений: /search <запрос>
+@router.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("Использование: /search <запрос>\nНапример: /search продам квартиру")
+        return
     async with get_db() as db:
-        data = callback.data
-        current_text = callback.message.text or ""
-        current_markup = callback.message.reply_markup
-
-        logger.info(f"Обрабатываем callback_data: {data} (начало обработки)")
-
-        # Возврат к главному меню
-        if data == "back_to_main":
-            new_text = "Добро пожаловать! Выберите категорию:"
-            new_markup = get_main_keyboard()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.clear()
-            await callback.answer()
-            return
-
-        # Открытие подменю управления аккаунтами
-        if data == "menu_accounts":
-            new_text = "Управление аккаунтами:"
-            new_markup = get_accounts_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
-
-        # Открытие подменю управления прокси
-        if data == "menu_proxy":
-            new_text = "Управление прокси:"
-            new_markup = get_proxy_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
-
-        # Открытие подменю управления чатами
-        if data == "menu_chats":
-            new_text = "Управление чатами:"
-            new_markup = get_chat_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
-
-        # Открытие подменю управления парсингом
-        if data == "menu_parsing":
-            new_text = "Управление парсингом:"
-            new_markup = get_parsing_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
-
-        # Открытие подменю управления списками ключевых слов
-        if data == "keyword_list_menu":
-            new_text = "Управление списками ключевых слов:"
-            new_markup = get_keyword_list_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
-
-        # Возврат к меню парсинга из меню ключевых слов
-        if data == "back_to_keyword_menu":
-            new_text = "Управление парсингом:"
-            new_markup = get_parsing_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.clear()
-            await callback.answer()
+        messages, has_next = await search_archive(db, query, limit=SEARCH_PAGE_SIZE)
+    await state.update_data({"search_query": query})
+    await message.answer(
+        format_search_results(messages, query, 0),
+        reply_markup=get_search_keyboard(0, has_next),
+        disable_web_page_preview=True
+    )
+
+# Состояние парсеров: /status
+@router.message(Command("status"))
+async def cmd_status(message: types.Message):
+    text, keyboard = get_status_page(0)
+    await message.answer(text, reply_markup=keyboard)
+
+# Листание и обновление /status
+@callbacks.data(StatusPageCallback)
+async def on_status_page(callback: types.CallbackQuery, callback_data: StatusPageCallback):
+    text, keyboard = get_status_page(callback_data.page)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+# Правила чата пересылки по метаданным медиа
+async def get_media_rules(db, forward_chat_id: str) -> MediaRules:
+    result = await db.execute(select(MediaRule).where(MediaRule.chat_id == forward_chat_id))
+    return MediaRules.from_row(result.scalars().first())
+
+# Правила медиа для чата пересылки: /media_rules [параметры | reset]
+@router.message(Command("media_rules"))
+async def cmd_media_rules(message: types.Message, command: CommandObject):
+    args = (command.args or "").strip()
+    async with get_db() as db:
+        result = await db.execute(select(Settings))
+        settings = result.scalars().first()
+        if not settings or not settings.forward_chat_id:
+            await message.answer("Сначала установите чат для пересылки.")
             return
-
-        # Добавление списка ключевых слов
-        if data == "add_keyword_list":
-            new_text = "Введите название списка ключевых слов:"
-            new_markup = get_keyword_list_menu()
-            # Проверяем, отличается ли новое сообщение от текущего
-            if callback.message.text != new_text or callback.message.reply_markup != new_markup:
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.set_state(AddKeywordListForm.name)
-            await callback.answer()
+        if not args:
+            rules = await get_media_rules(db, settings.forward_chat_id)
+            await message.answer(f"Правила для чата {settings.forward_chat_id}:\n{rules.describe()}\n\n{MEDIA_RULES_HELP}")
             return
-
-        # Список списков ключевых слов
-        if data == "list_keyword_lists":
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList))
-                keyword_lists = result.scalars().all()
-                if not keyword_lists:
-                    new_text = "Список списков ключевых слов пуст."
-                    new_markup = get_keyword_list_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    response = "Списки ключевых слов:\n"
-                    for keyword_list in keyword_lists:
-                        # Явно получаем enabled через запрос
-                        result = await db.execute(select(KeywordList.enabled).where(KeywordList.id == keyword_list.id))
-                        enabled = result.scalar() or False
-                        result = await db.execute(select(KeywordFilter).where(KeywordFilter.keyword_list_id == keyword_list.id))
-                        keywords = result.scalars().all()
-                        keyword_str = ", ".join([kw.keyword for kw in keywords]) if keywords else "Пусто"
-                        response += f"🟢 ID: {keyword_list.id}, Название: {keyword_list.name}, Статус: {'Вкл' if enabled else 'Выкл'}, Слова: {keyword_str}\n"
-                    new_text = response
-                    new_markup = get_keyword_list_menu()
-                    # Проверяем, изменился ли текст или разметка
-                    if callback.message.text != new_text or callback.message.reply_markup != new_markup:
-                        await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Редактирование списка ключевых слов
-        if data == "edit_keyword_list":
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList))
-                keyword_lists = result.scalars().all()
-                if not keyword_lists:
-                    new_text = "Список списков ключевых слов пуст."
-                    new_markup = get_keyword_list_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = await get_keyword_list_keyboard(keyword_lists, "edit_keyword_list")
-                    new_text = "Выберите список для редактирования:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Удаление списка ключевых слов
-        if data == "delete_keyword_list":
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList))
-                keyword_lists = result.scalars().all()
-                if not keyword_lists:
-                    new_text = "Список списков ключевых слов пуст."
-                    new_markup = get_keyword_list_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = await get_keyword_list_keyboard(keyword_lists, "delete_keyword_list")
-                    new_text = "Выберите список для удаления:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Включение/выключение списка ключевых слов
-        if data == "toggle_keyword_list":
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList))
-                keyword_lists = result.scalars().all()
-                if not keyword_lists:
-                    new_text = "Список списков ключевых слов пуст."
-                    new_markup = get_keyword_list_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = await get_keyword_list_keyboard(keyword_lists, "toggle_keyword_list")
-                    new_text = "Выберите список для включения/выключения:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Обработка редактирования списка
-        if data.startswith("edit_keyword_list:"):
-            list_id = int(data.split(":")[1])
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
-                keyword_list = result.scalars().first()
-                if not keyword_list:
-                    new_text = "Список не найден."
-                    new_markup = get_keyword_list_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-                await state.update_data({"list_id": list_id})
-                new_text = f"Текущее название: {keyword_list.name}\nВведите новое название списка (или оставьте пустым для сохранения текущего):"
-                new_markup = get_keyword_list_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await state.set_state(EditKeywordListForm.name)
-                await callback.answer()
-                return
-
-        # Обработка удаления списка
-        if data.startswith("delete_keyword_list:"):
-            list_id = int(data.split(":")[1])
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
-                keyword_list = result.scalars().first()
-                if keyword_list:
-                    # Удаляем все ключевые слова, связанные с этим списком
-                    await db.execute(text("DELETE FROM keyword_filters WHERE keyword_list_id = :list_id"), {"list_id": list_id})
-                    await db.delete(keyword_list)
-                    await db.commit()
-                    new_text = f"Список с ID {list_id} удалён."
-                else:
-                    new_text = "Список не найден."
-                new_markup = get_keyword_list_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Обработка включения/выключения списка
-        if data.startswith("toggle_keyword_list:"):
-            list_id = int(data.split(":")[1])
-            async with get_db() as db:
-                result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
-                keyword_list = result.scalars().first()
-                if keyword_list:
-                    # Явно получаем значение enabled и name
-                    enabled_result = await db.execute(select(KeywordList.enabled).where(KeywordList.id == list_id))
-                    current_enabled = enabled_result.scalar() or False
-                    name_result = await db.execute(select(KeywordList.name).where(KeywordList.id == list_id))
-                    name = name_result.scalar() or "Unnamed"
-                    # Обновляем значение через SQL-запрос
-                    await db.execute(
-                        text("UPDATE keyword_lists SET enabled = :value WHERE id = :id"),
-                        {"value": not current_enabled, "id": list_id}
-                    )
-                    await db.commit()
-                    new_text = f"Список '{name}' {'включён' if not current_enabled else 'выключен'}."
-                else:
-                    new_text = "Список не найден."
-                new_markup = get_keyword_list_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Добавление аккаунта
-        if data == "add_account":
-            new_text = "Введите номер телефона (например, +1234567890):"
-            new_markup = get_accounts_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.set_state(AddAccountForm.phone_number)
-            await callback.answer()
+        try:
+            rules = MediaRules() if args.lower() == "reset" else parse_media_rules(args)
+        except ValueError as e:
+            await message.answer(f"❌ {e}\n\n{MEDIA_RULES_HELP}")
             return
-
-        # Список аккаунтов
-        if data == "list_accounts":
-            async with get_db() as db:
-                result = await db.execute(select(Account))
-                accounts = result.scalars().all()
-                if not accounts:
-                    new_text = "Список аккаунтов пуст."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    response = "Список аккаунтов:\n"
-                    for account in accounts:
-                        proxy_info = "Без прокси" if not account.proxy_id else f"Привязан прокси (ID: {account.proxy_id})"
-                        response += f"ID: {account.id}, {proxy_info}\n"
-                    new_text = response
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Удаление аккаунта
-        if data == "delete_account":
-            async with get_db() as db:
-                result = await db.execute(select(Account))
-                accounts = result.scalars().all()
-                if not accounts:
-                    new_text = "Список аккаунтов пуст."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = get_account_keyboard(accounts, "delete")
-                    new_text = "Выберите аккаунт для удаления:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Удаление аккаунта по ID
-        if data.startswith("delete:"):
-            async with get_db() as db:
-                account_id = int(data.split(":")[1])
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                if account:
-                    session_file = f"sessions/{account.phone_number}"
-                    if os.path.exists(session_file):
-                        os.remove(session_file)
-                        logger.info(f"Файл сессии для аккаунта ID {account_id} удалён")
-                    await db.delete(account)
-                    await db.commit()
-                    new_text = f"Аккаунт с ID {account_id} удалён."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    new_text = "Аккаунт не найден."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Проверка аккаунта
-        if data == "check_account":
-            async with get_db() as db:
-                result = await db.execute(select(Account))
-                accounts = result.scalars().all()
-                if not accounts:
-                    new_text = "Список аккаунтов пуст."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = get_account_keyboard(accounts, "check")
-                    new_text = "Выберите аккаунт для проверки:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        if data.startswith("check:"):
-            async with get_db() as db:
-                account_id = int(data.split(":")[1])
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                if account:
-                    logger.info(f"Начало проверки аккаунта ID {account_id}")
-                    client = await create_client(account, db)
-                    try:
-                        logger.info(f"Попытка подключения для аккаунта ID {account_id}")
-                        await asyncio.wait_for(client.connect(), timeout=20)
-                        logger.info(f"Подключение успешно для аккаунта ID {account_id}")
-                        is_authorized = await client.is_user_authorized()
-                        logger.info(f"Результат проверки авторизации: {is_authorized}")
-                        if is_authorized:
-                            new_text = f"✅ Аккаунт (ID: {account_id}) авторизован."
-                        else:
-                            new_text = f"❌ Аккаунт (ID: {account_id}) не авторизован."
-                        new_markup = get_accounts_menu()
-                        await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    except asyncio.TimeoutError:
-                        logger.error(f"Тайм-аут при подключении для аккаунта ID {account_id}")
-                        new_text = f"⏰ Тайм-аут при проверке аккаунта (ID: {account_id}). Проверьте подключение."
-                        new_markup = get_accounts_menu()
-                        await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    except Exception as e:
-                        logger.error(f"Ошибка при проверке аккаунта ID {account_id}: {e}")
-                        new_text = f"❌ Ошибка при проверке аккаунта (ID: {account_id}): {str(e)}"
-                        new_markup = get_accounts_menu()
-                        await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    finally:
-                        logger.info(f"Закрытие соединения для аккаунта ID {account_id}")
-                        await client.disconnect()
-                else:
-                    new_text = "Аккаунт не найден."
-                    new_markup = get_accounts_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Добавление прокси
-        if data == "add_proxy":
-            new_text = "Введите данные прокси в формате:\nайпи порт пользователь пароль\nПример: geo.iproyal.com 32325 oeUMpx50aOQ3DvpU l2DS1ucvbAabA974_country-ru"
-            new_markup = get_proxy_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.set_state(AddProxyForm.proxy_data)
-            await callback.answer()
+        # После commit атрибуты settings истекают, а сессия закрывается — запоминаем ID заранее
+        forward_chat_id = settings.forward_chat_id
+        columns = rules.to_columns()
+        statement = dialect_insert(MediaRule.__table__).values(chat_id=forward_chat_id, **columns)
+        statement = statement.on_conflict_do_update(index_elements=["chat_id"], set_=columns)
+        await db.execute(statement)
+        await db.commit()
+    await message.answer(f"✅ Правила для чата {forward_chat_id} сохранены:\n{rules.describe()}\nПрименяются к парсингам, запущенным после изменения.")
+
+PROFILE_HELP = "/profile on — включить, /profile dump — прислать стеки для flamegraph, /profile off — выключить"
+
+# Профилирование цикла asyncio: /profile [on | off | dump]
+@router.message(Command("profile"))
+async def cmd_profile(message: types.Message, command: CommandObject):
+    action = (command.args or "").strip().lower()
+    if action == "on":
+        profiler.start()
+        await message.answer(f"▶️ {profiler.summary()}\n\n{PROFILE_HELP}")
+    elif action in ("dump", "off"):
+        if not profiler.enabled:
+            await message.answer(f"Профилирование выключено.\n\n{PROFILE_HELP}")
             return
-
-        # Список прокси
-        if data == "list_proxies":
-            async with get_db() as db:
-                result = await db.execute(select(Proxy))
-                proxies = result.scalars().all()
-                if not proxies:
-                    new_text = "Список прокси пуст."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    response = "Список прокси:\n"
-                    for proxy in proxies:
-                        response += f"ID: {proxy.id}, Тип: {proxy.type}\n"
-                    new_text = response
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Удаление прокси
-        if data == "delete_proxy":
-            async with get_db() as db:
-                result = await db.execute(select(Proxy))
-                proxies = result.scalars().all()
-                if not proxies:
-                    new_text = "Список прокси пуст."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = get_account_keyboard(proxies, "delete_proxy")
-                    new_text = "Выберите прокси для удаления:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Удаление прокси по ID
-        if data.startswith("delete_proxy:"):
-            async with get_db() as db:
-                proxy_id = int(data.split(":")[1])
-                result = await db.execute(select(Proxy).where(Proxy.id == proxy_id))
-                proxy = result.scalars().first()
-                if proxy:
-                    await db.delete(proxy)
-                    await db.commit()
-                    new_text = f"Прокси с ID {proxy_id} удалён."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    new_text = "Прокси не найден."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Привязка прокси к аккаунту — выбор аккаунта
-        if data == "bind_proxy":
-            async with get_db() as db:
-                result = await db.execute(select(Account))
-                accounts = result.scalars().all()
-                if not accounts:
-                    new_text = "Список аккаунтов пуст. Сначала добавьте аккаунт."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-                    for account in accounts:
-                        button = InlineKeyboardButton(
-                            text=f"ID: {account.id}",
-                            callback_data=f"bind_proxy_account:{account.id}"
-                        )
-                        keyboard.inline_keyboard.append([button])
-                    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
-                    new_text = "Выберите аккаунт для привязки прокси:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Выбор прокси для привязки
-        if data.startswith("bind_proxy_account:"):
-            async with get_db() as db:
-                account_id = int(data.split(":")[1])
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                if not account:
-                    new_text = "Аккаунт не найден."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                result = await db.execute(select(Proxy))
-                proxies = result.scalars().all()
-                if not proxies:
-                    new_text = "Список прокси пуст. Сначала добавьте прокси."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-                for proxy in proxies:
-                    button = InlineKeyboardButton(
-                        text=f"ID: {proxy.id}, Хост: {proxy.host}, Порт: {proxy.port}",
-                        callback_data=f"bind_proxy_to_account:{account_id}:{proxy.id}"
-                    )
-                    keyboard.inline_keyboard.append([button])
-                keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
-                new_text = f"Выберите прокси для аккаунта ID {account_id}:"
-                await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await state.update_data({"account_id": account_id})
-                await callback.answer()
-                return
-
-        # Привязка прокси к аккаунту
-        if data.startswith("bind_proxy_to_account:"):
-            async with get_db() as db:
-                parts = data.split(":")
-                account_id = int(parts[1])
-                proxy_id = int(parts[2])
-
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                result = await db.execute(select(Proxy).where(Proxy.id == proxy_id))
-                proxy = result.scalars().first()
-
-                if not account or not proxy:
-                    new_text = "Аккаунт или прокси не найдены."
-                    new_markup = get_proxy_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                # Явно получаем proxy.id до commit
-                proxy_id_value = proxy.id
-                account.proxy_id = proxy_id
-                await db.commit()
-                new_text = f"Прокси (ID: {proxy_id_value}) успешно привязан к аккаунту ID {account_id}!"
-                new_markup = get_proxy_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Добавление целевого чата
-        if data == "add_target_chat":
-            new_text = "Введите ID или ссылку на целевой чат/канал:"
-            new_markup = get_chat_menu()
+        summary = profiler.summary()
+        path = await asyncio.to_thread(profiler.dump)
+        if action == "off":
+            await profiler.stop()
+        await message.answer_document(FSInputFile(path), caption=summary[:1024])
+    else:
+        await message.answer(f"{profiler.summary()}\n\n{PROFILE_HELP}")
+
+# Возврат к главному меню
+@callbacks.exact("back_to_main")
+async def on_back_to_main(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Добро пожаловать! Выберите категорию:"
+    new_markup = get_main_keyboard()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.clear()
+    await callback.answer()
+
+# Листание результатов поиска
+@callbacks.data(SearchPageCallback)
+async def on_search_page(callback: types.CallbackQuery, callback_data: SearchPageCallback, state: FSMContext, db):
+    page = callback_data.page
+    data_state = await state.get_data()
+    query = data_state.get("search_query")
+    if not query:
+        await callback.answer("Запрос устарел, повторите /search", show_alert=True)
+        return
+    messages, has_next = await search_archive(db, query, limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE)
+    await callback.message.edit_text(
+        format_search_results(messages, query, page),
+        reply_markup=get_search_keyboard(page, has_next),
+        disable_web_page_preview=True
+    )
+    await callback.answer()
+
+# Открытие подменю управления аккаунтами
+@callbacks.exact("menu_accounts")
+async def on_menu_accounts(callback: types.CallbackQuery):
+    new_text = "Управление аккаунтами:"
+    new_markup = get_accounts_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Открытие подменю управления прокси
+@callbacks.exact("menu_proxy")
+async def on_menu_proxy(callback: types.CallbackQuery):
+    new_text = "Управление прокси:"
+    new_markup = get_proxy_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Открытие подменю управления чатами
+@callbacks.exact("menu_chats")
+async def on_menu_chats(callback: types.CallbackQuery):
+    new_text = "Управление чатами:"
+    new_markup = get_chat_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Открытие подменю управления парсингом
+@callbacks.exact("menu_parsing")
+async def on_menu_parsing(callback: types.CallbackQuery):
+    new_text = "Управление парсингом:"
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Открытие подменю управления списками ключевых слов
+@callbacks.exact("keyword_list_menu")
+async def on_keyword_list_menu(callback: types.CallbackQuery):
+    new_text = "Управление списками ключевых слов:"
+    new_markup = get_keyword_list_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Возврат к меню парсинга из меню ключевых слов
+@callbacks.exact("back_to_keyword_menu")
+async def on_back_to_keyword_menu(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Управление парсингом:"
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.clear()
+    await callback.answer()
+
+# Добавление списка ключевых слов
+@callbacks.exact("add_keyword_list")
+async def on_add_keyword_list(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Введите название списка ключевых слов:"
+    new_markup = get_keyword_list_menu()
+    # Проверяем, отличается ли новое сообщение от текущего
+    if callback.message.text != new_text or callback.message.reply_markup != new_markup:
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(AddKeywordListForm.name)
+    await callback.answer()
+
+# Список списков ключевых слов
+@callbacks.exact("list_keyword_lists")
+async def on_list_keyword_lists(callback: types.CallbackQuery, db):
+    result = await db.execute(select(KeywordList))
+    keyword_lists = result.scalars().all()
+    if not keyword_lists:
+        new_text = "Список списков ключевых слов пуст."
+        new_markup = get_keyword_list_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        response = "Списки ключевых слов:\n"
+        for keyword_list in keyword_lists:
+            # Явно получаем enabled через запрос
+            result = await db.execute(select(KeywordList.enabled).where(KeywordList.id == keyword_list.id))
+            enabled = result.scalar() or False
+            result = await db.execute(select(KeywordFilter).where(KeywordFilter.keyword_list_id == keyword_list.id))
+            keywords = result.scalars().all()
+            keyword_str = ", ".join([kw.keyword for kw in keywords]) if keywords else "Пусто"
+            response += f"🟢 ID: {keyword_list.id}, Название: {keyword_list.name}, Статус: {'Вкл' if enabled else 'Выкл'}, Слова: {keyword_str}\n"
+        new_text = response
+        new_markup = get_keyword_list_menu()
+        # Проверяем, изменился ли текст или разметка
+        if callback.message.text != new_text or callback.message.reply_markup != new_markup:
             await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.set_state(AddTargetChatForm.chat_id)
-            await callback.answer()
-            return
+    await callback.answer()
+
+# Редактирование списка ключевых слов
+@callbacks.exact("edit_keyword_list")
+async def on_edit_keyword_list(callback: types.CallbackQuery, db):
+    result = await db.execute(select(KeywordList))
+    keyword_lists = result.scalars().all()
+    if not keyword_lists:
+        new_text = "Список списков ключевых слов пуст."
+        new_markup = get_keyword_list_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = await get_keyword_list_keyboard(keyword_lists, EditKeywordListCallback)
+        new_text = "Выберите список для редактирования:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Удаление списка ключевых слов
+@callbacks.exact("delete_keyword_list")
+async def on_delete_keyword_list(callback: types.CallbackQuery, db):
+    result = await db.execute(select(KeywordList))
+    keyword_lists = result.scalars().all()
+    if not keyword_lists:
+        new_text = "Список списков ключевых слов пуст."
+        new_markup = get_keyword_list_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = await get_keyword_list_keyboard(keyword_lists, DeleteKeywordListCallback)
+        new_text = "Выберите список для удаления:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Включение/выключение списка ключевых слов
+@callbacks.exact("toggle_keyword_list")
+async def on_toggle_keyword_list(callback: types.CallbackQuery, db):
+    result = await db.execute(select(KeywordList))
+    keyword_lists = result.scalars().all()
+    if not keyword_lists:
+        new_text = "Список списков ключевых слов пуст."
+        new_markup = get_keyword_list_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = await get_keyword_list_keyboard(keyword_lists, ToggleKeywordListCallback)
+        new_text = "Выберите список для включения/выключения:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Обработка редактирования списка
+@callbacks.data(EditKeywordListCallback)
+async def on_edit_keyword_list_selected(callback: types.CallbackQuery, callback_data: EditKeywordListCallback, state: FSMContext, db):
+    list_id = callback_data.id
+    result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
+    keyword_list = result.scalars().first()
+    if not keyword_list:
+        new_text = "Список не найден."
+        new_markup = get_keyword_list_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+    await state.update_data({"list_id": list_id})
+    new_text = f"Текущее название: {keyword_list.name}\nВведите новое название списка (или оставьте пустым для сохранения текущего):"
+    new_markup = get_keyword_list_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(EditKeywordListForm.name)
+    await callback.answer()
+
+# Обработка удаления списка
+@callbacks.data(DeleteKeywordListCallback)
+async def on_delete_keyword_list_selected(callback: types.CallbackQuery, callback_data: DeleteKeywordListCallback, db):
+    list_id = callback_data.id
+    result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
+    keyword_list = result.scalars().first()
+    if keyword_list:
+        # Удаляем все ключевые слова, связанные с этим списком
+        await db.execute(text("DELETE FROM keyword_filters WHERE keyword_list_id = :list_id"), {"list_id": list_id})
+        await db.delete(keyword_list)
+        await db.commit()
+        new_text = f"Список с ID {list_id} удалён."
+    else:
+        new_text = "Список не найден."
+    new_markup = get_keyword_list_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Обработка включения/выключения списка
+@callbacks.data(ToggleKeywordListCallback)
+async def on_toggle_keyword_list_selected(callback: types.CallbackQuery, callback_data: ToggleKeywordListCallback, db):
+    list_id = callback_data.id
+    result = await db.execute(select(KeywordList).where(KeywordList.id == list_id))
+    keyword_list = result.scalars().first()
+    if keyword_list:
+        # Явно получаем значение enabled и name
+        enabled_result = await db.execute(select(KeywordList.enabled).where(KeywordList.id == list_id))
+        current_enabled = enabled_result.scalar() or False
+        name_result = await db.execute(select(KeywordList.name).where(KeywordList.id == list_id))
+        name = name_result.scalar() or "Unnamed"
+        # Обновляем значение через SQL-запрос
+        await db.execute(
+            text("UPDATE keyword_lists SET enabled = :value WHERE id = :id"),
+            {"value": not current_enabled, "id": list_id}
+        )
+        await db.commit()
+        new_text = f"Список '{name}' {'включён' if not current_enabled else 'выключен'}."
+    else:
+        new_text = "Список не найден."
+    new_markup = get_keyword_list_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Добавление аккаунта
+@callbacks.exact("add_account")
+async def on_add_account(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Введите номер телефона (например, +1234567890):"
+    new_markup = get_accounts_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(AddAccountForm.phone_number)
+    await callback.answer()
+
+# Список аккаунтов
+@callbacks.exact("list_accounts")
+async def on_list_accounts(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    if not accounts:
+        new_text = "Список аккаунтов пуст."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        response = "Список аккаунтов:\n"
+        for account in accounts:
+            proxy_info = "Без прокси" if not account.proxy_id else f"Привязан прокси (ID: {account.proxy_id})"
+            response += f"ID: {account.id}, {proxy_info}\n"
+        new_text = response
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Удаление аккаунта
+@callbacks.exact("delete_account")
+async def on_delete_account(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    if not accounts:
+        new_text = "Список аккаунтов пуст."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = get_account_keyboard(accounts, DeleteAccountCallback)
+        new_text = "Выберите аккаунт для удаления:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Удаление аккаунта по ID
+@callbacks.data(DeleteAccountCallback)
+async def on_delete_account_selected(callback: types.CallbackQuery, callback_data: DeleteAccountCallback, db):
+    account_id = callback_data.id
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    if account:
+        pending_authorizations.finish(account_id)
+        await client_manager.close(account_id)
+        await session_store.delete(account.phone_number)
+        session_file = f"sessions/{account.phone_number}.session"
+        if os.path.exists(session_file):
+            os.remove(session_file)
+            logger.info(f"Файл сессии для аккаунта ID {account_id} удалён")
+        await db.delete(account)
+        await db.commit()
+        new_text = f"Аккаунт с ID {account_id} удалён."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        new_text = "Аккаунт не найден."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Проверка аккаунта
+@callbacks.exact("check_account")
+async def on_check_account(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    if not accounts:
+        new_text = "Список аккаунтов пуст."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = get_account_keyboard(accounts, CheckAccountCallback)
+        new_text = "Выберите аккаунт для проверки:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+@callbacks.data(CheckAccountCallback)
+async def on_check_account_selected(callback: types.CallbackQuery, callback_data: CheckAccountCallback, db):
+    account_id = callback_data.id
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    if account:
+        logger.info(f"Начало проверки аккаунта ID {account_id}")
+        report = await check_account(account)
+        logger.info(f"Результат проверки аккаунта ID {account_id}: {report}")
+        new_text = format_account_check(report)
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        new_text = "Аккаунт не найден."
+        new_markup = get_accounts_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Одновременная проверка всех аккаунтов
+@callbacks.exact("check_all_accounts")
+async def on_check_all_accounts(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    if not accounts:
+        await callback.message.edit_text("Список аккаунтов пуст.", reply_markup=get_accounts_menu())
+        await callback.answer()
+        return
+    await callback.answer("Проверка аккаунтов запущена...")
+    started = time.perf_counter()
+    reports = await check_accounts(accounts)
+    authorized = sum(1 for report in reports if report["authorized"])
+    new_text = f"Проверено аккаунтов: {len(reports)} за {time.perf_counter() - started:.1f} с, авторизовано: {authorized}\n\n"
+    new_text += "\n".join(format_account_check(report) for report in reports)
+    await edit_long_text(callback.message, new_text, reply_markup=get_accounts_menu())
+
+# Добавление прокси
+@callbacks.exact("add_proxy")
+async def on_add_proxy(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Введите данные прокси в формате:\nайпи порт пользователь пароль\nили пользователь:пароль@айпи:порт (IPv6 — в квадратных скобках)\nМожно несколько прокси, по одному на строку.\nПример: geo.iproyal.com 32325 oeUMpx50aOQ3DvpU l2DS1ucvbAabA974_country-ru"
+    new_markup = get_proxy_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(AddProxyForm.proxy_data)
+    await callback.answer()
+
+# Список прокси
+@callbacks.exact("list_proxies")
+async def on_list_proxies(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Proxy))
+    proxies = result.scalars().all()
+    if not proxies:
+        new_text = "Список прокси пуст."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        response = "Список прокси:\n"
+        for proxy in proxies:
+            response += f"ID: {proxy.id}, Тип: {proxy.type}, {format_proxy_health(proxy.id)}\n"
+        new_text = response
+        new_markup = get_proxy_menu()
+        await edit_long_text(callback.message, new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Проверка всех прокси
+@callbacks.exact("check_proxies")
+async def on_check_proxies(callback: types.CallbackQuery):
+    await callback.answer("Проверка прокси запущена...")
+    await proxy_manager.load_proxies()
+    await proxy_manager.check_all()
+    if not proxy_manager.proxies:
+        new_text = "Список прокси пуст."
+    else:
+        new_text = "Результаты проверки прокси:\n"
+        for proxy_id, proxy in sorted(proxy_manager.proxies.items()):
+            new_text += f"ID: {proxy_id}, {proxy.host}:{proxy.port}, {format_proxy_health(proxy_id)}\n"
+    await edit_long_text(callback.message, new_text, reply_markup=get_proxy_menu())
+
+# Удаление прокси
+@callbacks.exact("delete_proxy")
+async def on_delete_proxy(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Proxy))
+    proxies = result.scalars().all()
+    if not proxies:
+        new_text = "Список прокси пуст."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = get_account_keyboard(proxies, DeleteProxyCallback)
+        new_text = "Выберите прокси для удаления:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Удаление прокси по ID
+@callbacks.data(DeleteProxyCallback)
+async def on_delete_proxy_selected(callback: types.CallbackQuery, callback_data: DeleteProxyCallback, db):
+    proxy_id = callback_data.id
+    result = await db.execute(select(Proxy).where(Proxy.id == proxy_id))
+    proxy = result.scalars().first()
+    if proxy:
+        await db.delete(proxy)
+        await db.commit()
+        proxy_manager.forget(proxy_id)
+        new_text = f"Прокси с ID {proxy_id} удалён."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        new_text = "Прокси не найден."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Привязка прокси к аккаунту — выбор аккаунта
+@callbacks.exact("bind_proxy")
+async def on_bind_proxy(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    if not accounts:
+        new_text = "Список аккаунтов пуст. Сначала добавьте аккаунт."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+        for account in accounts:
+            button = InlineKeyboardButton(
+                text=f"ID: {account.id}",
+                callback_data=BindProxyAccountCallback(id=account.id).pack()
+            )
+            keyboard.inline_keyboard.append([button])
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
+        new_text = "Выберите аккаунт для привязки прокси:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Выбор прокси для привязки
+@callbacks.data(BindProxyAccountCallback)
+async def on_bind_proxy_account_selected(callback: types.CallbackQuery, callback_data: BindProxyAccountCallback, state: FSMContext, db):
+    account_id = callback_data.id
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    if not account:
+        new_text = "Аккаунт не найден."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+
+    result = await db.execute(select(Proxy))
+    proxies = result.scalars().all()
+    if not proxies:
+        new_text = "Список прокси пуст. Сначала добавьте прокси."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
 
-        # Список целевых чатов
-        if data == "list_target_chats":
-            async with get_db() as db:
-                result = await db.execute(select(TargetChat))
-                target_chats = result.scalars().all()
-                if not target_chats:
-                    new_text = "Список целевых чатов пуст."
-                    new_markup = get_chat_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    response = "Список целевых чатов:\n"
-                    for chat in target_chats:
-                        response += f"ID: {chat.id}, Чат: {chat.chat_id}, Название: {chat.title or 'Не указано'}\n"
-                    new_text = response
-                    new_markup = get_chat_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Удаление целевого чата
-        if data == "delete_target_chat":
-            async with get_db() as db:
-                result = await db.execute(select(TargetChat))
-                target_chats = result.scalars().all()
-                if not target_chats:
-                    new_text = "Список целевых чатов пуст."
-                    new_markup = get_chat_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = get_target_chat_keyboard(target_chats, "delete_target")
-                    new_text = "Выберите чат для удаления:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Удаление целевого чата по ID
-        if data.startswith("delete_target:"):
-            async with get_db() as db:
-                chat_id = int(data.split(":")[1])
-                result = await db.execute(select(TargetChat).where(TargetChat.id == chat_id))
-                chat = result.scalars().first()
-                if chat:
-                    await db.delete(chat)
-                    await db.commit()
-                    new_text = f"Чат с ID {chat_id} удалён."
-                    new_markup = get_chat_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    new_text = "Чат не найден."
-                    new_markup = get_chat_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Установка чата для пересылки
-        if data == "set_forward_chat":
-            new_text = "Введите ID чата, куда будут пересылаться сообщения (бот должен быть администратором):"
-            new_markup = get_chat_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await state.set_state(SetForwardChatForm.chat_id)
-            await callback.answer()
-            return
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    for proxy in proxies:
+        button = InlineKeyboardButton(
+            text=f"ID: {proxy.id}, Хост: {proxy.host}, Порт: {proxy.port}",
+            callback_data=BindProxyCallback(account_id=account_id, proxy_id=proxy.id).pack()
+        )
+        keyboard.inline_keyboard.append([button])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
+    new_text = f"Выберите прокси для аккаунта ID {account_id}:"
+    await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await state.update_data({"account_id": account_id})
+    await callback.answer()
+
+# Привязка прокси к аккаунту
+@callbacks.data(BindProxyCallback)
+async def on_bind_proxy_selected(callback: types.CallbackQuery, callback_data: BindProxyCallback, db):
+    account_id = callback_data.account_id
+    proxy_id = callback_data.proxy_id
+
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    result = await db.execute(select(Proxy).where(Proxy.id == proxy_id))
+    proxy = result.scalars().first()
+
+    if not account or not proxy:
+        new_text = "Аккаунт или прокси не найдены."
+        new_markup = get_proxy_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+
+    # Явно получаем proxy.id до commit
+    proxy_id_value = proxy.id
+    account.proxy_id = proxy_id
+    await db.commit()
+    new_text = f"Прокси (ID: {proxy_id_value}) успешно привязан к аккаунту ID {account_id}!"
+    new_markup = get_proxy_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Добавление целевого чата
+@callbacks.exact("add_target_chat")
+async def on_add_target_chat(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Введите ID или ссылку на целевой чат/канал:"
+    new_markup = get_chat_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(AddTargetChatForm.chat_id)
+    await callback.answer()
+
+# Список целевых чатов
+@callbacks.exact("list_target_chats")
+async def on_list_target_chats(callback: types.CallbackQuery, db):
+    result = await db.execute(select(TargetChat))
+    target_chats = result.scalars().all()
+    if not target_chats:
+        new_text = "Список целевых чатов пуст."
+        new_markup = get_chat_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        response = "Список целевых чатов:\n"
+        for chat in target_chats:
+            response += f"ID: {chat.id}, Чат: {chat.chat_id}, Название: {chat.title or 'Не указано'}\n"
+        new_text = response
+        new_markup = get_chat_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Удаление целевого чата
+@callbacks.exact("delete_target_chat")
+async def on_delete_target_chat(callback: types.CallbackQuery, db):
+    result = await db.execute(select(TargetChat))
+    target_chats = result.scalars().all()
+    if not target_chats:
+        new_text = "Список целевых чатов пуст."
+        new_markup = get_chat_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = get_target_chat_keyboard(target_chats, DeleteTargetChatCallback)
+        new_text = "Выберите чат для удаления:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Удаление целевого чата по ID
+@callbacks.data(DeleteTargetChatCallback)
+async def on_delete_target_chat_selected(callback: types.CallbackQuery, callback_data: DeleteTargetChatCallback, db):
+    chat_id = callback_data.id
+    result = await db.execute(select(TargetChat).where(TargetChat.id == chat_id))
+    chat = result.scalars().first()
+    if chat:
+        await db.delete(chat)
+        await db.commit()
+        new_text = f"Чат с ID {chat_id} удалён."
+        new_markup = get_chat_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        new_text = "Чат не найден."
+        new_markup = get_chat_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Установка чата для пересылки
+@callbacks.exact("set_forward_chat")
+async def on_set_forward_chat(callback: types.CallbackQuery, state: FSMContext):
+    new_text = "Введите ID чата, куда будут пересылаться сообщения (бот должен быть администратором):"
+    new_markup = get_chat_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await state.set_state(SetForwardChatForm.chat_id)
+    await callback.answer()
+
+# Способ доставки в чат пересылки
+async def get_delivery_mode(db, forward_chat_id: str) -> DeliveryMode:
+    result = await db.execute(select(ForwardDestination.delivery_mode).where(ForwardDestination.chat_id == forward_chat_id))
+    return parse_delivery_mode(result.scalar())
+
+def get_delivery_mode_keyboard(current: DeliveryMode):
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=("✅ " if mode is current else "") + title, callback_data=DeliveryModeCallback(mode=mode.value).pack())]
+        for mode, title in DELIVERY_MODE_TITLES.items()
+    ])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="menu_chats")])
+    return keyboard
 
-        # Включение/выключение фильтрации по ключевым словам
-        if data == "toggle_filter":
-            async with get_db() as db:
-                result = await db.execute(select(Settings))
-                settings = result.scalars().first()
-                if settings:
-                    # Явно получаем текущее значение filter_enabled
-                    result = await db.execute(select(Settings.filter_enabled).where(Settings.id == settings.id))
-                    current_filter_enabled = result.scalar() or False
-                    # Обновляем значение через SQL-запрос, избегая автозагрузки
-                    await db.execute(
-                        text("UPDATE settings SET filter_enabled = :value WHERE id = :id"),
-                        {"value": not current_filter_enabled, "id": settings.id}
-                    )
-                    await db.commit()
-                    new_text = f"Фильтрация по ключевым словам {'включена' if not current_filter_enabled else 'выключена'}."
-                else:
-                    new_text = "Настройки не найдены. Установите чат для пересылки."
-                new_markup = get_parsing_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Остановка парсинга
-        if data == "stop_parsing":
-            new_text = "Остановка парсинга..."
-            new_markup = get_parsing_menu()
-            await callback.message.edit_text(new_text, reply_markup=new_markup)
-            async with get_db() as db:
-                if active_parsers:
-                    new_text = "Выберите парсинг для остановки:"
-                    keyboard = get_active_parsers_keyboard()
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                else:
-                    new_text = "Нет активных процессов парсинга."
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-            await callback.answer()
-            return
+DELIVERY_MODE_HELP = (
+    "Копия и пересылка аккаунтом не скачивают медиа, но аккаунт должен состоять в чате пересылки "
+    "и иметь право писать в него. Если прав не хватает, сообщения уходят через бота.\n"
+    "Новый способ применяется к парсингам, запущенным после изменения."
+)
+
+@callbacks.exact("delivery_mode")
+async def on_delivery_mode(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Settings))
+    settings = result.scalars().first()
+    if not settings or not settings.forward_chat_id:
+        await callback.message.edit_text("Сначала установите чат для пересылки.", reply_markup=get_chat_menu())
+        await callback.answer()
+        return
+    current = await get_delivery_mode(db, settings.forward_chat_id)
+    new_text = f"Способ доставки в чат {settings.forward_chat_id}: {DELIVERY_MODE_TITLES[current]}\n\n{DELIVERY_MODE_HELP}"
+    await callback.message.edit_text(new_text, reply_markup=get_delivery_mode_keyboard(current))
+    await callback.answer()
+
+@callbacks.data(DeliveryModeCallback)
+async def on_delivery_mode_selected(callback: types.CallbackQuery, callback_data: DeliveryModeCallback, db):
+    result = await db.execute(select(Settings))
+    settings = result.scalars().first()
+    if not settings or not settings.forward_chat_id:
+        await callback.message.edit_text("Сначала установите чат для пересылки.", reply_markup=get_chat_menu())
+        await callback.answer()
+        return
+    mode = parse_delivery_mode(callback_data.mode)
+    # После commit атрибуты settings истекают и без greenlet не перечитываются — запоминаем ID заранее
+    forward_chat_id = settings.forward_chat_id
+    statement = dialect_insert(ForwardDestination.__table__).values(chat_id=forward_chat_id, delivery_mode=mode.value)
+    statement = statement.on_conflict_do_update(index_elements=["chat_id"], set_={"delivery_mode": mode.value})
+    await db.execute(statement)
+    await db.commit()
+    new_text = f"Способ доставки в чат {forward_chat_id}: {DELIVERY_MODE_TITLES[mode]}\n\n{DELIVERY_MODE_HELP}"
+    await callback.message.edit_text(new_text, reply_markup=get_delivery_mode_keyboard(mode))
+    await callback.answer("Способ доставки сохранён")
+
+# Включение/выключение фильтрации по ключевым словам
+@callbacks.exact("toggle_filter")
+async def on_toggle_filter(callback: types.CallbackQuery, db):
+    result = await db.execute(select(Settings))
+    settings = result.scalars().first()
+    if settings:
+        # Явно получаем текущее значение filter_enabled
+        result = await db.execute(select(Settings.filter_enabled).where(Settings.id == settings.id))
+        current_filter_enabled = result.scalar() or False
+        # Обновляем значение через SQL-запрос, избегая автозагрузки
+        await db.execute(
+            text("UPDATE settings SET filter_enabled = :value WHERE id = :id"),
+            {"value": not current_filter_enabled, "id": settings.id}
+        )
+        await db.commit()
+        new_text = f"Фильтрация по ключевым словам {'включена' if not current_filter_enabled else 'выключена'}."
+    else:
+        new_text = "Настройки не найдены. Установите чат для пересылки."
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Остановка парсинга
+@callbacks.exact("stop_parsing")
+async def on_stop_parsing(callback: types.CallbackQuery):
+    new_text = "Остановка парсинга..."
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    if active_parsers:
+        new_text = "Выберите парсинг для остановки:"
+        keyboard = get_active_parsers_keyboard()
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    else:
+        new_text = "Нет активных процессов парсинга."
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Остановка конкретного парсинга
+@callbacks.prefix("stop_parsing")
+async def on_stop_parsing_selected(callback: types.CallbackQuery, payload: str):
+    # Ссылка на чат может сама содержать ":", поэтому разбираем вручную, а не фабрикой
+    account_id, _, target_chat_id = payload.partition(":")
+    account_id = int(account_id)
+    success = await stop_parsing(account_id, target_chat_id)
+    if success:
+        new_text = f"Парсинг для аккаунта ID {account_id} и чата {target_chat_id} остановлен."
+    else:
+        new_text = f"Парсинг для аккаунта ID {account_id} и чата {target_chat_id} не найден."
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer()
+
+# Запуск парсинга
+@callbacks.exact("start_parsing")
+async def on_start_parsing(callback: types.CallbackQuery, db):
+    logger.info("Получение списка аккаунтов для парсинга...")
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
+    logger.info(f"Найдено аккаунтов: {len(accounts)}")
+
+    logger.info("Получение списка целевых чатов...")
+    result = await db.execute(select(TargetChat))
+    target_chats = result.scalars().all()
+    logger.info(f"Найдено целевых чатов: {len(target_chats)}")
+
+    logger.info("Получение настроек...")
+    result = await db.execute(select(Settings))
+    settings = result.scalars().first()
+    logger.info(f"Настройки: {settings.forward_chat_id if settings else 'Не установлены'}")
+
+    if not settings or not settings.forward_chat_id:
+        new_text = "Сначала установите чат для пересылки."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    elif not accounts:
+        new_text = "Список аккаунтов пуст. Сначала добавьте аккаунт."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    elif not target_chats:
+        new_text = "Список целевых чатов пуст. Сначала добавьте чат."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+    else:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+        for account in accounts:
+            button = InlineKeyboardButton(
+                text=f"ID: {account.id}",
+                callback_data=ParseAccountCallback(id=account.id).pack()
+            )
+            keyboard.inline_keyboard.append([button])
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
+        new_text = "Выберите аккаунт для парсинга:"
+        await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Выбор чата для парсинга
+@callbacks.data(ParseAccountCallback)
+async def on_parse_account_selected(callback: types.CallbackQuery, callback_data: ParseAccountCallback, state: FSMContext, db):
+    account_id = callback_data.id
+    logger.info(f"Выбран аккаунт ID: {account_id}")
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    if not account:
+        new_text = "Аккаунт не найден."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+
+    result = await db.execute(select(TargetChat))
+    target_chats = result.scalars().all()
+    logger.info(f"Найдено целевых чатов для парсинга: {len(target_chats)}")
+    if not target_chats:
+        new_text = "Список целевых чатов пуст. Сначала добавьте чат."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+
+    # Храним выбранные чаты в состоянии; выбор только что сброшен, поэтому все чаты не отмечены
+    await state.update_data({"account_id": account_id, "selected_chats": []})
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    for chat in target_chats:
+        callback_data = ToggleChatCallback(account_id=account_id, chat_id=chat.id).pack()
+        button_text = f"⬜ {chat.title or chat.chat_id} (ID: {chat.id})"
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmChatsCallback(id=account_id).pack())])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
+    new_text = f"Выберите чаты для парсинга аккаунтом (ID: {account_id}):"
+    await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Переключение выбора чата
+@callbacks.data(ToggleChatCallback)
+async def on_toggle_chat(callback: types.CallbackQuery, callback_data: ToggleChatCallback, state: FSMContext, db):
+    account_id = callback_data.account_id
+    chat_id = callback_data.chat_id
+    logger.info(f"Переключение выбора чата ID: {chat_id} для аккаунта ID: {account_id}")
+    data_state = await state.get_data()
+    selected_chats = data_state.get("selected_chats", [])
+    if chat_id in selected_chats:
+        selected_chats.remove(chat_id)
+    else:
+        selected_chats.append(chat_id)
+    await state.update_data({"selected_chats": selected_chats})
 
-        # Остановка конкретного парсинга
-        if data.startswith("stop_parsing:"):
-            async with get_db() as db:
-                parts = data.split(":")
-                account_id = int(parts[1])
-                target_chat_id = ":".join(parts[2:])  # Восстанавливаем полный target_chat_id
-                success = await stop_parsing(account_id, target_chat_id)
-                if success:
-                    new_text = f"Парсинг для аккаунта ID {account_id} и чата {target_chat_id} остановлен."
-                else:
-                    new_text = f"Парсинг для аккаунта ID {account_id} и чата {target_chat_id} не найден."
-                new_markup = get_parsing_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer()
-                return
-
-        # Запуск парсинга
-        if data == "start_parsing":
-            async with get_db() as db:
-                logger.info("Получение списка аккаунтов для парсинга...")
-                result = await db.execute(select(Account))
-                accounts = result.scalars().all()
-                logger.info(f"Найдено аккаунтов: {len(accounts)}")
-
-                logger.info("Получение списка целевых чатов...")
-                result = await db.execute(select(TargetChat))
-                target_chats = result.scalars().all()
-                logger.info(f"Найдено целевых чатов: {len(target_chats)}")
-
-                logger.info("Получение настроек...")
-                result = await db.execute(select(Settings))
-                settings = result.scalars().first()
-                logger.info(f"Настройки: {settings.forward_chat_id if settings else 'Не установлены'}")
-
-                if not settings or not settings.forward_chat_id:
-                    new_text = "Сначала установите чат для пересылки."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                elif not accounts:
-                    new_text = "Список аккаунтов пуст. Сначала добавьте аккаунт."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                elif not target_chats:
-                    new_text = "Список целевых чатов пуст. Сначала добавьте чат."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                else:
-                    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-                    for account in accounts:
-                        button = InlineKeyboardButton(
-                            text=f"ID: {account.id}",
-                            callback_data=f"parse_account:{account.id}"
-                        )
-                        keyboard.inline_keyboard.append([button])
-                    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
-                    new_text = "Выберите аккаунт для парсинга:"
-                    await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Выбор чата для парсинга
-        if data.startswith("parse_account:"):
-            async with get_db() as db:
-                account_id = int(data.split(":")[1])
-                logger.info(f"Выбран аккаунт ID: {account_id}")
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                if not account:
-                    new_text = "Аккаунт не найден."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                result = await db.execute(select(TargetChat))
-                target_chats = result.scalars().all()
-                logger.info(f"Найдено целевых чатов для парсинга: {len(target_chats)}")
-                if not target_chats:
-                    new_text = "Список целевых чатов пуст. Сначала добавьте чат."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                # Храним выбранные чаты в состоянии
-                await state.update_data({"account_id": account_id, "selected_chats": []})
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-                for chat in target_chats:
-                    callback_data = f"toggle_chat:{account_id}:{chat.id}"
-                    data_state = await state.get_data()
-                    selected_chats = data_state.get("selected_chats", [])
-                    button_text = f"{'✅' if chat.id in selected_chats else '⬜'} {chat.title or chat.chat_id} (ID: {chat.id})"
-                    keyboard.inline_keyboard.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
-                keyboard.inline_keyboard.append([InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"confirm_chats:{account_id}")])
-                keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
-                new_text = f"Выберите чаты для парсинга аккаунтом (ID: {account_id}):"
-                await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Переключение выбора чата
-        if data.startswith("toggle_chat:"):
-            async with get_db() as db:
-                parts = data.split(":")
-                account_id = int(parts[1])
-                chat_id = int(parts[2])
-                logger.info(f"Переключение выбора чата ID: {chat_id} для аккаунта ID: {account_id}")
-                data_state = await state.get_data()
-                selected_chats = data_state.get("selected_chats", [])
-                if chat_id in selected_chats:
-                    selected_chats.remove(chat_id)
-                else:
-                    selected_chats.append(chat_id)
-                await state.update_data({"selected_chats": selected_chats})
-
-                result = await db.execute(select(TargetChat))
-                target_chats = result.scalars().all()
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-                for chat in target_chats:
-                    callback_data = f"toggle_chat:{account_id}:{chat.id}"
-                    button_text = f"{'✅' if chat.id in selected_chats else '⬜'} {chat.title or chat.chat_id} (ID: {chat.id})"
-                    keyboard.inline_keyboard.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
-                keyboard.inline_keyboard.append([InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"confirm_chats:{account_id}")])
-                keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
-                new_text = f"Выберите чаты для парсинга аккаунтом (ID: {account_id}):"
-                await callback.message.edit_text(new_text, reply_markup=keyboard)
-                await callback.answer()
-                return
-
-        # Подтверждение выбора чатов
-        if data.startswith("confirm_chats:"):
-            async with get_db() as db:
-                account_id = int(data.split(":")[1])
-                logger.info(f"Подтверждение выбора чатов для аккаунта ID: {account_id}")
-                result = await db.execute(select(Account).where(Account.id == account_id))
-                account = result.scalars().first()
-                data_state = await state.get_data()
-                selected_chats = data_state.get("selected_chats", [])
-                logger.info(f"Выбрано чатов: {len(selected_chats)}")
-                result = await db.execute(select(Settings))
-                settings = result.scalars().first()
-                logger.info(f"Настройки для пересылки: {settings.forward_chat_id if settings else 'Не установлены'}")
-
-                if not account or not settings or not settings.forward_chat_id:
-                    new_text = "Аккаунт или настройки не найдены."
-                    new_markup = get_parsing_menu()
-                    await callback.message.edit_text(new_text, reply_markup=new_markup)
-                    await callback.answer()
-                    return
-
-                # Показываем промежуточное сообщение
-                await callback.message.edit_text("⏳ Запуск парсинга... Пожалуйста, подождите.")
-                await callback.answer("Запуск парсинга начат!")
-
-                # Получаем ключевые слова только из активных списков
-                result = await db.execute(
-                    select(KeywordFilter.keyword).join(KeywordList).where(
-                        KeywordList.account_id == account_id,
-                        KeywordList.enabled == True,
-                        KeywordFilter.enabled == True
-                    )
+    result = await db.execute(select(TargetChat))
+    target_chats = result.scalars().all()
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    for chat in target_chats:
+        callback_data = ToggleChatCallback(account_id=account_id, chat_id=chat.id).pack()
+        button_text = f"{'✅' if chat.id in selected_chats else '⬜'} {chat.title or chat.chat_id} (ID: {chat.id})"
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text=button_text, callback_data=callback_data)])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmChatsCallback(id=account_id).pack())])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
+    new_text = f"Выберите чаты для парсинга аккаунтом (ID: {account_id}):"
+    await callback.message.edit_text(new_text, reply_markup=keyboard)
+    await callback.answer()
+
+# Подтверждение выбора чатов
+@callbacks.data(ConfirmChatsCallback)
+async def on_confirm_chats(callback: types.CallbackQuery, callback_data: ConfirmChatsCallback, state: FSMContext, db, bot: Bot):
+    account_id = callback_data.id
+    logger.info(f"Подтверждение выбора чатов для аккаунта ID: {account_id}")
+    result = await db.execute(select(Account).where(Account.id == account_id))
+    account = result.scalars().first()
+    data_state = await state.get_data()
+    selected_chats = data_state.get("selected_chats", [])
+    logger.info(f"Выбрано чатов: {len(selected_chats)}")
+    result = await db.execute(select(Settings))
+    settings = result.scalars().first()
+    logger.info(f"Настройки для пересылки: {settings.forward_chat_id if settings else 'Не установлены'}")
+
+    if not account or not settings or not settings.forward_chat_id:
+        new_text = "Аккаунт или настройки не найдены."
+        new_markup = get_parsing_menu()
+        await callback.message.edit_text(new_text, reply_markup=new_markup)
+        await callback.answer()
+        return
+
+    # Показываем промежуточное сообщение
+    await callback.message.edit_text("⏳ Запуск парсинга... Пожалуйста, подождите.")
+    await callback.answer("Запуск парсинга начат!")
+
+    # Получаем ключевые слова только из активных списков
+    result = await db.execute(
+        select(KeywordFilter.keyword).join(KeywordList).where(
+            KeywordList.account_id == account_id,
+            KeywordList.enabled == True,
+            KeywordFilter.enabled == True
+        )
+    )
+    keywords = [row[0] for row in result.fetchall()]
+    result = await db.execute(select(Settings.filter_enabled).where(Settings.id == settings.id))
+    filter_enabled = result.scalar() or False
+    delivery_mode = await get_delivery_mode(db, settings.forward_chat_id)
+    media_rules = await get_media_rules(db, settings.forward_chat_id)
+
+    success_chats = []
+    failed_chats = []
+    for chat_id in selected_chats:
+        result = await db.execute(select(TargetChat).where(TargetChat.id == chat_id))
+        target_chat = result.scalars().first()
+        if target_chat:
+            try:
+                logger.info(f"Запуск парсинга для чата {target_chat.chat_id} с аккаунтом {account.id}")
+                await start_real_time_parsing(
+                    account,
+                    target_chat.chat_id,
+                    bot=bot,
+                    forward_chat_id=settings.forward_chat_id,
+                    keywords=keywords,
+                    filter_enabled=filter_enabled,
+                    delivery_mode=delivery_mode,
+                    media_rules=media_rules
                 )
-                keywords = [row[0] for row in result.fetchall()]
-                result = await db.execute(select(Settings.filter_enabled).where(Settings.id == settings.id))
-                filter_enabled = result.scalar() or False
-
-                success_chats = []
-                failed_chats = []
-                for chat_id in selected_chats:
-                    result = await db.execute(select(TargetChat).where(TargetChat.id == chat_id))
-                    target_chat = result.scalars().first()
-                    if target_chat:
-                        try:
-                            logger.info(f"Запуск парсинга для чата {target_chat.chat_id} с аккаунтом {account.id}")
-                            await start_real_time_parsing(
-                                account,
-                                target_chat.chat_id,
-                                bot=bot,
-                                forward_chat_id=settings.forward_chat_id,
-                                keywords=keywords,
-                                filter_enabled=filter_enabled
-                            )
-                            success_chats.append(target_chat.chat_id)
-                            logger.info(f"Парсинг для {target_chat.chat_id} успешно запущен")
-                        except Exception as e:
-                            failed_chats.append(f"{target_chat.chat_id}: {str(e)}")
-                            logger.error(f"Ошибка при запуске парсинга для {target_chat.chat_id}: {e}")
-                    else:
-                        failed_chats.append(f"Чат ID {chat_id}: не найден")
-
-                # Формируем сообщение с результатами
-                new_text = "✅ Парсинг успешно запущен!\n"
-                if success_chats:
-                    new_text += "Запущены чаты:\n" + "\n".join([f"✅ {chat}" for chat in success_chats]) + "\n"
-                if failed_chats:
-                    new_text += "Не удалось запустить чаты:\n" + "\n".join([f"❌ {chat}" for chat in failed_chats]) + "\n"
-                new_text += "Перейдите в 'Управление парсингом' для статуса."
-
-                new_markup = get_parsing_menu()
-                await callback.message.edit_text(new_text, reply_markup=new_markup)
-                await callback.answer("Парсинг запущен!")
-                await state.clear()
-                return
+                success_chats.append(target_chat.chat_id)
+                logger.info(f"Парсинг для {target_chat.chat_id} успешно запущен")
+            except Exception as e:
+                failed_chats.append(f"{target_chat.chat_id}: {str(e)}")
+                logger.error(f"Ошибка при запуске парсинга для {target_chat.chat_id}: {e}")
+        else:
+            failed_chats.append(f"Чат ID {chat_id}: не найден")
+
+    # Формируем сообщение с результатами
+    new_text = "✅ Парсинг успешно запущен!\n"
+    if success_chats:
+        new_text += "Запущены чаты:\n" + "\n".join([f"✅ {chat}" for chat in success_chats]) + "\n"
+    if failed_chats:
+        new_text += "Не удалось запустить чаты:\n" + "\n".join([f"❌ {chat}" for chat in failed_chats]) + "\n"
+    new_text += "Перейдите в 'Управление парсингом' для статуса."
+
+    new_markup = get_parsing_menu()
+    await callback.message.edit_text(new_text, reply_markup=new_markup)
+    await callback.answer("Парсинг запущен!")
+    await state.clear()
+
+# Кнопки-надписи без действия
+@callbacks.exact("noop")
+async def on_noop(callback: types.CallbackQuery):
+    await callback.answer()
+
+# Обработчик нажатий на кнопки: поиск обработчика по таблицам CallbackDispatcher
+@router.callback_query()
+async def process_callback(callback: types.CallbackQuery, state: FSMContext, bot: Bot = None):
+    logger.info(f"Обрабатываем callback_data: {callback.data}")
+    if not await callbacks.dispatch(callback, state=state, bot=bot):
+        logger.warning(f"Нет обработчика для callback_data: {callback.data}")
+        await callback.answer()
 
 # Получение ID целевого чата
 @router.message(AddTargetChatForm.chat_id)
@@ -1048,26 +1349,20 @@ async def process_target_chat_title(message: types.Message, state: FSMContext):
         await message.answer(f"Целевой чат добавлен! ID: {target_chat.id}, Чат: {chat_id}", reply_markup=get_chat_menu())
         await state.clear()
 
-# Получение данных прокси
+# Получение данных прокси (по одному прокси на строку)
 @router.message(AddProxyForm.proxy_data)
 async def process_proxy_data(message: types.Message, state: FSMContext):
     async with get_db() as db:
         try:
-            parts = message.text.strip().split()
-            if len(parts) != 4:
-                raise ValueError("Неверный формат. Введите данные в формате: айпи порт пользователь пароль")
-
-            host, port, user, password = parts
-            port = int(port)
-            if port < 0 or port > 65535:
-                raise ValueError("Порт должен быть в диапазоне от 0 до 65535")
-
-            proxy = Proxy(host=host, port=port, user=user, password=password, type="SOCKS5")
-            db.add(proxy)
-            await db.commit()
-            await db.refresh(proxy)
-
-            await message.answer(f"Прокси успешно добавлен! ID: {proxy.id}", reply_markup=get_proxy_menu())
+            added_ids, errors = await proxy_manager.import_proxies(db, message.text or "")
+            if not added_ids:
+                raise ValueError("\n".join(errors) or "Неверный формат. Введите данные в формате: айпи порт пользователь пароль")
+
+            response = f"Прокси успешно добавлен! ID: {added_ids[0]}" if len(added_ids) == 1 else f"Добавлено прокси: {len(added_ids)}"
+            response += "\n" + "\n".join(f"ID: {proxy_id}, {format_proxy_health(proxy_id)}" for proxy_id in added_ids)
+            if errors:
+                response += "\nНе добавлены:\n" + "\n".join(errors)
+            await message.answer(response, reply_markup=get_proxy_menu())
         except ValueError as e:
             await message.answer(f"Ошибка: {str(e)}. Попробуйте снова:", reply_markup=get_proxy_menu())
             await state.set_state(AddProxyForm.proxy_data)
@@ -1132,14 +1427,20 @@ async def process_api_hash(message: types.Message, state: FSMContext):
         await db.commit()
         await db.refresh(account)
 
-        client = await create_client(account, db)
+        # Клиент остаётся в pending_authorizations, в FSM — только ID аккаунта
+        client = await pending_authorizations.client(account)
         result = await authorize_client(client, phone_number, db)
 
         if result["status"] == "code_required":
-            await state.update_data({"client": client, "phone_code_hash": result["phone_code_hash"]})
+            await state.update_data({"account_id": account.id, "phone_code_hash": result["phone_code_hash"]})
             await message.answer("Введите код авторизации, отправленный в Telegram:", reply_markup=get_accounts_menu())
             await state.set_state(AddAccountForm.code)
+        elif result["status"] == "authorized":
+            pending_authorizations.finish(account.id)
+            await message.answer("Аккаунт успешно добавлен и авторизован!", reply_markup=get_accounts_menu())
+            await state.clear()
         else:
+            pending_authorizations.finish(account.id)
             await message.answer(f"Ошибка: {result.get('message', 'Неизвестная ошибка')}", reply_markup=get_accounts_menu())
             await state.clear()
 
@@ -1149,20 +1450,26 @@ async def process_code(message: types.Message, state: FSMContext):
     async with get_db() as db:
         code = message.text.strip()
         data = await state.get_data()
-        client = data.get("client")
         phone_number = data.get("phone_number")
         phone_code_hash = data.get("phone_code_hash")
+        account = await db.get(Account, data.get("account_id"))
+        if not account:
+            await message.answer("Аккаунт не найден. Начните добавление заново.", reply_markup=get_accounts_menu())
+            await state.clear()
+            return
 
+        client = await pending_authorizations.client(account)
         result = await complete_authorization(client, phone_number, code, phone_code_hash)
         logger.info(f"Result from complete_authorization: {result}")
         if result["status"] == "authorized":
+            pending_authorizations.finish(account.id)
             await message.answer("Аккаунт успешно добавлен и авторизован!", reply_markup=get_accounts_menu())
             await state.clear()
         elif result["status"] == "password_required":
-            await state.update_data({"client": client, "phone_code_hash": phone_code_hash})
             await message.answer("Требуется пароль 2FA. Введите пароль:", reply_markup=get_accounts_menu())
             await state.set_state(AddAccountForm.password)
         else:
+            pending_authorizations.finish(account.id)
             await message.answer(f"Ошибка: {result.get('message', 'Неизвестная ошибка')}", reply_markup=get_accounts_menu())
             await state.clear()
 
@@ -1172,12 +1479,18 @@ async def process_password(message: types.Message, state: FSMContext):
     async with get_db() as db:
         password = message.text.strip()
         data = await state.get_data()
-        client = data.get("client")
         phone_number = data.get("phone_number")
         phone_code_hash = data.get("phone_code_hash")
+        account = await db.get(Account, data.get("account_id"))
+        if not account:
+            await message.answer("Аккаунт не найден. Начните добавление заново.", reply_markup=get_accounts_menu())
+            await state.clear()
+            return
 
+        client = await pending_authorizations.client(account)
         result = await complete_authorization(client, phone_number, code=None, phone_code_hash=phone_code_hash, password=password)
         if result["status"] == "authorized":
+            pending_authorizations.finish(account.id)
             await message.answer("Аккаунт успешно авторизован с 2FA!", reply_markup=get_accounts_menu())
             await state.clear()
         else:
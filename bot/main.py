@@ -1,23 +1,38 @@
 import asyncio
 import logging
+from monitoring.logs import setup_logging, flush_logs
+
+# Настройка логирования — до импорта остальных модулей, чтобы и их записи при импорте
+# шли через общую очередь с контекстом и ограничением частоты
+setup_logging()
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from bot.config import BOT_TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.config import BOT_TOKEN, BOT_MODE, TELEGRAM_API_URL, METRICS_PORT, PROFILE_ENABLED
+from bot.storage import create_storage
 from bot.handlers.admin import router as admin_router
 from database.db import init_db
+from database.archive import archive_writer
+from proxy.manager import proxy_manager
+from parser.client import client_manager
+from parser.sessions import session_store
 from parser.parser import active_parsers, stop_parsing
+from monitoring.metrics import track_queue
+from monitoring.profiling import profiler
+from server import run_webhook, start_metrics_server
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN, request_timeout=30)
-dp = Dispatcher(storage=MemoryStorage())
+# TELEGRAM_API_URL направляет запросы на локальный Bot API сервер или тестовую заглушку
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session, request_timeout=30)
+dp = Dispatcher(storage=create_storage())
 dp.include_router(admin_router)
 
 # Функция запуска
-async def on_startup(_):
+async def on_startup():
     """Функция, выполняемая при старте бота."""
     try:
         await init_db()
@@ -25,12 +40,24 @@ async def on_startup(_):
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
         raise
+    archive_writer.start()
+    proxy_manager.start()
+    client_manager.start()
+    session_store.start()
+    track_queue("archive", lambda: len(archive_writer))
+    track_queue("telethon_sessions", lambda: len(session_store))
+    if PROFILE_ENABLED:
+        profiler.start()
     logger.info("Бот запущен...")
 
 # Функция остановки
-async def on_shutdown(_):
+async def on_shutdown():
     """Функция, выполняемая при остановке бота."""
     logger.info("Начало завершения работы бота...")
+    # Стеки, накопленные с запуска или с /profile on, не теряются при остановке
+    if profiler.enabled:
+        profiler.dump()
+        await profiler.stop()
     for account_id in list(active_parsers.keys()):
         for chat_id in list(active_parsers[account_id].keys()):
             try:
@@ -38,6 +65,10 @@ async def on_shutdown(_):
                 logger.info(f"Остановлен парсинг для аккаунта {account_id} и чата {chat_id}")
             except Exception as e:
                 logger.error(f"Ошибка при остановке парсинга для аккаунта {account_id} и чата {chat_id}: {e}")
+    await client_manager.stop()
+    await session_store.stop()
+    await archive_writer.stop()
+    await proxy_manager.stop()
     await bot.session.close()
     logger.info("Сессия бота закрыта")
 
@@ -48,13 +79,20 @@ dp.shutdown.register(on_shutdown)
 # Главная функция
 async def main():
     logger.info(f"Токен бота: {BOT_TOKEN[:4]}... (скрыт для безопасности)")
+    metrics_runner = await start_metrics_server() if METRICS_PORT else None
     try:
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка при работе бота: {e}")
         raise
     finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
         logger.info("Бот завершил работу")
+        await flush_logs()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
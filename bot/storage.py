@@ -0,0 +1,72 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete, func, or_
+from database.db import engine, dialect_insert
+from database.models import FsmRecord
+from bot.config import FSM_STORAGE, REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+class DatabaseStorage(BaseStorage):
+    """FSM в основной базе данных (PostgreSQL или SQLite).
+
+    Состояние и данные диалога хранятся в таблице fsm_states, поэтому
+    переживают перезапуск и видны всем процессам бота с одним токеном.
+    В данных допустимы только значения, которые сериализуются в JSON.
+    """
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None):
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self.table = FsmRecord.__table__
+
+    async def _upsert(self, key: str, column: str, value: Optional[str]):
+        statement = dialect_insert(self.table).values(key=key, **{column: value})
+        statement = statement.on_conflict_do_update(index_elements=["key"], set_={column: value, "updated_at": func.now()})
+        async with engine.begin() as conn:
+            await conn.execute(statement)
+            # После state.clear() строка пустая — удаляем её, чтобы таблица не росла
+            if value is None:
+                await conn.execute(delete(self.table).where(
+                    self.table.c.key == key,
+                    self.table.c.state.is_(None),
+                    or_(self.table.c.data.is_(None), self.table.c.data == "{}")
+                ))
+
+    async def _select(self, key: str, column: str) -> Optional[str]:
+        async with engine.connect() as conn:
+            result = await conn.execute(select(self.table.c[column]).where(self.table.c.key == key))
+            return result.scalar()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._upsert(self.key_builder.build(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._select(self.key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._upsert(self.key_builder.build(key), "data", json.dumps(data, ensure_ascii=False) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await self._select(self.key_builder.build(key), "data")
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        # Движок общий с остальным приложением и закрывается вместе с ним
+        pass
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE: database, redis или memory."""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        # Нужен пакет redis; подойдёт и совместимый сервер (KeyDB, Dragonfly и т. п.)
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL)
+    if FSM_STORAGE != "database":
+        logger.warning(f"Неизвестное значение FSM_STORAGE={FSM_STORAGE}, используется database")
+    return DatabaseStorage()
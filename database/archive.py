@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from sqlalchemy import select, func, literal_column
+from database.db import engine, dialect_insert
+from database.models import ArchivedMessage
+
+logger = logging.getLogger(__name__)
+
+# Должно совпадать с выражением индекса ix_message_archive_text_fts, иначе PostgreSQL его не использует
+ARCHIVE_SEARCH_VECTOR = literal_column("to_tsvector('russian', coalesce(message_archive.text, ''))")
+
+class ArchiveWriter:
+    """Буферизованная запись обработанных сообщений в архив.
+
+    Парсер только кладёт запись в буфер, а фоновая задача пишет накопленное
+    пачками (executemany через asyncpg), не задерживая обработку сообщений.
+    Пачка, которую не удалось записать, возвращается в начало буфера и
+    повторяется на следующем такте; после max_attempts неудач подряд она
+    отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 2.0, max_buffer: int = 50000, max_attempts: int = 5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_attempts = max_attempts
+        self._failures = 0
+        self._buffer: Deque[Dict] = deque(maxlen=max_buffer)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def add(self, **record):
+        # Без работающей фоновой задачи буфер не должен расти бесконечно
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _requeue(self, batch: List[Dict]):
+        # При полном буфере extendleft вытесняет самые новые записи с другого конца
+        self.dropped += max(0, len(self._buffer) + len(batch) - self.max_buffer)
+        self._buffer.extendleft(reversed(batch))
+
+    async def flush(self):
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            statement = dialect_insert(ArchivedMessage.__table__).on_conflict_do_nothing(
+                index_elements=["chat_id", "message_id"]
+            )
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(statement, batch)
+            except asyncio.CancelledError:
+                # Отмена в stop(): пачку допишет финальный flush
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                self._failures += 1
+                if self._failures >= self.max_attempts:
+                    self.dropped += len(batch)
+                    self._failures = 0
+                    logger.error(f"Ошибка при записи {len(batch)} сообщений в архив, пачка отброшена после {self.max_attempts} попыток: {e}")
+                    continue
+                self._requeue(batch)
+                logger.error(f"Ошибка при записи {len(batch)} сообщений в архив (попытка {self._failures} из {self.max_attempts}): {e}")
+                return
+            self._failures = 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info("Запись архива сообщений запущена")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.warning(f"Архив: {len(self._buffer)} записей не записаны до остановки")
+        if self.dropped:
+            logger.warning(f"Архив: отброшено {self.dropped} записей из-за переполнения буфера или ошибок записи")
+        logger.info("Запись архива сообщений остановлена")
+
+archive_writer = ArchiveWriter()
+
+# Поиск по архиву: полнотекстовый в PostgreSQL, ILIKE в остальных СУБД.
+# Возвращает страницу результатов и признак наличия следующей страницы.
+async def search_archive(db, query: str, limit: int = 10, offset: int = 0) -> Tuple[List[ArchivedMessage], bool]:
+    statement = select(ArchivedMessage)
+    if db.bind.dialect.name == "postgresql":
+        tsquery = func.websearch_to_tsquery(literal_column("'russian'"), query)
+        statement = statement.where(ARCHIVE_SEARCH_VECTOR.op("@@")(tsquery))
+    else:
+        # autoescape: % и _ в запросе ищутся как символы, а не как шаблоны LIKE
+        statement = statement.where(ArchivedMessage.text.icontains(query, autoescape=True))
+    statement = statement.order_by(ArchivedMessage.date.desc(), ArchivedMessage.id.desc()).limit(limit + 1).offset(offset)
+    result = await db.execute(statement)
+    messages = result.scalars().all()
+    return messages[:limit], len(messages) > limit
@@ -2,7 +2,9 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sess
 from sqlalchemy.ext.declarative import declarative_base
 from contextlib import asynccontextmanager
 import logging
-from sqlalchemy.sql import text
+import time
+from sqlalchemy import inspect, select, literal, exists
+from monitoring.metrics import instrument_engine
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,9 @@ except UnicodeDecodeError as e:
 Base = declarative_base()
 
 # Создаём асинхронный движок
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Эхо SQL включается через DB_ECHO (см. monitoring/logs.py), а не отдельным обработчиком SQLAlchemy в stdout
+engine = create_async_engine(DATABASE_URL)
+instrument_engine(engine)
 AsyncSessionLocal = async_sessionmaker(
     autocommit=False,
     autoflush=False,
@@ -45,27 +49,51 @@ async def get_db():
         finally:
             await db.close()
 
+# INSERT с поддержкой ON CONFLICT для текущего диалекта (PostgreSQL или SQLite)
+def dialect_insert(table):
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
 # Асинхронная инициализация базы данных
 async def init_db():
     # Импортируем модели здесь, чтобы избежать циклического импорта
-    from .models import Settings, KeywordList, KeywordFilter, Account, Proxy, TargetChat
+    from .models import Settings
+    timings = {}
+    started = time.perf_counter()
     async with engine.begin() as conn:
-        # Проверяем, существуют ли таблицы, и создаём только если их нет
-        for table in Base.metadata.tables.values():
-            exists = await conn.run_sync(lambda conn_sync: conn_sync.dialect.has_table(conn_sync, table.name))
-            if not exists:
-                await conn.run_sync(lambda conn_sync: table.create(conn_sync))
-                logger.info(f"Таблица {table.name} создана")
-        logger.info("Проверка и создание таблиц завершены")
-    
-    # Проверяем и добавляем начальные настройки
-    async with AsyncSessionLocal() as db:
+        timings["подключение"] = time.perf_counter() - started
+
+        # Один проход рефлексии вместо has_table на каждую таблицу
+        step = time.perf_counter()
+        existing = await conn.run_sync(lambda conn_sync: set(inspect(conn_sync).get_table_names()))
+        timings["рефлексия"] = time.perf_counter() - step
+
+        # Создаём все недостающие таблицы одним вызовом create_all
+        step = time.perf_counter()
+        missing = [table for name, table in Base.metadata.tables.items() if name not in existing]
+        if missing:
+            await conn.run_sync(lambda conn_sync: Base.metadata.create_all(conn_sync, tables=missing, checkfirst=False))
+            logger.info(f"Созданы таблицы: {', '.join(table.name for table in missing)}")
+        timings["создание таблиц"] = time.perf_counter() - step
+
+        # Начальные настройки добавляются одним идемпотентным запросом
+        step = time.perf_counter()
         try:
-            result = await db.execute(text("SELECT 1 FROM settings LIMIT 1"))
-            if not result.scalar():
-                db.add(Settings(forward_chat_id="-1002391590780"))
-                await db.commit()
+            seed = dialect_insert(Settings.__table__).from_select(
+                ["forward_chat_id", "filter_enabled"],
+                select(literal("-1002391590780"), literal(False)).where(~exists().select_from(Settings.__table__))
+            ).on_conflict_do_nothing()
+            result = await conn.execute(seed)
+            if result.rowcount:
                 logger.info("Начальные настройки добавлены в базу данных")
         except Exception as e:
             logger.error(f"Ошибка при инициализации настроек: {e}")
-            raise
\ No newline at end of file
+            raise
+        timings["настройки"] = time.perf_counter() - step
+
+    timings["всего"] = time.perf_counter() - started
+    logger.info("Время запуска БД: " + ", ".join(f"{name} {value * 1000:.1f} мс" for name, value in timings.items()))
+    return timings
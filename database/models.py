@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, Boolean, DateTime, LargeBinary, ForeignKey, UniqueConstraint, Index, func, text as sql_text
 from sqlalchemy.orm import relationship
 from database.db import Base  # Теперь импортируем Base напрямую из db.py
 
@@ -9,6 +9,24 @@ class Settings(Base):
     notification_chat_id = Column(String, nullable=True)  # Для уведомлений
     filter_enabled = Column(Boolean, default=False)  # Для фильтрации по ключевым словам
 
+# Способ доставки для чата пересылки: bot / copy / forward (см. parser/delivery.py)
+class ForwardDestination(Base):
+    __tablename__ = "forward_destinations"
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(String, unique=True, index=True)
+    delivery_mode = Column(String, default="bot", server_default="bot")
+
+# Правила чата пересылки, проверяемые по метаданным до скачивания медиа (см. parser/filters.py)
+class MediaRule(Base):
+    __tablename__ = "media_rules"
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(String, unique=True, index=True)  # Чат пересылки
+    max_size_mb = Column(Float, nullable=True)
+    kinds = Column(String, nullable=True)  # Через запятую: photo,video,text
+    mime_types = Column(String, nullable=True)  # Шаблоны через запятую: image/*,video/mp4
+    blocked_senders = Column(String, nullable=True)  # ID отправителей через запятую
+    require_caption = Column(Boolean, default=False)
+
 class KeywordList(Base):
     __tablename__ = "keyword_lists"
     id = Column(Integer, primary_key=True, index=True)
@@ -47,4 +65,63 @@ class TargetChat(Base):
     __tablename__ = "target_chats"
     id = Column(Integer, primary_key=True, index=True)
     chat_id = Column(String, unique=True, index=True)
-    title = Column(String, nullable=True)
\ No newline at end of file
+    title = Column(String, nullable=True)
+
+class ArchivedMessage(Base):
+    __tablename__ = "message_archive"
+    __table_args__ = (
+        UniqueConstraint("chat_id", "message_id", name="uq_message_archive_chat_message"),
+        # Полнотекстовый индекс (PostgreSQL, русская конфигурация); выражение совпадает с ARCHIVE_SEARCH_VECTOR в archive.py
+        Index("ix_message_archive_text_fts", sql_text("to_tsvector('russian', coalesce(text, ''))"), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    account_id = Column(Integer, index=True)
+    chat_id = Column(BigInteger, index=True)  # Исходный чат
+    chat_title = Column(String, nullable=True)
+    message_id = Column(BigInteger)
+    date = Column(DateTime(timezone=True), index=True)  # Дата исходного сообщения
+    text = Column(Text, nullable=True)
+    matched_keywords = Column(String, nullable=True)  # Совпавшие ключевые слова через запятую
+    forward_status = Column(String, index=True)  # forwarded / filtered / duplicate / failed
+    forwarded_message_id = Column(BigInteger, nullable=True)  # ID сообщения в чате пересылки
+    media_ref = Column(String, nullable=True)  # Например, photo:123 или document:456
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Состояние сессий Telethon в основной базе вместо отдельных .session файлов
+class TelethonSession(Base):
+    __tablename__ = "telethon_sessions"
+    session_key = Column(String, primary_key=True)  # Номер телефона аккаунта
+    dc_id = Column(Integer)
+    server_address = Column(String, nullable=True)
+    port = Column(Integer, nullable=True)
+    auth_key = Column(LargeBinary, nullable=True)
+    takeout_id = Column(BigInteger, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TelethonEntity(Base):
+    __tablename__ = "telethon_entities"
+    session_key = Column(String, primary_key=True)
+    id = Column(BigInteger, primary_key=True)  # Помеченный ID (-100... для каналов)
+    hash = Column(BigInteger)
+    username = Column(String, nullable=True)
+    phone = Column(String, nullable=True)
+    name = Column(String, nullable=True)
+    date = Column(BigInteger, nullable=True)
+
+class TelethonUpdateState(Base):
+    __tablename__ = "telethon_update_states"
+    session_key = Column(String, primary_key=True)
+    entity_id = Column(BigInteger, primary_key=True)
+    pts = Column(Integer)
+    qts = Column(Integer)
+    date = Column(BigInteger)
+    seq = Column(Integer)
+
+# Состояние FSM админ-диалогов: переживает перезапуск и общее для всех процессов бота
+class FsmRecord(Base):
+    __tablename__ = "fsm_states"
+    key = Column(String, primary_key=True)  # Ключ DefaultKeyBuilder: fsm:<bot_id>:<chat_id>:<user_id>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # JSON
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
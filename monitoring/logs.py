@@ -0,0 +1,102 @@
+import logging
+import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, Tuple
+from loguru import logger
+from bot.config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_ROTATION, LOG_RETENTION, LOG_RATE_LIMIT, LOG_RATE_BURST, DB_ECHO
+
+# Поля контекста текущей задачи asyncio: account_id, chat, chat_id, message_id
+log_context: ContextVar[Dict[str, object]] = ContextVar("log_context", default={})
+
+def bind_context(**fields):
+    """Добавляет поля ко всем записям текущей задачи и задач, созданных из неё после вызова; None убирает поле."""
+    context = {**log_context.get(), **fields}
+    log_context.set({key: value for key, value in context.items() if value is not None})
+
+def _add_context(record):
+    # Поля из logger.bind(...) важнее полей задачи
+    for key, value in log_context.get().items():
+        record["extra"].setdefault(key, value)
+
+class RateLimiter:
+    """Фильтр записей ниже WARNING: не больше rate в секунду с одного места кода для одного чата.
+
+    Одно место кода в горячем цикле (например, «сообщение отправлено») на
+    активном чате пишет сотни записей в секунду; лишние отбрасываются, а
+    их число попадает в поле suppressed следующей пропущенной записи.
+    Предупреждения и ошибки не ограничиваются.
+    """
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT, burst: int = LOG_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[Tuple, list] = {}  # Ключ -> [токены, время пополнения, отброшено]
+
+    def __call__(self, record) -> bool:
+        if self.rate <= 0 or record["level"].no >= logging.WARNING:
+            return True
+        key = (record["name"], record["line"], record["extra"].get("chat_id"))
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record["extra"]["suppressed"] = bucket[2]
+            bucket[2] = 0
+        return True
+
+class InterceptHandler(logging.Handler):
+    """Передаёт записи stdlib logging (aiogram, SQLAlchemy, Telethon, модули бота) в loguru."""
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        # Ищем кадр, вызвавший logging, чтобы в записи были его модуль и строка
+        frame, depth = sys._getframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+def _text_format(record) -> str:
+    fields = " ".join(f"{key}={value}" for key, value in record["extra"].items() if key != "fields")
+    record["extra"]["fields"] = f" | {fields}" if fields else ""
+    return "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{line} - {message}{extra[fields]}\n{exception}"
+
+def setup_logging():
+    """Единый конвейер логов: loguru с очередью, stdlib logging перенаправлен в него.
+
+    Запись форматируется в вызывающем потоке, а в stderr и файл её пишет
+    отдельный поток (enqueue=True), поэтому медленный вывод не блокирует цикл
+    asyncio. LOG_FORMAT=json пишет каждую запись одним JSON-объектом.
+    """
+    stdlib_level = logging.getLevelName(LOG_LEVEL.upper())
+    if not isinstance(stdlib_level, int):
+        stdlib_level = logging.DEBUG
+    logging.basicConfig(handlers=[InterceptHandler()], level=stdlib_level, force=True)
+    # SQL-запросы пишутся только по DB_ECHO и идут через общий конвейер, а не в stdout
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if DB_ECHO else logging.WARNING)
+
+    logger.remove()
+    logger.configure(patcher=_add_context)
+    serialize = LOG_FORMAT == "json"
+    options = dict(level=LOG_LEVEL.upper(), enqueue=True, backtrace=False, diagnose=False, serialize=serialize)
+    if not serialize:
+        options["format"] = _text_format
+    # У каждого вывода свой ограничитель, иначе одна запись расходовала бы лимит дважды
+    logger.add(sys.stderr, filter=RateLimiter(), **options)
+    if LOG_FILE:
+        logger.add(LOG_FILE, filter=RateLimiter(), rotation=LOG_ROTATION, retention=LOG_RETENTION, encoding="utf-8", **options)
+
+async def flush_logs():
+    """Дожидается записи всех записей из очереди; вызывать перед выходом."""
+    await logger.complete()
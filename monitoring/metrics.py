@@ -0,0 +1,59 @@
+import time
+from typing import Callable
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Отдельный реестр: в выдачу /metrics попадают только метрики приложения
+registry = CollectorRegistry()
+
+# Поток сообщений по аккаунтам и чатам-источникам
+MESSAGES_READ = Counter("parser_messages_read_total", "Прочитано новых сообщений", ["account_id", "chat"], registry=registry)
+MESSAGES_MATCHED = Counter("parser_messages_matched_total", "Сообщений прошло фильтр ключевых слов", ["account_id", "chat"], registry=registry)
+MESSAGES_FORWARDED = Counter("parser_messages_forwarded_total", "Переслано сообщений", ["account_id", "chat"], registry=registry)
+MESSAGES_SKIPPED = Counter("parser_messages_skipped_total", "Пропущено сообщений", ["account_id", "chat", "reason"], registry=registry)
+
+FORWARD_LATENCY = Histogram(
+    "parser_forward_latency_seconds", "Задержка от даты сообщения до пересылки", ["chat"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600), registry=registry
+)
+
+QUEUE_DEPTH = Gauge("queue_depth", "Длина внутренних очередей", ["queue"], registry=registry)
+
+FLOOD_WAIT_SECONDS = Counter("telegram_flood_wait_seconds_total", "Секунды FloodWait", ["source", "account_id"], registry=registry)
+
+MEDIA_BYTES = Counter("media_bytes_total", "Объём медиа", ["direction"], registry=registry)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Время выполнения запросов к БД", ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5), registry=registry
+)
+
+def track_queue(name: str, size: Callable[[], int]):
+    """Значение метрики queue_depth{queue=name} вычисляется при каждом запросе /metrics."""
+    QUEUE_DEPTH.labels(queue=name).set_function(size)
+
+def record_flood_wait(source: str, account_id, seconds: float):
+    FLOOD_WAIT_SECONDS.labels(source=source, account_id=str(account_id)).inc(seconds)
+
+def instrument_engine(engine: AsyncEngine):
+    """Время каждого SQL-запроса по типу операции (SELECT, INSERT, ...)."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Храним время в контексте выполнения: при ошибке запроса он просто отбрасывается
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_DURATION.labels(operation=operation).observe(time.perf_counter() - started)
+
+def render() -> bytes:
+    return generate_latest(registry)
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+from bot.config import PROFILE_INTERVAL_MS, PROFILE_TASK_INTERVAL_MS, PROFILE_SLOW_CALLBACK_MS, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Слой по модулю кадра; проверяются по порядку, поэтому отправка раньше остального парсера
+LAYERS = (
+    ("parser.sender", "sender"),
+    ("parser.delivery", "sender"),
+    ("parser.downloads", "downloads"),
+    ("parser.", "parser"),
+    ("database.", "db"),
+    ("sqlalchemy.", "db"),
+    ("aiosqlite", "db"),
+    ("asyncpg", "db"),
+    ("bot.", "bot"),
+    ("proxy.", "proxy"),
+    ("telethon.", "telethon"),
+    ("aiogram.", "aiogram"),
+)
+# Цикл в ожидании событий: такие выборки не считаются занятостью
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "_poll"}
+
+def frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+def frame_layer(frames) -> str:
+    """Слой самого глубокого кадра приложения или библиотеки; frames — от внешнего к внутреннему."""
+    for frame in reversed(frames):
+        module = frame.f_globals.get("__name__", "")
+        for prefix, layer in LAYERS:
+            if module.startswith(prefix):
+                return layer
+    return "other"
+
+def coroutine_stack(coro) -> list:
+    """Кадры приостановленной корутины по цепочке await, от внешнего к внутреннему."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+class SlowCallbackHandler(logging.Handler):
+    """Перехватывает предупреждения asyncio «Executing ... took N seconds» в режиме отладки."""
+
+    def __init__(self, keep: int = 20):
+        super().__init__(level=logging.WARNING)
+        self.count = 0
+        self.recent: Deque[str] = deque(maxlen=keep)
+
+    def emit(self, record: logging.LogRecord):
+        if isinstance(record.msg, str) and record.msg.startswith("Executing"):
+            self.count += 1
+            self.recent.append(record.getMessage()[:300])
+
+class Profiler:
+    """Профилирование по требованию без перезапуска бота.
+
+    При включении цикл asyncio переходит в режим отладки и сообщает о
+    колбэках дольше slow_callback_ms. Фоновый поток раз в interval_ms снимает
+    стек главного потока — это синхронная работа, блокирующая цикл. Раз в
+    task_interval_ms внутри цикла снимаются стеки всех задач по цепочке await —
+    это время ожидания корутин. Стеки копятся в свёрнутом формате flamegraph
+    (flamegraph.pl, speedscope) и записываются в файл по dump().
+    """
+
+    def __init__(self, interval_ms: int = PROFILE_INTERVAL_MS, task_interval_ms: int = PROFILE_TASK_INTERVAL_MS, slow_callback_ms: int = PROFILE_SLOW_CALLBACK_MS, directory: str = PROFILE_DIR):
+        self.interval = interval_ms / 1000
+        self.task_interval = task_interval_ms / 1000
+        self.slow_callback = slow_callback_ms / 1000
+        self.directory = directory
+        self.stacks: Counter = Counter()
+        self.loop_layers: Counter = Counter()  # Секунды синхронной работы в цикле по слоям
+        self.task_layers: Counter = Counter()  # Секунды ожидания корутин по слоям
+        self.loop_samples = 0
+        self.busy_samples = 0
+        self.started_at: Optional[float] = None
+        self.slow_callbacks = SlowCallbackHandler()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._saved_debug = (False, 0.1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.started_at is not None
+
+    def start(self):
+        """Включает профилирование; вызывать из работающего цикла. Накопленные стеки сбрасываются."""
+        if self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._saved_debug = (self._loop.get_debug(), self._loop.slow_callback_duration)
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self.slow_callback
+        logging.getLogger("asyncio").addHandler(self.slow_callbacks)
+        with self._lock:
+            self.stacks.clear()
+            self.loop_layers.clear()
+            self.task_layers.clear()
+            self.loop_samples = self.busy_samples = 0
+        self.slow_callbacks.count = 0
+        self.slow_callbacks.recent.clear()
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop_thread, args=(threading.get_ident(),), name="profiler", daemon=True)
+        self._thread.start()
+        self._task = asyncio.create_task(self._sample_tasks())
+        logger.info(f"Профилирование включено: стек цикла раз в {self.interval * 1000:g} мс, задачи раз в {self.task_interval * 1000:g} мс")
+
+    async def stop(self):
+        if not self.enabled:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.to_thread(self._thread.join)
+        debug, slow_callback = self._saved_debug
+        self._loop.set_debug(debug)
+        self._loop.slow_callback_duration = slow_callback
+        logging.getLogger("asyncio").removeHandler(self.slow_callbacks)
+        self.started_at = None
+        logger.info("Профилирование выключено")
+
+    def _sample_loop_thread(self, loop_thread: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(loop_thread)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            idle = frames[-1].f_code.co_name in IDLE_FUNCTIONS
+            stack = ";".join(["loop"] + [frame_label(frame) for frame in frames])
+            with self._lock:
+                self.stacks[stack] += 1
+                self.loop_samples += 1
+                if not idle:
+                    self.busy_samples += 1
+                    self.loop_layers[frame_layer(frames)] += self.interval
+
+    async def _sample_tasks(self):
+        current = asyncio.current_task()
+        while True:
+            await asyncio.sleep(self.task_interval)
+            samples = []
+            for task in asyncio.all_tasks():
+                if task is current or task.done():
+                    continue
+                frames = coroutine_stack(task.get_coro())
+                if frames:
+                    samples.append((";".join(["tasks"] + [frame_label(frame) for frame in frames]), frame_layer(frames)))
+            with self._lock:
+                for stack, layer in samples:
+                    # Вес выборки задачи в единицах интервала потока, чтобы ветки flamegraph были соизмеримы
+                    self.stacks[stack] += max(1, round(self.task_interval / self.interval))
+                    self.task_layers[layer] += self.task_interval
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Записывает накопленные стеки в свёрнутом формате: «кадр;кадр;кадр число» на строку."""
+        if path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in self.stacks.most_common()]
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+        logger.info(f"Стеки профилирования записаны в {path} ({len(lines)} уникальных)")
+        return path
+
+    def summary(self) -> str:
+        if not self.enabled:
+            return "Профилирование выключено."
+        with self._lock:
+            busy = self.busy_samples / self.loop_samples if self.loop_samples else 0.0
+            loop_layers = self.loop_layers.most_common()
+            task_layers = self.task_layers.most_common(8)
+        lines = [
+            f"Профилирование идёт {time.monotonic() - self.started_at:.0f} с, цикл занят {busy:.0%}",
+            f"Медленных колбэков (дольше {self.slow_callback * 1000:g} мс): {self.slow_callbacks.count}",
+        ]
+        if loop_layers:
+            lines.append("Синхронная работа в цикле: " + ", ".join(f"{layer} {seconds:.1f} с" for layer, seconds in loop_layers))
+        if task_layers:
+            lines.append("Ожидание задач (задачо-секунды): " + ", ".join(f"{layer} {seconds:.0f}" for layer, seconds in task_layers))
+        for message in list(self.slow_callbacks.recent)[-3:]:
+            lines.append(f"• {message}")
+        return "\n".join(lines)
+
+profiler = Profiler()
@@ -1,25 +1,35 @@
 import os
+import time
 import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError, UnauthorizedError
 from telethon.sessions import SQLiteSession
-from sqlalchemy import select
-from database.models import Account, Proxy
+from telethon.tl.functions.updates import GetStateRequest
+from database.models import Account
+from proxy.manager import proxy_manager, to_telethon_proxy
+from parser.sessions import DatabaseSession
+from monitoring.metrics import record_flood_wait
+from bot.config import CLIENT_CONNECT_CONCURRENCY, CLIENT_IDLE_TIMEOUT, CLIENT_KEEPALIVE_INTERVAL, ACCOUNT_CHECK_CONCURRENCY, SESSION_BACKEND
 from loguru import logger
 
-async def create_client(account: Account, db=None) -> TelegramClient:
+# Сколько раз пробуем переключиться на другой прокси при ошибке подключения
+PROXY_FAILOVER_ATTEMPTS = 3
+
+async def create_client(account: Account) -> TelegramClient:
     session_path = f"sessions/{account.phone_number}"
-    os.makedirs(os.path.dirname(session_path), exist_ok=True)
 
-    # Создаём сессию
-    session = SQLiteSession(session_path)
+    # Создаём сессию: в основной базе (старый .session файл переносится при первой загрузке) или в файле
+    if SESSION_BACKEND == "database":
+        session = await DatabaseSession.load(account.phone_number, legacy_path=f"{session_path}.session")
+    else:
+        os.makedirs(os.path.dirname(session_path), exist_ok=True)
+        session = SQLiteSession(session_path)
 
-    # Получаем прокси, если он привязан
-    proxy = None
-    if account.proxy_id and db:
-        result = await db.execute(select(Proxy).where(Proxy.id == account.proxy_id))
-        proxy_data = result.scalars().first()
-        if proxy_data:
-            proxy = (proxy_data.type, proxy_data.host, proxy_data.port, proxy_data.user, proxy_data.password)
+    # Получаем прокси из пула: привязанный, если он жив, иначе самый быстрый рабочий
+    proxy_data = await proxy_manager.select_proxy(account)
+    proxy = to_telethon_proxy(proxy_data) if proxy_data else None
 
     # Создаём клиента Telegram с настройкой тайм-аута
     client = TelegramClient(
@@ -30,11 +40,225 @@ async def create_client(account: Account, db=None) -> TelegramClient:
         timeout=30,  # Устанавливаем тайм-аут через параметр timeout (в секундах)
         connection_retries=3  # Количество попыток повторного подключения
     )
-    
-    # Подключаемся
-    await client.connect()
+
+    # Подключаемся. Клиент, не дошедший до вызывающего (ошибка подключения, тайм-аут wait_for
+    # или отмена задачи), отключаем сразу: иначе остаются сокет и открытая сессия
+    try:
+        await connect_client(client, account.id)
+    except BaseException:
+        await client.disconnect()
+        raise
     return client
 
+# Подключение с переключением на другой прокси, если текущий не отвечает
+async def connect_client(client: TelegramClient, account_id: int):
+    for attempt in range(PROXY_FAILOVER_ATTEMPTS + 1):
+        try:
+            await client.connect()
+            return
+        except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.warning(f"Ошибка подключения клиента для аккаунта ID {account_id}: {e}")
+            if attempt == PROXY_FAILOVER_ATTEMPTS or not await proxy_manager.failover(client, account_id, e):
+                raise
+
+class ClientManager:
+    """Один прогретый клиент на аккаунт для парсеров, проверок и авторизации.
+
+    Клиенты выдаются со счётчиком ссылок: пока клиентом кто-то пользуется,
+    фоновая задача поддерживает соединение, а клиент без ссылок отключается
+    после CLIENT_IDLE_TIMEOUT. Число одновременных подключений ограничено.
+    """
+
+    def __init__(self, connect_concurrency: int = 5, idle_timeout: float = 600, keepalive_interval: float = 60):
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.clients: Dict[int, TelegramClient] = {}
+        self.refs: Dict[int, int] = {}
+        self._idle_since: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._connect_semaphore = asyncio.Semaphore(connect_concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    def _lock(self, account_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(account_id, asyncio.Lock())
+
+    async def get(self, account: Account, acquire: bool = False) -> TelegramClient:
+        """Подключённый клиент аккаунта; с acquire=True ссылка берётся под той же блокировкой."""
+        async with self._lock(account.id):
+            client = self.clients.get(account.id)
+            if client is None:
+                async with self._connect_semaphore:
+                    client = await create_client(account)
+                self.clients[account.id] = client
+                self._idle_since[account.id] = time.monotonic()
+                logger.info(f"Клиент для аккаунта ID {account.id} подключён")
+            elif not client.is_connected():
+                async with self._connect_semaphore:
+                    await connect_client(client, account.id)
+            if acquire:
+                # Под блокировкой, иначе close() мог бы отключить клиент между подключением и захватом
+                self.refs[account.id] = self.refs.get(account.id, 0) + 1
+                self._idle_since.pop(account.id, None)
+            return client
+
+    async def acquire(self, account: Account) -> TelegramClient:
+        return await self.get(account, acquire=True)
+
+    def release(self, account_id: int):
+        if self.refs.get(account_id, 0) <= 0:
+            return
+        self.refs[account_id] -= 1
+        if not self.refs[account_id]:
+            self._idle_since[account_id] = time.monotonic()
+
+    @asynccontextmanager
+    async def lease(self, account: Account):
+        client = await self.acquire(account)
+        try:
+            yield client
+        finally:
+            self.release(account.id)
+
+    async def close(self, account_id: int, idle_only: bool = False) -> bool:
+        """Отключает клиент; с idle_only=True — только если он по-прежнему без ссылок дольше idle_timeout."""
+        async with self._lock(account_id):
+            if idle_only:
+                # Проверка повторяется под блокировкой: пока ждали её, клиент мог быть захвачен
+                idle_since = self._idle_since.get(account_id)
+                if self.refs.get(account_id, 0) or idle_since is None or time.monotonic() - idle_since <= self.idle_timeout:
+                    return False
+            client = self.clients.pop(account_id, None)
+            self.refs.pop(account_id, None)
+            self._idle_since.pop(account_id, None)
+            if client:
+                await client.disconnect()
+                logger.info(f"Клиент для аккаунта ID {account_id} отключён")
+            return True
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            now = time.monotonic()
+            for account_id, client in list(self.clients.items()):
+                try:
+                    idle_since = self._idle_since.get(account_id)
+                    if idle_since is not None and now - idle_since > self.idle_timeout:
+                        await self.close(account_id, idle_only=True)
+                    elif not client.is_connected():
+                        async with self._lock(account_id), self._connect_semaphore:
+                            # Пока ждали блокировку, клиент могли закрыть или уже переподключить
+                            if self.clients.get(account_id) is client and not client.is_connected():
+                                logger.info(f"Переподключение клиента для аккаунта ID {account_id}")
+                                await connect_client(client, account_id)
+                except Exception as e:
+                    logger.error(f"Ошибка поддержки соединения для аккаунта ID {account_id}: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._keepalive())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for account_id in list(self.clients):
+            await self.close(account_id)
+
+client_manager = ClientManager(
+    connect_concurrency=CLIENT_CONNECT_CONCURRENCY,
+    idle_timeout=CLIENT_IDLE_TIMEOUT,
+    keepalive_interval=CLIENT_KEEPALIVE_INTERVAL
+)
+
+class PendingAuthorizations:
+    """Клиенты, ожидающие кода или пароля 2FA.
+
+    В FSM хранится только account_id, а живой клиент — здесь, со ссылкой в
+    client_manager, чтобы его не отключили между сообщениями. Если диалог
+    продолжен после перезапуска или другим процессом бота, клиент создаётся
+    заново из сохранённой сессии. Брошенные авторизации освобождаются таймером
+    через timeout после последнего шага, даже если новых авторизаций не было.
+    """
+
+    def __init__(self, timeout: float = 900):
+        self.timeout = timeout
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+
+    def _expire(self, account_id: int):
+        logger.info(f"Авторизация аккаунта ID {account_id} брошена, клиент освобождён")
+        self.finish(account_id)
+
+    async def client(self, account: Account) -> TelegramClient:
+        timer = self._timers.pop(account.id, None)
+        if timer is not None:
+            timer.cancel()
+            try:
+                client = await client_manager.get(account)
+            except Exception:
+                # Ссылка взята на прошлом шаге, а таймера у неё больше нет
+                client_manager.release(account.id)
+                raise
+        else:
+            client = await client_manager.acquire(account)
+        # Каждый шаг диалога продлевает срок
+        self._timers[account.id] = asyncio.get_running_loop().call_later(self.timeout, self._expire, account.id)
+        return client
+
+    def finish(self, account_id: int):
+        timer = self._timers.pop(account_id, None)
+        if timer is not None:
+            timer.cancel()
+            client_manager.release(account_id)
+
+pending_authorizations = PendingAuthorizations()
+
+# Проверка одного аккаунта лёгким запросом через его общий клиент
+async def check_account(account: Account, timeout: float = 20) -> dict:
+    report = {
+        "account_id": account.id,
+        "phone_number": account.phone_number,
+        "authorized": None,
+        "latency": None,
+        "flood_wait": None,
+        "proxy_id": None,
+        "error": None
+    }
+    try:
+        client = await asyncio.wait_for(client_manager.acquire(account), timeout=timeout)
+        try:
+            started = time.perf_counter()
+            # GetState требует авторизации, поэтому заодно проверяет, что ключ сессии ещё действителен
+            await asyncio.wait_for(client(GetStateRequest()), timeout=timeout)
+            report["latency"] = time.perf_counter() - started
+            report["authorized"] = True
+        finally:
+            client_manager.release(account.id)
+    except UnauthorizedError:
+        report["authorized"] = False
+    except FloodWaitError as e:
+        report["flood_wait"] = e.seconds
+        record_flood_wait("telethon", account.id, e.seconds)
+    except asyncio.TimeoutError:
+        report["error"] = "тайм-аут"
+    except Exception as e:
+        report["error"] = str(e) or type(e).__name__
+    report["proxy_id"] = proxy_manager.assignments.get(account.id)
+    return report
+
+# Одновременная проверка всех аккаунтов с ограничением параллельности
+async def check_accounts(accounts: List[Account], concurrency: int = ACCOUNT_CHECK_CONCURRENCY, timeout: float = 20) -> List[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(account):
+        async with semaphore:
+            return await check_account(account, timeout=timeout)
+
+    return await asyncio.gather(*(check(account) for account in accounts))
+
 async def authorize_client(client: TelegramClient, phone_number: str, db) -> dict:
     try:
         await client.connect()
@@ -0,0 +1,157 @@
+import re
+import sys
+import time
+from array import array
+from collections import deque, Counter
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# Всё, что не буква и не цифра, считаем разделителем слов
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_URL = re.compile(r"https?://\S+|t\.me/\S+")
+
+FINGERPRINT_BITS = 64
+# Шинглов в отпечатке не больше этого, чтобы время на сообщение было ограничено
+MAX_SHINGLES = 4096
+
+# По биту: таблица bytes.translate, оставляющая от байта только этот бит (0 или 1)
+_BIT_TABLES = [bytes(byte >> bit & 1 for byte in range(256)) for bit in range(8)]
+
+def normalize_text(text: str) -> List[str]:
+    """Приводит текст к списку слов: нижний регистр, без ссылок, пунктуации и эмодзи."""
+    text = _URL.sub(" ", text.lower())
+    return [word for word in _NON_WORD.split(text) if word]
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(tokens: List[str], shingle_size: int = 2) -> int:
+    """64-битный SimHash по шинглам из соседних слов.
+
+    Шинглы хешируются встроенным hash() кортежей слов: хеши строк уже
+    посчитаны и закешированы, но случайны для процесса, поэтому отпечатки
+    нельзя сохранять между запусками. Хеши пакуются в байты, и число
+    шинглов с каждым битом считается по байтовым срезам через translate и
+    count без цикла Python по шинглам. Бит отпечатка выставлен, если он был
+    у большинства шинглов.
+    """
+    if len(tokens) > shingle_size:
+        features = list(zip(*(tokens[i:i + MAX_SHINGLES] for i in range(shingle_size))))
+    else:
+        features = [tuple(tokens)]
+    hashes = array("q", map(hash, features))
+    if sys.byteorder == "big":
+        hashes.byteswap()
+    # Байт k каждого хеша — биты 8k..8k+7
+    data = hashes.tobytes()
+    half = len(features) // 2
+    fingerprint = 0
+    for bit, table in enumerate(_BIT_TABLES):
+        bits = data.translate(table)
+        for byte in range(8):
+            if bits[byte::8].count(1) > half:
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+@dataclass(frozen=True)
+class ContentFingerprint:
+    """Отпечаток сообщения: текст и идентификаторы медиа."""
+
+    fingerprint: Optional[int]  # None, если в тексте нет слов
+    exact: bool  # Короткий текст: сравнивается только точно
+    media_keys: Tuple[str, ...]
+
+class NearDuplicateIndex:
+    """Окно недавних сообщений для поиска почти одинаковых текстов и одинаковых медиа.
+
+    Отпечаток делится на max_distance + 1 полос: если два отпечатка отличаются
+    не более чем на max_distance бит, хотя бы одна полоса у них совпадает,
+    поэтому кандидатов ищем по словарю полос, а не перебором всего окна.
+    Одно и то же медиа считается повтором только вместе с тем же текстом
+    (или без текста у обоих): репост фото с другой подписью — новое сообщение.
+    Проверка и запоминание разделены: отпечаток добавляется только после
+    успешной отправки, чтобы неудачная отправка не прятала повторы.
+    """
+
+    def __init__(self, max_distance: int = 8, window_seconds: float = 6 * 3600, min_tokens: int = 5):
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.min_tokens = min_tokens
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self._band_mask = (1 << self.band_bits) - 1
+        # (время добавления, отпечаток или None, точный ли отпечаток, ключи медиа)
+        self._entries: Deque[Tuple[float, Optional[int], bool, Tuple[str, ...]]] = deque()
+        self._buckets: Dict[Tuple[int, int], Counter] = {}
+        self._exact: Counter = Counter()
+        self._media: Counter = Counter()  # (ключ медиа, отпечаток текста)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, fingerprint: int) -> Iterable[Tuple[int, int]]:
+        for band in range(self.bands):
+            yield band, fingerprint >> (band * self.band_bits) & self._band_mask
+
+    def _expire(self, now: float):
+        border = now - self.window_seconds
+        while self._entries and self._entries[0][0] < border:
+            _, fingerprint, exact, media_keys = self._entries.popleft()
+            if fingerprint is not None and exact:
+                self._exact[fingerprint] -= 1
+                if self._exact[fingerprint] <= 0:
+                    del self._exact[fingerprint]
+            elif fingerprint is not None:
+                for key in self._band_keys(fingerprint):
+                    bucket = self._buckets[key]
+                    bucket[fingerprint] -= 1
+                    if bucket[fingerprint] <= 0:
+                        del bucket[fingerprint]
+                    if not bucket:
+                        del self._buckets[key]
+            for media_key in media_keys:
+                key = (media_key, fingerprint)
+                self._media[key] -= 1
+                if self._media[key] <= 0:
+                    del self._media[key]
+
+    def _has_similar(self, fingerprint: int) -> bool:
+        for key in self._band_keys(fingerprint):
+            for candidate in self._buckets.get(key, ()):
+                if (candidate ^ fingerprint).bit_count() <= self.max_distance:
+                    return True
+        return False
+
+    def fingerprint(self, text: str, media_keys: Iterable[str] = ()) -> ContentFingerprint:
+        tokens = normalize_text(text or "")
+        # Короткие тексты сравниваем только точно: у SimHash на паре слов слишком много ложных совпадений
+        exact = len(tokens) < self.min_tokens
+        fingerprint = None
+        if tokens:
+            fingerprint = _hash64(" ".join(tokens)) if exact else simhash(tokens)
+        return ContentFingerprint(fingerprint, exact, tuple(key for key in media_keys if key))
+
+    def is_duplicate(self, content: ContentFingerprint, now: Optional[float] = None) -> bool:
+        """True, если такое сообщение уже было в окне."""
+        self._expire(time.monotonic() if now is None else now)
+        if any((key, content.fingerprint) in self._media for key in content.media_keys):
+            return True
+        if content.fingerprint is None:
+            return False
+        if content.exact:
+            return content.fingerprint in self._exact
+        return self._has_similar(content.fingerprint)
+
+    def add(self, content: ContentFingerprint, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        self._entries.append((now, content.fingerprint, content.exact, content.media_keys))
+        if content.fingerprint is not None:
+            if content.exact:
+                self._exact[content.fingerprint] += 1
+            else:
+                for key in self._band_keys(content.fingerprint):
+                    self._buckets.setdefault(key, Counter())[content.fingerprint] += 1
+        for media_key in content.media_keys:
+            self._media[(media_key, content.fingerprint)] += 1
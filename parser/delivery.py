@@ -0,0 +1,125 @@
+import time
+from enum import Enum
+from typing import Dict, Optional, Tuple, Union
+from telethon import TelegramClient
+from telethon.errors import (
+    ChatAdminRequiredError, ChatForwardsRestrictedError, ChatSendMediaForbiddenError, ChatWriteForbiddenError,
+    ChannelPrivateError, ForbiddenError, MediaCaptionTooLongError, MessageTooLongError, PeerIdInvalidError,
+    UserBannedInChannelError
+)
+from telethon.helpers import add_surrogate
+from loguru import logger
+from parser.formatting import append_signature
+from parser.sender import MediaKind, get_media_kind
+
+class DeliveryMode(str, Enum):
+    BOT = "bot"  # Скачать аккаунтом и загрузить ботом (по умолчанию)
+    COPY = "copy"  # Копия от имени аккаунта без заголовка пересылки, медиа не скачивается
+    FORWARD = "forward"  # Нативная пересылка аккаунтом с заголовком источника
+
+DELIVERY_MODE_TITLES = {
+    DeliveryMode.BOT: "🤖 Через бота",
+    DeliveryMode.COPY: "📋 Копия от аккаунта",
+    DeliveryMode.FORWARD: "↪️ Пересылка аккаунтом",
+}
+
+def parse_delivery_mode(value: Optional[str]) -> DeliveryMode:
+    try:
+        return DeliveryMode(value)
+    except ValueError:
+        return DeliveryMode.BOT
+
+# Аккаунт не может писать в чат пересылки или источник запрещает пересылку:
+# переходим на бота, пока запрет не истечёт
+NATIVE_DENIED_ERRORS = (
+    ChatAdminRequiredError,
+    ChatForwardsRestrictedError,
+    ChatSendMediaForbiddenError,
+    ChatWriteForbiddenError,
+    ChannelPrivateError,
+    ForbiddenError,
+    PeerIdInvalidError,
+    UserBannedInChannelError,
+)
+# Не подходит только это сообщение (подпись не влезла в лимит длины): отправляем через бота без запрета на час
+NATIVE_MESSAGE_ERRORS = (MediaCaptionTooLongError, MessageTooLongError)
+# Пределы длины текста и подписи к медиа для аккаунта без Premium, в единицах UTF-16
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+# Через сколько секунд снова пробовать нативную доставку после отказа
+NATIVE_RETRY_AFTER = 3600
+
+# (аккаунт, чат-источник, чат пересылки) -> до какого момента нативная доставка не пробуется
+_denied_until: Dict[Tuple[int, int, str], float] = {}
+
+def _peer(destination: Union[int, str]) -> Union[int, str]:
+    # ID чата в настройках хранится строкой
+    if isinstance(destination, str) and destination.lstrip("-").isdigit():
+        return int(destination)
+    return destination
+
+class NativeDelivery:
+    """Доставка сообщения аккаунтом-парсером на стороне сервера Telegram.
+
+    Медиа не скачивается и не загружается заново: пересылка переносит
+    сообщение целиком, копия переиспользует медиа исходного сообщения.
+    Если прав не хватает, send возвращает None, и сообщение уходит через бота;
+    отказ запоминается на NATIVE_RETRY_AFTER секунд.
+    """
+
+    def __init__(self, client: TelegramClient, account_id: int, source_chat_id: int, source_title: str, destination: Union[int, str], mode: DeliveryMode):
+        self.client = client
+        self.mode = mode
+        self.source_chat_id = source_chat_id
+        self.source_title = source_title
+        self.destination = _peer(destination)
+        self._input_destination = None
+        self._key = (account_id, source_chat_id, str(destination))
+
+    @property
+    def available(self) -> bool:
+        if self.mode is DeliveryMode.BOT:
+            return False
+        return _denied_until.get(self._key, 0) <= time.monotonic()
+
+    def _deny(self, error: Exception):
+        _denied_until[self._key] = time.monotonic() + NATIVE_RETRY_AFTER
+        logger.warning(f"Режим {self.mode.value} недоступен для {self.source_title} -> {self.destination} ({type(error).__name__}: {error}), отправляем через бота")
+
+    async def send(self, message) -> Optional[int]:
+        """ID сообщения в чате пересылки или None, если нужно отправить через бота."""
+        if not self.available:
+            return None
+        if self._input_destination is None:
+            # ValueError здесь значит, что аккаунт не знает чат пересылки; прочие ValueError идут обычным путём ошибок
+            try:
+                self._input_destination = await self.client.get_input_entity(self.destination)
+            except ValueError as e:
+                self._deny(e)
+                return None
+        try:
+            if self.mode is DeliveryMode.FORWARD:
+                sent = await self.client.forward_messages(self._input_destination, message.id, from_peer=self.source_chat_id)
+            else:
+                kind = get_media_kind(message)
+                # У стикеров не бывает подписи
+                text, entities = ("", None) if kind is MediaKind.STICKER else append_signature(message.message, message.entities, self.source_title)
+                # Длину проверяем заранее, чтобы не тратить запрос, который Telegram всё равно отклонит
+                limit = MAX_MESSAGE_LENGTH if kind is MediaKind.TEXT else MAX_CAPTION_LENGTH
+                if len(add_surrogate(text)) > limit:
+                    logger.info(f"Сообщение {message.id} с подписью длиннее {limit} символов, отправляем через бота")
+                    return None
+                sent = await self.client.send_message(
+                    self._input_destination,
+                    text,
+                    file=message.media if kind is not MediaKind.TEXT else None,
+                    formatting_entities=entities,
+                    link_preview=True
+                )
+        except NATIVE_DENIED_ERRORS as e:
+            self._deny(e)
+            return None
+        except NATIVE_MESSAGE_ERRORS as e:
+            logger.info(f"Сообщение {message.id} не скопировано ({type(e).__name__}), отправляем через бота")
+            return None
+        return sent.id if sent else None
@@ -0,0 +1,127 @@
+import asyncio
+from io import BytesIO
+from typing import Dict, Optional
+from telethon import TelegramClient
+from telethon.errors import FileReferenceExpiredError, FileReferenceInvalidError
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, PhotoSize, PhotoSizeProgressive, PhotoCachedSize, PhotoStrippedSize
+from loguru import logger
+from bot.config import DOWNLOAD_CONCURRENCY, DOWNLOAD_BYTE_BUDGET_MB
+from monitoring.metrics import MEDIA_BYTES
+
+def media_size(media) -> int:
+    """Размер файла по метаданным сообщения, до скачивания; 0, если неизвестен."""
+    if isinstance(media, MessageMediaDocument) and media.document:
+        return media.document.size or 0
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        sizes = []
+        for size in getattr(media.photo, "sizes", None) or []:
+            if isinstance(size, PhotoSizeProgressive):
+                sizes.append(max(size.sizes))
+            elif isinstance(size, PhotoSize):
+                sizes.append(size.size)
+            elif isinstance(size, (PhotoCachedSize, PhotoStrippedSize)):
+                sizes.append(len(size.bytes))
+        return max(sizes, default=0)
+    return 0
+
+class ByteBudget:
+    """Сколько байт медиа аккаунт держит в памяти одновременно.
+
+    Файл больше всего бюджета всё равно пропускается, но только когда
+    остальные файлы уже освобождены — иначе он бы никогда не скачался.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size: int):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    async def release(self, size: int):
+        async with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+class Prefetch:
+    """Скачивание одного файла в фоне; байты занимают бюджет, пока не вызван release."""
+
+    def __init__(self, scheduler: "DownloadScheduler", message):
+        self.scheduler = scheduler
+        self.message = message
+        self.size = media_size(message.media)
+        self._reserved = False
+        self._released = False
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> bytes:
+        await self.scheduler.budget.acquire(self.size)
+        self._reserved = True
+        async with self.scheduler.semaphore:
+            return await self.scheduler.download(self.message)
+
+    async def result(self) -> bytes:
+        return await self.task
+
+    async def release(self):
+        if self._released:
+            return
+        self._released = True
+        if not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except BaseException:
+                pass
+        if self._reserved:
+            await self.scheduler.budget.release(self.size)
+
+class DownloadScheduler:
+    """Общая для всех чатов аккаунта очередь скачивания медиа.
+
+    Одновременно скачивается не больше concurrency файлов, а скачанные, но ещё
+    не отправленные байты не превышают byte_budget. Файлы из разных DC Telethon
+    скачивает через отдельные экспортированные соединения, поэтому параллельные
+    загрузки действительно идут параллельно. Истёкшую ссылку на файл обновляем,
+    перечитав сообщение.
+    """
+
+    def __init__(self, client: TelegramClient, account_id: int, concurrency: int = DOWNLOAD_CONCURRENCY, byte_budget: int = DOWNLOAD_BYTE_BUDGET_MB * 1024 * 1024):
+        self.client = client
+        self.account_id = account_id
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.budget = ByteBudget(byte_budget)
+
+    def prefetch(self, message) -> Prefetch:
+        return Prefetch(self, message)
+
+    async def download(self, message) -> bytes:
+        try:
+            data = await self._download(message.media)
+        except (FileReferenceExpiredError, FileReferenceInvalidError):
+            logger.info(f"Ссылка на файл сообщения {message.id} истекла, перечитываем сообщение")
+            fresh = await self.client.get_messages(message.chat_id, ids=message.id)
+            if fresh is None or not fresh.media:
+                raise
+            data = await self._download(fresh.media)
+        MEDIA_BYTES.labels(direction="downloaded").inc(len(data))
+        return data
+
+    async def _download(self, media) -> bytes:
+        buffer = await self.client.download_media(media, file=BytesIO())
+        if buffer is None:
+            raise ValueError("Медиа сообщения не скачивается")
+        return buffer.getvalue()
+
+# account_id -> планировщик; создаётся при запуске первого парсера аккаунта
+download_schedulers: Dict[int, DownloadScheduler] = {}
+
+def get_download_scheduler(client: TelegramClient, account_id: int) -> DownloadScheduler:
+    scheduler: Optional[DownloadScheduler] = download_schedulers.get(account_id)
+    if scheduler is None or scheduler.client is not client:
+        scheduler = DownloadScheduler(client, account_id)
+        download_schedulers[account_id] = scheduler
+    return scheduler
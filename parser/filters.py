@@ -0,0 +1,167 @@
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import FrozenSet, Iterable, List, Optional, Tuple
+from telethon.tl.types import MessageMediaDocument
+from parser.downloads import media_size
+from parser.sender import MediaKind, get_media_kind
+
+@dataclass(frozen=True)
+class MessageMeta:
+    """Всё, что известно о сообщении без скачивания медиа."""
+
+    kind: MediaKind
+    size: int  # Байты; 0 для текста и неизвестного размера
+    mime_type: Optional[str]
+    sender_id: Optional[int]
+    caption: str
+
+    @classmethod
+    def from_message(cls, message) -> "MessageMeta":
+        media = message.media
+        kind = get_media_kind(message)
+        mime_type = media.document.mime_type if isinstance(media, MessageMediaDocument) and media.document else None
+        if kind is MediaKind.PHOTO:
+            mime_type = "image/jpeg"
+        return cls(
+            kind=kind,
+            size=media_size(media),
+            mime_type=mime_type,
+            sender_id=message.sender_id,
+            caption=message.message or ""
+        )
+
+@dataclass(frozen=True)
+class MediaRules:
+    """Правила чата пересылки, проверяемые по метаданным до скачивания.
+
+    Пустое правило ничего не ограничивает. kinds относится и к тексту:
+    «только фото» — это kinds={photo}, текстовые сообщения тогда тоже отсекаются.
+    """
+
+    max_size_mb: Optional[float] = None
+    kinds: FrozenSet[str] = frozenset()
+    mime_types: Tuple[str, ...] = ()  # Шаблоны fnmatch: image/*, video/mp4
+    blocked_senders: FrozenSet[int] = frozenset()
+    require_caption: bool = False
+
+    @property
+    def empty(self) -> bool:
+        return self == MediaRules()
+
+    def check(self, meta: MessageMeta) -> Optional[str]:
+        """Причина отказа или None, если сообщение можно пересылать."""
+        if self.kinds and meta.kind.value not in self.kinds:
+            return f"тип {meta.kind.value} не разрешён"
+        if meta.sender_id is not None and meta.sender_id in self.blocked_senders:
+            return f"отправитель {meta.sender_id} заблокирован"
+        if self.require_caption and not meta.caption.strip():
+            return "нет подписи"
+        if meta.kind is not MediaKind.TEXT:
+            if self.max_size_mb is not None and meta.size > self.max_size_mb * 1024 * 1024:
+                return f"файл {meta.size / 1024 / 1024:.1f} МБ больше {self.max_size_mb:g} МБ"
+            if self.mime_types and not any(fnmatch((meta.mime_type or "").lower(), pattern) for pattern in self.mime_types):
+                return f"MIME {meta.mime_type} не разрешён"
+        return None
+
+    def describe(self) -> str:
+        if self.empty:
+            return "Ограничений нет"
+        lines = []
+        if self.kinds:
+            lines.append(f"Типы: {', '.join(sorted(self.kinds))}")
+        if self.max_size_mb is not None:
+            lines.append(f"Размер файла до {self.max_size_mb:g} МБ")
+        if self.mime_types:
+            lines.append(f"MIME: {', '.join(self.mime_types)}")
+        if self.blocked_senders:
+            lines.append(f"Заблокированные отправители: {', '.join(map(str, sorted(self.blocked_senders)))}")
+        if self.require_caption:
+            lines.append("Только с подписью")
+        return "\n".join(lines)
+
+    def to_columns(self) -> dict:
+        """Значения для строки таблицы media_rules."""
+        return {
+            "max_size_mb": self.max_size_mb,
+            "kinds": ",".join(sorted(self.kinds)) or None,
+            "mime_types": ",".join(self.mime_types) or None,
+            "blocked_senders": ",".join(map(str, sorted(self.blocked_senders))) or None,
+            "require_caption": self.require_caption,
+        }
+
+    @classmethod
+    def from_row(cls, row) -> "MediaRules":
+        if row is None:
+            return cls()
+        return cls(
+            max_size_mb=row.max_size_mb,
+            kinds=frozenset(_split(row.kinds)),
+            mime_types=tuple(_split(row.mime_types)),
+            blocked_senders=frozenset(int(sender) for sender in _split(row.blocked_senders)),
+            require_caption=bool(row.require_caption)
+        )
+
+def _split(value: Optional[str]) -> List[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+MEDIA_RULES_HELP = (
+    "Параметры через пробел:\n"
+    "max_size=20 — файлы не больше 20 МБ\n"
+    f"kinds=photo,video — только эти типы ({', '.join(kind.value for kind in MediaKind)})\n"
+    "mime=image/*,video/mp4 — только эти MIME-типы\n"
+    "block=123,456 — не пересылать от этих отправителей\n"
+    "caption=yes — только сообщения с подписью\n"
+    "reset — снять все ограничения"
+)
+
+def parse_media_rules(args: str) -> MediaRules:
+    """Правила из аргументов /media_rules; ValueError с понятным текстом при ошибке."""
+    values = {}
+    for token in args.split():
+        name, separator, value = token.partition("=")
+        if not separator or not value:
+            raise ValueError(f"Ожидалось имя=значение, получено «{token}»")
+        values[name.lower()] = value
+    unknown = set(values) - {"max_size", "kinds", "mime", "block", "caption"}
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+
+    max_size_mb = None
+    if "max_size" in values:
+        try:
+            max_size_mb = float(values["max_size"])
+        except ValueError:
+            raise ValueError("max_size должен быть числом мегабайт")
+        if max_size_mb <= 0:
+            raise ValueError("max_size должен быть больше нуля")
+    kinds = frozenset(kind.lower() for kind in _split(values.get("kinds")))
+    allowed_kinds = {kind.value for kind in MediaKind}
+    if kinds - allowed_kinds:
+        raise ValueError(f"Неизвестные типы: {', '.join(sorted(kinds - allowed_kinds))}")
+    try:
+        blocked_senders = frozenset(int(sender) for sender in _split(values.get("block")))
+    except ValueError:
+        raise ValueError("block должен содержать числовые ID через запятую")
+    caption = values.get("caption", "no").lower()
+    if caption not in ("yes", "no"):
+        raise ValueError("caption принимает yes или no")
+    return MediaRules(
+        max_size_mb=max_size_mb,
+        kinds=kinds,
+        mime_types=tuple(pattern.lower() for pattern in _split(values.get("mime"))),
+        blocked_senders=blocked_senders,
+        require_caption=caption == "yes"
+    )
+
+class KeywordMatcher:
+    """Поиск ключевых слов без учёта регистра; слова приводятся к нижнему регистру один раз."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = [(keyword, keyword.lower()) for keyword in keywords if keyword]
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def match(self, text: str) -> List[str]:
+        lowered = text.lower()
+        return [keyword for keyword, needle in self.keywords if needle in lowered]
@@ -0,0 +1,101 @@
+import re
+from functools import lru_cache
+from html import escape
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
+from telethon.helpers import add_surrogate, del_surrogate
+from telethon.tl.types import (
+    MessageEntityBold, MessageEntityItalic, MessageEntityUnderline, MessageEntityStrike, MessageEntitySpoiler,
+    MessageEntityCode, MessageEntityPre, MessageEntityTextUrl, MessageEntityMentionName, MessageEntityBlockquote
+)
+
+# Режим разметки, в котором уходят пересылаемые сообщения
+PARSE_MODE = "HTML"
+
+# Символы вне BMP занимают в UTF-16 две позиции
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+
+def _pre(entity: MessageEntityPre) -> Tuple[str, str]:
+    if entity.language:
+        return f'<pre><code class="language-{escape(entity.language)}">', "</code></pre>"
+    return "<pre>", "</pre>"
+
+# Теги Bot API HTML для сущностей Telethon. Ссылки, упоминания и хэштеги без тегов —
+# Telegram распознаёт их в тексте сам; кастомные эмодзи боту недоступны и остаются обычными.
+ENTITY_TAGS: Dict[Type, Union[Tuple[str, str], Callable[..., Tuple[str, str]]]] = {
+    MessageEntityBold: ("<b>", "</b>"),
+    MessageEntityItalic: ("<i>", "</i>"),
+    MessageEntityUnderline: ("<u>", "</u>"),
+    MessageEntityStrike: ("<s>", "</s>"),
+    MessageEntitySpoiler: ("<tg-spoiler>", "</tg-spoiler>"),
+    MessageEntityCode: ("<code>", "</code>"),
+    MessageEntityPre: _pre,
+    MessageEntityTextUrl: lambda entity: (f'<a href="{escape(entity.url)}">', "</a>"),
+    MessageEntityMentionName: lambda entity: (f'<a href="tg://user?id={entity.user_id}">', "</a>"),
+    MessageEntityBlockquote: lambda entity: ("<blockquote expandable>" if entity.collapsed else "<blockquote>", "</blockquote>"),
+}
+
+def entities_to_html(text: str, entities: Optional[Iterable] = None) -> str:
+    """Текст сообщения Telethon с его сущностями в HTML для Bot API.
+
+    Смещения сущностей считаются в UTF-16, поэтому текст с символами вне BMP
+    временно переводится в суррогатные пары. Вложенные сущности закрываются
+    в обратном порядке.
+    """
+    if not text:
+        return ""
+    if not entities:
+        return escape(text, quote=False)
+
+    # Без эмодзи и других символов вне BMP смещения UTF-16 совпадают с индексами строки
+    surrogates = _ASTRAL.search(text) is not None
+    if surrogates:
+        text = add_surrogate(text)
+    inserts = []
+    ordered = sorted(entities, key=lambda entity: (entity.offset, -entity.length))
+    for index, entity in enumerate(ordered):
+        tags = ENTITY_TAGS.get(type(entity))
+        if tags is None:
+            continue
+        if callable(tags):
+            tags = tags(entity)
+        start = min(entity.offset, len(text))
+        end = min(entity.offset + entity.length, len(text))
+        # На одной позиции сначала закрываем теги, затем открываем; внутренние закрываются раньше внешних
+        inserts.append((start, 1, index, tags[0]))
+        inserts.append((end, 0, -index, tags[1]))
+    inserts.sort()
+
+    parts = []
+    position = 0
+    for at, _, _, tag in inserts:
+        parts.append(escape(text[position:at], quote=False))
+        parts.append(tag)
+        position = at
+    parts.append(escape(text[position:], quote=False))
+    html = "".join(parts)
+    return del_surrogate(html) if surrogates else html
+
+SIGNATURE_PREFIX = "👍 Скопировано из "
+
+def chat_link(title: str) -> str:
+    return f"https://t.me/{title.replace(' ', '_')}"
+
+@lru_cache(maxsize=1024)
+def chat_signature(title: str) -> str:
+    """Подпись «Скопировано из» для чата; зависит только от названия, поэтому кэшируется."""
+    return f'{SIGNATURE_PREFIX}<a href="{escape(chat_link(title))}">{escape(title, quote=False)}</a>'
+
+def format_message(message, signature: str) -> str:
+    """Текст для пересылки: исходное форматирование сообщения и подпись в конце."""
+    body = entities_to_html(message.message, message.entities)
+    return f"{body}\n\n{signature}" if body else signature
+
+def append_signature(text: str, entities: Optional[Iterable], title: str) -> Tuple[str, List]:
+    """Текст и сущности для копирования аккаунтом: исходные сущности плюс ссылка подписи.
+
+    Разметка не проходит через HTML, поэтому сохраняются все сущности сообщения.
+    """
+    text = text or ""
+    head = f"{text}\n\n{SIGNATURE_PREFIX}" if text else SIGNATURE_PREFIX
+    link = MessageEntityTextUrl(offset=len(add_surrogate(head)), length=len(add_surrogate(title)), url=chat_link(title))
+    return head + title, [*(entities or ()), link]
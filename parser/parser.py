@@ -1,57 +1,84 @@
 import asyncio
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from aiohttp.client_exceptions import ClientConnectionError
-from aiogram.types import FSInputFile
-from io import BytesIO
+import datetime
 from typing import List, Dict
 from loguru import logger
-from telethon import TelegramClient
-from telethon.tl.types import PeerChannel, PeerUser, PeerChat, MessageMediaPhoto, MessageMediaDocument, DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeSticker
+from telethon import TelegramClient, utils
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, DocumentAttributeSticker, DocumentAttributeAnimated
 from telethon.errors.rpcerrorlist import FloodWaitError
 from telethon.tl.functions.channels import JoinChannelRequest
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 from database.models import TargetChat
+from parser.client import client_manager, connect_client
+from database.archive import archive_writer
+from parser.dedup import NearDuplicateIndex
+from parser.stats import ParserStats, parser_stats
+from parser.supervisor import supervise_parser, PermanentParserError
+from parser.scheduler import ChatActivity, get_poller, account_pollers
+from parser.sender import MediaKind, OutboundMessage, get_sender
+from parser.formatting import PARSE_MODE, chat_signature, format_message
+from parser.delivery import DeliveryMode, NativeDelivery
+from parser.downloads import get_download_scheduler
+from parser.filters import KeywordMatcher, MediaRules, MessageMeta
+from bot.config import DEDUP_ENABLED, DEDUP_MAX_DISTANCE, DEDUP_WINDOW_SECONDS
+from monitoring.logs import bind_context
+from monitoring.metrics import MESSAGES_READ, MESSAGES_MATCHED, MESSAGES_FORWARDED, MESSAGES_SKIPPED, FORWARD_LATENCY, MEDIA_BYTES, record_flood_wait
 
-# Множество для хранения обработанных сообщений
+# Множество для хранения обработанных сообщений: (ID чата, ID сообщения), ID сообщений в разных чатах совпадают
 processed_messages = set()
 active_parsers: Dict[int, Dict[str, asyncio.Task]] = {}
-client_cache: Dict[int, TelegramClient] = {}
+# Общее для всех чатов окно недавно пересланного контента
+near_duplicates = NearDuplicateIndex(max_distance=DEDUP_MAX_DISTANCE, window_seconds=DEDUP_WINDOW_SECONDS)
+
+# Ссылка на медиа сообщения для архива
+def get_media_ref(message) -> str:
+    if isinstance(message.media, MessageMediaPhoto) and message.media.photo:
+        return f"photo:{message.media.photo.id}"
+    if isinstance(message.media, MessageMediaDocument) and message.media.document:
+        return f"document:{message.media.document.id}"
+    return type(message.media).__name__ if message.media else None
+
+# Идентификаторы файлов сообщения: одинаковы у репостов одного и того же медиа.
+# Стикеры и GIF не учитываются: один популярный файл шлют в разные сообщения, это не повтор
+def get_media_keys(message) -> List[str]:
+    if isinstance(message.media, MessageMediaDocument) and message.media.document and any(
+        isinstance(attribute, (DocumentAttributeSticker, DocumentAttributeAnimated)) for attribute in message.media.document.attributes
+    ):
+        return []
+    media_ref = get_media_ref(message)
+    return [media_ref] if media_ref and ":" in media_ref else []
+
+# Запись обработанного сообщения в архив (только буфер, без обращения к БД)
+def archive_message(account_id: int, target_chat: TargetChat, message, status: str, matched_keywords=None, forwarded_message_id=None):
+    archive_writer.add(
+        account_id=account_id,
+        chat_id=int(target_chat.chat_id),
+        chat_title=target_chat.title,
+        message_id=message.id,
+        date=message.date,
+        text=message.text,
+        matched_keywords=", ".join(matched_keywords) if matched_keywords else None,
+        forward_status=status,
+        forwarded_message_id=forwarded_message_id,
+        media_ref=get_media_ref(message)
+    )
 
 # Функция для извлечения имени канала из URL
 def get_channel_name(target_chat: str) -> str:
     return target_chat.replace("https://t.me/", "").split("/")[0]
 
-async def start_real_time_parsing(account, target_chat_id: str, bot: Bot, forward_chat_id: str, keywords=None, filter_enabled=False):
-    # Проверяем, есть ли уже клиент для этого аккаунта в кэше
-    if account.id not in client_cache:
-        session_name = f"sessions/{account.phone_number}"
-        client = TelegramClient(
-            session=session_name,
-            api_id=account.api_id,
-            api_hash=account.api_hash
-        )
-        try:
-            await client.start()
-            if not await client.is_user_authorized():
-                logger.warning(f"Аккаунт {account.phone_number} не авторизован. Требуется повторная авторизация.")
-                raise ValueError("Аккаунт не авторизован")
-            client_cache[account.id] = client
-        except Exception as e:
-            logger.error(f"Ошибка при запуске клиента для аккаунта ID {account.id}: {e}")
-            raise
-    else:
-        client = client_cache[account.id]
+# Числовой ID чата по сущности Telethon: помеченный (-100... для каналов), как ключи диалогов в AccountPoller
+def get_entity_chat_id(entity):
+    try:
+        return utils.get_peer_id(entity)
+    except TypeError:
+        return None
 
+# Определение числового ID чата; при необходимости аккаунт присоединяется к чату
+async def resolve_chat_id(client: TelegramClient, target_chat_id: str) -> int:
     try:
         entity = await client.get_entity(target_chat_id)
-        if isinstance(entity, PeerChannel):
-            chat_id = int(f"-100{entity.id}")
-        elif isinstance(entity, PeerChat):
-            chat_id = -entity.id
-        elif isinstance(entity, PeerUser):
-            chat_id = entity.id
-        else:
-            chat_id = int(entity.id) if hasattr(entity, 'id') and entity.id else None
+        chat_id = get_entity_chat_id(entity)
         if chat_id is None:
             raise ValueError(f"Не удалось определить chat_id для {target_chat_id}")
         logger.info(f"Чат {target_chat_id} (ID: {chat_id})")
@@ -60,211 +87,223 @@ async def start_real_time_parsing(account, target_chat_id: str, bot: Bot, forwar
         try:
             await client(JoinChannelRequest(target_chat_id))
             entity = await client.get_entity(target_chat_id)
-            if isinstance(entity, PeerChannel):
-                chat_id = int(f"-100{entity.id}")
-            elif isinstance(entity, PeerChat):
-                chat_id = -entity.id
-            elif isinstance(entity, PeerUser):
-                chat_id = entity.id
-            else:
-                chat_id = int(entity.id) if hasattr(entity, 'id') and entity.id else None
+            chat_id = get_entity_chat_id(entity)
             if chat_id is None:
                 raise ValueError(f"Не удалось определить chat_id после присоединения для {target_chat_id}")
             logger.info(f"Аккаунт успешно присоединился к чату {target_chat_id}")
         except Exception as e:
             logger.error(f"Ошибка при присоединении к чату {target_chat_id}: {e}")
             raise
+    return chat_id
+
+async def start_real_time_parsing(account, target_chat_id: str, bot: Bot, forward_chat_id: str, keywords=None, filter_enabled=False, delivery_mode: DeliveryMode = DeliveryMode.BOT, media_rules: MediaRules = None):
+    # Повторный запуск того же чата заменяет старую задачу
+    if target_chat_id in active_parsers.get(account.id, {}):
+        await stop_parsing(account.id, target_chat_id)
+
+    # Берём прогретый клиент аккаунта; ссылка освобождается в stop_parsing
+    try:
+        client = await client_manager.acquire(account)
+    except Exception as e:
+        logger.error(f"Ошибка при запуске клиента для аккаунта ID {account.id}: {e}")
+        raise
+    try:
+        if not await client.is_user_authorized():
+            logger.warning(f"Аккаунт {account.phone_number} не авторизован. Требуется повторная авторизация.")
+            raise ValueError("Аккаунт не авторизован")
+        chat_id = await resolve_chat_id(client, target_chat_id)
+    except Exception:
+        client_manager.release(account.id)
+        raise
 
     # Создаём объект TargetChat для передачи в задачу
     target_chat = TargetChat(id=0, chat_id=chat_id, title=target_chat_id)
 
     logger.info(f"Запущено отслеживание чата {target_chat_id} в реальном времени")
-    task = asyncio.create_task(real_time_parsing_task(client, account.id, target_chat, bot, forward_chat_id, keywords, filter_enabled))
+    stats = ParserStats(account_id=account.id, chat=target_chat_id, chat_id=chat_id)
+    # Супервизор перезапускает задачу после временных сбоев и останавливается на постоянных
+    task = asyncio.create_task(supervise_parser(
+        lambda: real_time_parsing_task(client, account.id, target_chat, bot, forward_chat_id, keywords, filter_enabled, stats=stats, delivery_mode=delivery_mode, media_rules=media_rules),
+        stats,
+        bot=bot
+    ))
+    stats.task = task
+    task.add_done_callback(lambda finished: record_parser_exit(stats, finished))
+    parser_stats[(account.id, target_chat_id)] = stats
     if account.id not in active_parsers:
         active_parsers[account.id] = {}
     active_parsers[account.id][target_chat_id] = task
     logger.info(f"Клиент для аккаунта ID {account.id} запущен в фоновой задаче")
 
-async def real_time_parsing_task(client: TelegramClient, account_id: int, target_chat: TargetChat, bot: Bot, forward_chat_id: int, keywords: List[str], filter_enabled: bool):
+# Упавшая задача остаётся в active_parsers, а причина видна в /status
+def record_parser_exit(stats: ParserStats, task: asyncio.Task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error:
+        stats.record_error(error)
+        logger.error(f"Парсер аккаунта ID {stats.account_id} для чата {stats.chat} завершился с ошибкой: {error}")
+
+async def real_time_parsing_task(client: TelegramClient, account_id: int, target_chat: TargetChat, bot: Bot, forward_chat_id: int, keywords: List[str], filter_enabled: bool, stats: ParserStats = None, delivery_mode: DeliveryMode = DeliveryMode.BOT, media_rules: MediaRules = None):
+    # Все записи парсера и его фоновых скачиваний несут аккаунт и чат
+    bind_context(account_id=account_id, chat=target_chat.title, chat_id=target_chat.chat_id)
     logger.info(f"Чат {target_chat.title} (ID: {target_chat.chat_id})")
     logger.info(f"Запущено отслеживание чата {target_chat.title} в реальном времени")
 
-    # Кэшируем клиента
-    client_cache[account_id] = client
-
     # Подключаемся и управляем соединением вручную
     async def ensure_connected():
         if not client.is_connected():
             logger.info(f"Переподключение клиента для аккаунта ID {account_id}")
-            await client.connect()
+            await connect_client(client, account_id)
         if not await client.is_user_authorized():
             logger.error(f"Клиент для аккаунта ID {account_id} не авторизован")
             return False
         return True
 
     if not await ensure_connected():
-        return
+        raise PermanentParserError("Аккаунт не авторизован")
+
+    # Метки метрик для этого парсера
+    labels = {"account_id": str(account_id), "chat": target_chat.title}
+    stats = stats or ParserStats(account_id=account_id, chat=target_chat.title)
+
+    # Опрос подстраивается под активность чата; бюджет запросов общий для всех чатов аккаунта
+    poller = get_poller(client, account_id)
+    await poller.register(target_chat.chat_id)
+    activity = ChatActivity()
+    sender = get_sender(bot)
+    signature = chat_signature(target_chat.title)
+    # Копия или пересылка аккаунтом без скачивания медиа; при нехватке прав — через бота
+    native = NativeDelivery(client, account_id, target_chat.chat_id, target_chat.title, forward_chat_id, delivery_mode)
+    downloads = get_download_scheduler(client, account_id)
+    media_rules = media_rules or MediaRules()
+    keyword_matcher = KeywordMatcher(keywords if filter_enabled and keywords else [])
 
     while True:  # Бесконечный цикл для постоянного мониторинга
-        async for message in client.iter_messages(target_chat.chat_id, limit=10):
-            if message.id in processed_messages:
+        # Историю читаем, только если верхнее сообщение чата сменилось (или чата нет в диалогах)
+        last_seen = stats.last_message_id
+        head = await poller.head(target_chat.chat_id)
+        if head is not None:
+            stats.record_head(head)
+        page_size = activity.page_size
+        if head is not None and last_seen is not None and head <= last_seen:
+            messages = []
+        else:
+            messages = await poller.fetch(target_chat.chat_id, last_seen, page_size)
+        if last_seen is not None:
+            activity.update(len(messages))
+        # Полная страница — значит, в чате есть ещё непрочитанные сообщения
+        backlog = last_seen is not None and len(messages) >= page_size
+
+        # Сначала отбираем сообщения для пересылки, затем отправляем их по порядку
+        selected = []
+        # Отобранные, но ещё не отправленные сообщения пачки: в общее окно они попадут только после отправки
+        batch_duplicates = NearDuplicateIndex(max_distance=near_duplicates.max_distance, min_tokens=near_duplicates.min_tokens)
+        for message in messages:
+            stats.record_head(message.id)
+            if (target_chat.chat_id, message.id) in processed_messages:
                 continue
-            processed_messages.add(message.id)
+            processed_messages.add((target_chat.chat_id, message.id))
+            bind_context(message_id=message.id)
+            stats.record_message(message)
+            MESSAGES_READ.labels(**labels).inc()
             logger.info(f"Обработка сообщения {message.id} для пересылки в {forward_chat_id}")
 
+            # Сначала правила чата пересылки по метаданным: ни байта медиа до решения
+            meta = MessageMeta.from_message(message)
+            rejection = media_rules.check(meta)
+            if rejection:
+                logger.info(f"Сообщение {message.id} пропущено по правилам медиа: {rejection}")
+                archive_message(account_id, target_chat, message, "filtered")
+                MESSAGES_SKIPPED.labels(reason="media_rule", **labels).inc()
+                continue
+
             # Проверяем фильтр по ключевым словам
             message_text = message.text or ""
-            if filter_enabled and keywords:
-                if not any(keyword.lower() in message_text.lower() for keyword in keywords):
-                    logger.info(f"Сообщение {message.id} пропущено, так как не содержит ключевые слова: {keywords}")
+            matched_keywords = []
+            if keyword_matcher:
+                matched_keywords = keyword_matcher.match(message_text)
+                if not matched_keywords:
+                    logger.info(f"Сообщение {message.id} пропущено, так как не содержит ключевых слов")
+                    archive_message(account_id, target_chat, message, "filtered")
+                    MESSAGES_SKIPPED.labels(reason="filtered", **labels).inc()
                     continue
+            MESSAGES_MATCHED.labels(**labels).inc()
 
-            # Исходный текст оставляем без изменений
-            formatted_text = message_text
-
-            # Формируем подпись
-            signature = f"👍 Скопировано из [{target_chat.title}](https://t.me/{target_chat.title.replace(' ', '_')})"
-
-            # Экранируем только подпись для MarkdownV2
-            special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-            for char in special_chars:
-                signature = signature.replace(char, f'\\{char}')
-
-            # Добавляем подпись в конец с переносом строки
-            formatted_text = f"{formatted_text}\n\n{signature}" if formatted_text else signature
-
-            # Функция отправки с повторными попытками
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_photo_with_retry():
-                media_file.seek(0)
-                return await bot.send_photo(
-                    chat_id=forward_chat_id,
-                    photo=FSInputFile(media_file, filename=f"photo_{message.id}.jpg"),
-                    caption=formatted_text,
-                    parse_mode="MarkdownV2",
-                    disable_notification=False
-                )
-
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_video_with_retry():
-                media_file.seek(0)
-                return await bot.send_video(
-                    chat_id=forward_chat_id,
-                    video=FSInputFile(media_file, filename=f"video_{message.id}.mp4"),
-                    caption=formatted_text,
-                    parse_mode="MarkdownV2",
-                    disable_notification=False
-                )
-
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_audio_with_retry():
-                media_file.seek(0)
-                return await bot.send_audio(
-                    chat_id=forward_chat_id,
-                    audio=FSInputFile(media_file, filename=f"audio_{message.id}.mp3"),
-                    caption=formatted_text,
-                    parse_mode="MarkdownV2",
-                    disable_notification=False
-                )
-
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_document_with_retry():
-                media_file.seek(0)
-                return await bot.send_document(
-                    chat_id=forward_chat_id,
-                    document=FSInputFile(media_file, filename=f"document_{message.id}"),
-                    caption=formatted_text,
-                    parse_mode="MarkdownV2",
-                    disable_notification=False
-                )
-
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_sticker_with_retry():
-                media_file.seek(0)
-                return await bot.send_sticker(
-                    chat_id=forward_chat_id,
-                    sticker=FSInputFile(media_file, filename=f"sticker_{message.id}.webp")
-                )
+            # Отбрасываем почти одинаковые сообщения до скачивания медиа
+            content = None
+            if DEDUP_ENABLED:
+                content = near_duplicates.fingerprint(message_text, get_media_keys(message))
+                if near_duplicates.is_duplicate(content) or batch_duplicates.is_duplicate(content):
+                    logger.info(f"Сообщение {message.id} пропущено как повтор уже пересланного")
+                    archive_message(account_id, target_chat, message, "duplicate", matched_keywords)
+                    MESSAGES_SKIPPED.labels(reason="duplicate", **labels).inc()
+                    continue
+                batch_duplicates.add(content)
+            selected.append((message, matched_keywords, meta.kind, content))
 
-            @retry(
-                stop=stop_after_attempt(10),
-                wait=wait_exponential(multiplier=1, min=2, max=30),
-                retry=retry_if_exception_type(ClientConnectionError),
-                before_sleep=lambda retry_state: logger.info(f"Повторная попытка отправки сообщения {message.id}, попытка {retry_state.attempt_number}")
-            )
-            async def send_message_with_retry():
-                return await bot.send_message(
-                    chat_id=forward_chat_id,
-                    text=formatted_text,
-                    parse_mode="MarkdownV2",
-                    disable_notification=False,
-                    disable_web_page_preview=False
-                )
+        # Медиа всей пачки начинает скачиваться сразу, пока отправляются предыдущие сообщения
+        prefetches = {}
+        if not native.available:
+            for message, _, kind, _ in selected:
+                if kind is not MediaKind.TEXT:
+                    prefetches[message.id] = downloads.prefetch(message)
 
-            # Отправляем сообщение или медиа с подписью
-            try:
-                if message.media:
-                    media_file = await client.download_media(message.media, file=BytesIO())
-                    media_file.seek(0)
-                    if not await ensure_connected():
-                        continue
-                    if isinstance(message.media, MessageMediaPhoto):
-                        await send_photo_with_retry()
-                        logger.info(f"Фото {message.id} отправлено с уведомлением")
-                    elif isinstance(message.media, MessageMediaDocument):
-                        # Проверяем тип документа через атрибуты
-                        attributes = message.media.document.attributes if message.media.document else []
-                        is_sticker = any(isinstance(attr, DocumentAttributeSticker) for attr in attributes)
-                        is_video = any(isinstance(attr, DocumentAttributeVideo) for attr in attributes)
-                        is_audio = any(isinstance(attr, DocumentAttributeAudio) for attr in attributes)
-
-                        if is_sticker:
-                            await send_sticker_with_retry()
-                            logger.info(f"Стикер {message.id} отправлен")
-                        elif is_video:
-                            await send_video_with_retry()
-                            logger.info(f"Видео {message.id} отправлено с уведомлением")
-                        elif is_audio:
-                            await send_audio_with_retry()
-                            logger.info(f"Аудио {message.id} отправлено с уведомлением")
-                        else:
-                            await send_document_with_retry()
-                            logger.info(f"Документ {message.id} отправлен с уведомлением")
-                else:
+        try:
+            for message, matched_keywords, kind, content in selected:
+                # Отправляем сообщение или медиа с подписью, сохраняя порядок сообщений
+                prefetch = prefetches.get(message.id)
+                bind_context(message_id=message.id)
+                try:
                     if not await ensure_connected():
+                        archive_message(account_id, target_chat, message, "failed", matched_keywords)
                         continue
-                    await send_message_with_retry()
-                logger.info(f"Сообщение {message.id} отправлено в {forward_chat_id}")
-            except Exception as e:
-                logger.error(f"Ошибка при отправке сообщения {message.id}: {str(e)}")
+                    sent_id = await native.send(message) if prefetch is None and native.available else None
+                    if sent_id is None:
+                        media = None
+                        if kind is not MediaKind.TEXT:
+                            prefetch = prefetch or downloads.prefetch(message)
+                            media = await prefetch.result()
+                        # Исходное форматирование переводим в HTML, подпись берём готовую
+                        outbound = OutboundMessage(chat_id=forward_chat_id, text=format_message(message, signature), kind=kind, media=media, source_id=message.id, parse_mode=PARSE_MODE)
+                        sent = await sender.send(outbound)
+                        sent_id = sent.message_id if sent else None
+                        if media is not None:
+                            MEDIA_BYTES.labels(direction="uploaded").inc(len(media))
+                    logger.info(f"Сообщение {message.id} ({kind.value}) отправлено в {forward_chat_id}")
+                    # Повтором считается только то, что действительно дошло до чата пересылки
+                    if content is not None:
+                        near_duplicates.add(content)
+                    archive_message(account_id, target_chat, message, "forwarded", matched_keywords, sent_id)
+                    MESSAGES_FORWARDED.labels(**labels).inc()
+                    stats.forwarded += 1
+                    if message.date:
+                        FORWARD_LATENCY.labels(chat=target_chat.title).observe((datetime.datetime.now(datetime.timezone.utc) - message.date).total_seconds())
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке сообщения {message.id}: {str(e)}")
+                    MESSAGES_SKIPPED.labels(reason="failed", **labels).inc()
+                    stats.record_error(e)
+                    if isinstance(e, FloodWaitError):
+                        record_flood_wait("telethon", account_id, e.seconds)
+                        stats.record_flood_wait(e.seconds)
+                    elif isinstance(e, TelegramRetryAfter):
+                        record_flood_wait("bot", account_id, e.retry_after)
+                        stats.record_flood_wait(e.retry_after)
+                    archive_message(account_id, target_chat, message, "failed", matched_keywords)
+                finally:
+                    # Байты отправленного файла возвращаются в бюджет аккаунта
+                    if prefetch is not None:
+                        await prefetch.release()
+        finally:
+            # Если цикл прерван, недокачанные файлы отменяются
+            for prefetch in prefetches.values():
+                await prefetch.release()
+            bind_context(message_id=None)
 
-        # Задержка перед следующей итерацией
-        await asyncio.sleep(5)
+        # Задержка перед следующей итерацией: от POLL_MIN_INTERVAL для активных чатов до POLL_MAX_INTERVAL для молчащих;
+        # отставание дочитываем сразу, частоту всё равно ограничивает бюджет запросов аккаунта
+        if not backlog:
+            await asyncio.sleep(activity.interval)
 
     logger.info(f"Клиент для аккаунта ID {account_id} запущен в фоновом режиме")
 
@@ -273,14 +312,16 @@ async def stop_parsing(account_id: int, target_chat_id: str):
     if account_id in active_parsers and target_chat_id in active_parsers[account_id]:
         task = active_parsers[account_id].pop(target_chat_id)
         task.cancel()
+        stats = parser_stats.pop((account_id, target_chat_id), None)
+        if stats and account_id in account_pollers:
+            account_pollers[account_id].unregister(stats.chat_id)
         logger.info(f"Парсинг для чата {target_chat_id} остановлен")
     
-        # Если больше нет задач для этого аккаунта, закрываем клиент
+        # Клиент остаётся прогретым и отключится менеджером после простоя
+        client_manager.release(account_id)
         if not active_parsers[account_id]:
             del active_parsers[account_id]
-            if account_id in client_cache:
-                client = client_cache.pop(account_id)
-                await client.disconnect()
-                logger.info(f"Клиент для аккаунта ID {account_id} отключён")
+        return True
     else:
-        logger.warning(f"Нет активного парсинга для аккаунта ID {account_id} и чата {target_chat_id}")
\ No newline at end of file
+        logger.warning(f"Нет активного парсинга для аккаунта ID {account_id} и чата {target_chat_id}")
+        return False
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional
+from telethon import TelegramClient, utils
+from telethon.tl.functions.messages import GetPeerDialogsRequest
+from telethon.tl.types import InputDialogPeer
+from loguru import logger
+from bot.config import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_RPC_PER_SECOND, POLL_RPC_BURST
+
+# Сколько новых сообщений в среднем хотим забирать за один опрос активного чата
+TARGET_MESSAGES_PER_POLL = 5
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+# GetPeerDialogs принимает ограниченное число чатов за вызов
+PEER_DIALOGS_CHUNK = 100
+
+class ChatActivity:
+    """Оценка активности чата и подстройка интервала и размера страницы опроса.
+
+    Скорость сообщений сглаживается экспоненциально. Активный чат опрашивается
+    так, чтобы за раз приходило около TARGET_MESSAGES_PER_POLL сообщений,
+    молчащий — всё реже, вплоть до max_interval.
+    """
+
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL, max_interval: float = POLL_MAX_INTERVAL, alpha: float = 0.3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.alpha = alpha
+        self.rate = 0.0  # Сообщений в секунду
+        self.interval = min_interval
+        self._last_poll = time.monotonic()
+
+    def update(self, new_messages: int):
+        now = time.monotonic()
+        elapsed = max(now - self._last_poll, 0.001)
+        self._last_poll = now
+        self.rate = self.alpha * (new_messages / elapsed) + (1 - self.alpha) * self.rate
+        if new_messages:
+            interval = TARGET_MESSAGES_PER_POLL / self.rate if self.rate > 0 else self.min_interval
+        else:
+            # Тишина: отступаем постепенно, чтобы не проспать всплеск
+            interval = self.interval * 1.5
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+    @property
+    def page_size(self) -> int:
+        expected = math.ceil(self.rate * self.interval * 2)
+        return min(MAX_PAGE_SIZE, max(MIN_PAGE_SIZE, expected))
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+class AccountPoller:
+    """Общий для всех чатов аккаунта бюджет RPC и пакетная проверка новых сообщений.
+
+    Вместо чтения истории каждого чата одним GetPeerDialogs узнаём ID верхнего
+    сообщения сразу у всех зарегистрированных чатов; историю читаем только
+    там, где верхнее сообщение сменилось. Результат кэшируется на
+    min_interval, так что частые опросы разных чатов сливаются в один вызов.
+    """
+
+    def __init__(self, client: TelegramClient, account_id: int, budget: TokenBucket, min_interval: float = POLL_MIN_INTERVAL):
+        self.client = client
+        self.account_id = account_id
+        self.budget = budget
+        self.min_interval = min_interval
+        self._peers: Dict[int, InputDialogPeer] = {}
+        self._marked: Dict[int, int] = {}  # ID чата, как его передал парсер -> помеченный ID диалога
+        self._heads: Dict[int, int] = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def register(self, chat_id: int):
+        if chat_id not in self._peers:
+            input_peer = await self.client.get_input_entity(chat_id)
+            self._peers[chat_id] = InputDialogPeer(peer=input_peer)
+            self._marked[chat_id] = utils.get_peer_id(input_peer)
+            self._checked_at = 0.0
+
+    def unregister(self, chat_id: int):
+        self._peers.pop(chat_id, None)
+        self._heads.pop(self._marked.pop(chat_id, chat_id), None)
+
+    async def _refresh(self):
+        chat_ids = list(self._peers)
+        heads: Dict[int, int] = {}
+        for start in range(0, len(chat_ids), PEER_DIALOGS_CHUNK):
+            chunk = chat_ids[start:start + PEER_DIALOGS_CHUNK]
+            await self.budget.acquire()
+            result = await self.client(GetPeerDialogsRequest(peers=[self._peers[chat_id] for chat_id in chunk]))
+            for dialog in result.dialogs:
+                heads[utils.get_peer_id(dialog.peer)] = dialog.top_message
+        self._heads = heads
+        self._checked_at = time.monotonic()
+
+    async def head(self, chat_id: int) -> Optional[int]:
+        """ID верхнего сообщения чата; None, если чата нет в диалогах аккаунта."""
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self.min_interval:
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    # Без пакетной проверки просто читаем историю напрямую
+                    logger.warning(f"GetPeerDialogs для аккаунта ID {self.account_id} не удался: {e}")
+                    self._heads = {}
+                    self._checked_at = time.monotonic()
+        return self._heads.get(self._marked.get(chat_id, chat_id))
+
+    async def fetch(self, chat_id: int, last_seen: Optional[int], limit: int) -> List:
+        """Новые сообщения чата в порядке возрастания ID.
+
+        После last_seen берутся самые старые limit сообщений: если пришло больше
+        страницы, остальное дочитывается следующими вызовами, а не теряется.
+        """
+        await self.budget.acquire()
+        if last_seen is None:
+            messages = await self.client.get_messages(chat_id, limit=MIN_PAGE_SIZE)
+        else:
+            messages = await self.client.get_messages(chat_id, limit=limit, min_id=last_seen, reverse=True)
+        return sorted(messages, key=lambda message: message.id)
+
+# account_id -> опросчик; создаётся при запуске первого парсера аккаунта
+account_pollers: Dict[int, AccountPoller] = {}
+
+def get_poller(client: TelegramClient, account_id: int) -> AccountPoller:
+    poller = account_pollers.get(account_id)
+    if poller is None or poller.client is not client:
+        poller = AccountPoller(client, account_id, TokenBucket(POLL_RPC_PER_SECOND, POLL_RPC_BURST))
+        account_pollers[account_id] = poller
+    return poller
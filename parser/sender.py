@@ -0,0 +1,175 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional
+from aiohttp.client_exceptions import ClientConnectionError
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+from aiogram.types import BufferedInputFile, Message
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeSticker
+from loguru import logger
+
+# Сетевые сбои и ошибки на стороне Telegram: повторяем с экспоненциальной задержкой
+NETWORK_ERRORS = (ClientConnectionError, TelegramNetworkError, TelegramServerError)
+# Дольше этого ждать FloodWait внутри отправки не будем — ошибка уходит парсеру
+MAX_RETRY_AFTER = 60
+
+class MediaKind(str, Enum):
+    TEXT = "text"
+    PHOTO = "photo"
+    VIDEO = "video"
+    AUDIO = "audio"
+    DOCUMENT = "document"
+    STICKER = "sticker"
+
+# Имя файла при загрузке в бота: {тип}_{ID сообщения}{расширение}
+MEDIA_EXTENSIONS = {
+    MediaKind.PHOTO: ".jpg",
+    MediaKind.VIDEO: ".mp4",
+    MediaKind.AUDIO: ".mp3",
+    MediaKind.DOCUMENT: "",
+    MediaKind.STICKER: ".webp",
+}
+
+def get_media_kind(message) -> MediaKind:
+    """Тип отправки для сообщения Telethon; неподдерживаемые медиа (опросы, превью ссылок) уходят текстом."""
+    media = message.media
+    if isinstance(media, MessageMediaPhoto) and media.photo:
+        return MediaKind.PHOTO
+    if isinstance(media, MessageMediaDocument) and media.document:
+        attributes = media.document.attributes
+        if any(isinstance(attr, DocumentAttributeSticker) for attr in attributes):
+            return MediaKind.STICKER
+        if any(isinstance(attr, DocumentAttributeVideo) for attr in attributes):
+            return MediaKind.VIDEO
+        if any(isinstance(attr, DocumentAttributeAudio) for attr in attributes):
+            return MediaKind.AUDIO
+        return MediaKind.DOCUMENT
+    return MediaKind.TEXT
+
+@dataclass(frozen=True)
+class OutboundMessage:
+    """Готовое к отправке сообщение: текст уже размечен, медиа уже скачано."""
+
+    chat_id: int
+    text: str
+    kind: MediaKind = MediaKind.TEXT
+    media: Optional[bytes] = None
+    source_id: Optional[int] = None  # ID исходного сообщения, для логов и имени файла
+    parse_mode: str = "HTML"
+
+    @property
+    def filename(self) -> str:
+        return f"{self.kind.value}_{self.source_id}{MEDIA_EXTENSIONS.get(self.kind, '')}"
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, TelegramRetryAfter):
+        return error.retry_after <= MAX_RETRY_AFTER
+    return isinstance(error, NETWORK_ERRORS)
+
+_network_wait = wait_exponential(multiplier=1, min=2, max=30)
+
+def _wait(retry_state) -> float:
+    # FloodWait бота ждём ровно столько, сколько просит Telegram
+    error = retry_state.outcome.exception()
+    if isinstance(error, TelegramRetryAfter):
+        return error.retry_after + 1
+    return _network_wait(retry_state)
+
+def _log_retry(retry_state):
+    outbound = retry_state.args[1]
+    logger.info(f"Повторная попытка отправки сообщения {outbound.source_id}, попытка {retry_state.attempt_number}: {retry_state.outcome.exception()}")
+
+class MessageSender:
+    """Отправка сообщений через бота с заранее собранными политиками повторов.
+
+    Для каждого типа медиа политика tenacity строится один раз при создании
+    отправителя, а не на каждое сообщение. Сетевые ошибки повторяются с
+    экспоненциальной задержкой, короткий FloodWait пережидается, остальные
+    ошибки (BadRequest, Forbidden) сразу уходят вызывающему.
+    """
+
+    def __init__(self, bot: Bot, attempts: int = 10):
+        self.bot = bot
+        policy = retry(
+            stop=stop_after_attempt(attempts),
+            wait=_wait,
+            retry=retry_if_exception(_is_retryable),
+            before_sleep=_log_retry,
+            reraise=True
+        )
+        self._senders: Dict[MediaKind, Callable[..., Awaitable[Message]]] = {
+            MediaKind.TEXT: policy(MessageSender._send_text),
+            MediaKind.PHOTO: policy(MessageSender._send_photo),
+            MediaKind.VIDEO: policy(MessageSender._send_video),
+            MediaKind.AUDIO: policy(MessageSender._send_audio),
+            MediaKind.DOCUMENT: policy(MessageSender._send_document),
+            MediaKind.STICKER: policy(MessageSender._send_sticker),
+        }
+
+    async def send(self, outbound: OutboundMessage) -> Message:
+        kind = outbound.kind if outbound.media is not None else MediaKind.TEXT
+        return await self._senders[kind](self, outbound)
+
+    @staticmethod
+    def _file(outbound: OutboundMessage) -> BufferedInputFile:
+        return BufferedInputFile(outbound.media, filename=outbound.filename)
+
+    async def _send_text(self, outbound: OutboundMessage) -> Message:
+        return await self.bot.send_message(
+            chat_id=outbound.chat_id,
+            text=outbound.text,
+            parse_mode=outbound.parse_mode,
+            disable_notification=False,
+            disable_web_page_preview=False
+        )
+
+    async def _send_photo(self, outbound: OutboundMessage) -> Message:
+        return await self.bot.send_photo(
+            chat_id=outbound.chat_id,
+            photo=self._file(outbound),
+            caption=outbound.text,
+            parse_mode=outbound.parse_mode,
+            disable_notification=False
+        )
+
+    async def _send_video(self, outbound: OutboundMessage) -> Message:
+        return await self.bot.send_video(
+            chat_id=outbound.chat_id,
+            video=self._file(outbound),
+            caption=outbound.text,
+            parse_mode=outbound.parse_mode,
+            disable_notification=False
+        )
+
+    async def _send_audio(self, outbound: OutboundMessage) -> Message:
+        return await self.bot.send_audio(
+            chat_id=outbound.chat_id,
+            audio=self._file(outbound),
+            caption=outbound.text,
+            parse_mode=outbound.parse_mode,
+            disable_notification=False
+        )
+
+    async def _send_document(self, outbound: OutboundMessage) -> Message:
+        return await self.bot.send_document(
+            chat_id=outbound.chat_id,
+            document=self._file(outbound),
+            caption=outbound.text,
+            parse_mode=outbound.parse_mode,
+            disable_notification=False
+        )
+
+    async def _send_sticker(self, outbound: OutboundMessage) -> Message:
+        # Стикеры не поддерживают подпись
+        return await self.bot.send_sticker(chat_id=outbound.chat_id, sticker=self._file(outbound))
+
+# Отправители по ботам: политики повторов собираются один раз на бота
+_senders: Dict[int, MessageSender] = {}
+
+def get_sender(bot: Bot) -> MessageSender:
+    sender = _senders.get(id(bot))
+    if sender is None or sender.bot is not bot:
+        sender = MessageSender(bot)
+        _senders[id(bot)] = sender
+    return sender
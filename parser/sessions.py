@@ -0,0 +1,291 @@
+import asyncio
+import datetime
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import select, delete, func
+from telethon import utils
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.tl.types import PeerUser, PeerChat, PeerChannel
+from telethon.tl.types.updates import State
+from database.db import engine, dialect_insert
+from database.models import TelethonSession, TelethonEntity, TelethonUpdateState
+from loguru import logger
+
+class DatabaseSession(MemorySession):
+    """Сессия Telethon, хранящаяся в основной базе данных.
+
+    Всё состояние держится в памяти, изменения помечаются и записываются
+    пачками через session_store, поэтому Telethon не ждёт диск на каждом
+    обновлении. Сущности индексируются по ID, username и телефону.
+    """
+
+    def __init__(self, session_key: Optional[str] = None):
+        super().__init__()
+        # Копии сессии (clone) для других DC остаются только в памяти
+        self.session_key = session_key
+        self._entities: Dict[int, tuple] = {}
+        self._by_username: Dict[str, int] = {}
+        self._by_phone: Dict[str, int] = {}
+        self._dirty = False
+        self._dirty_entities: Dict[int, tuple] = {}
+        self._dirty_states: Dict[int, State] = {}
+
+    # Изменения основных параметров сессии
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._dirty = True
+
+    def _set_auth_key(self, value):
+        self._auth_key = value
+        self._dirty = True
+
+    def _set_takeout_id(self, value):
+        self._takeout_id = value
+        self._dirty = True
+
+    auth_key = property(MemorySession.auth_key.fget, _set_auth_key)
+    takeout_id = property(MemorySession.takeout_id.fget, _set_takeout_id)
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self._dirty_states[entity_id] = state
+
+    # Кэш сущностей
+    def _remember(self, row: tuple):
+        entity_id, _, username, phone, _ = row
+        previous = self._entities.get(entity_id)
+        if previous:
+            self._by_username.pop(previous[2], None)
+            self._by_phone.pop(previous[3], None)
+        self._entities[entity_id] = row
+        if username:
+            self._by_username[username] = entity_id
+        if phone:
+            self._by_phone[phone] = entity_id
+
+    def process_entities(self, tlo):
+        for row in self._entities_to_rows(tlo):
+            if self._entities.get(row[0]) != row:
+                self._remember(row)
+                self._dirty_entities[row[0]] = row
+
+    def _row_id_hash(self, entity_id):
+        row = self._entities.get(entity_id) if entity_id is not None else None
+        return (row[0], row[1]) if row else None
+
+    def get_entity_rows_by_phone(self, phone):
+        return self._row_id_hash(self._by_phone.get(phone))
+
+    def get_entity_rows_by_username(self, username):
+        return self._row_id_hash(self._by_username.get(username))
+
+    def get_entity_rows_by_name(self, name):
+        return next(((row[0], row[1]) for row in self._entities.values() if row[4] == name), None)
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            return self._row_id_hash(id)
+        for marked_id in (utils.get_peer_id(PeerUser(id)), utils.get_peer_id(PeerChat(id)), utils.get_peer_id(PeerChannel(id))):
+            found = self._row_id_hash(marked_id)
+            if found:
+                return found
+        return None
+
+    # Сохранение
+    def save(self):
+        if self.session_key:
+            session_store.schedule(self)
+
+    def close(self):
+        self.save()
+
+    def delete(self):
+        if self.session_key:
+            session_store.schedule_delete(self.session_key)
+
+    def has_changes(self) -> bool:
+        return self._dirty or bool(self._dirty_entities) or bool(self._dirty_states)
+
+    def take_changes(self) -> Tuple[Optional[dict], Dict[int, tuple], Dict[int, State]]:
+        """Забирает накопленные изменения; при ошибке записи их возвращают через return_changes."""
+        session_row = None
+        if self._dirty:
+            session_row = {
+                "session_key": self.session_key,
+                "dc_id": self._dc_id,
+                "server_address": self._server_address,
+                "port": self._port,
+                "auth_key": self._auth_key.key if self._auth_key else None,
+                "takeout_id": self._takeout_id
+            }
+        entities, states = self._dirty_entities, self._dirty_states
+        self._dirty = False
+        self._dirty_entities, self._dirty_states = {}, {}
+        return session_row, entities, states
+
+    def return_changes(self, session_row, entities, states):
+        self._dirty = self._dirty or session_row is not None
+        for entity_id, row in entities.items():
+            self._dirty_entities.setdefault(entity_id, row)
+        for entity_id, state in states.items():
+            self._dirty_states.setdefault(entity_id, state)
+
+    # Загрузка
+    def _import_legacy(self, path: str):
+        """Однократный перенос старого .session файла в базу."""
+        legacy = SQLiteSession(path)
+        try:
+            self.set_dc(legacy.dc_id, legacy.server_address, legacy.port)
+            self.auth_key = legacy.auth_key
+            self.takeout_id = legacy.takeout_id
+            cursor = legacy._cursor()
+            try:
+                for entity_id, entity_hash, username, phone, name in cursor.execute("select id, hash, username, phone, name from entities"):
+                    # В SQLite колонка phone целочисленная
+                    self._remember((entity_id, entity_hash, username, str(phone) if phone else None, name))
+            finally:
+                cursor.close()
+            for entity_id, state in legacy.get_update_states():
+                self._update_states[entity_id] = state
+        finally:
+            legacy.close()
+        self._dirty = True
+        self._dirty_entities = dict(self._entities)
+        self._dirty_states = dict(self._update_states)
+        logger.info(f"Сессия {self.session_key} перенесена из {path} в базу данных ({len(self._entities)} сущностей)")
+
+    @classmethod
+    async def load(cls, session_key: str, legacy_path: Optional[str] = None) -> "DatabaseSession":
+        session = cls(session_key)
+        async with engine.connect() as conn:
+            result = await conn.execute(select(TelethonSession.__table__).where(TelethonSession.session_key == session_key))
+            row = result.first()
+            if row is None:
+                if legacy_path and os.path.exists(legacy_path):
+                    session._import_legacy(legacy_path)
+                    session_store.schedule(session)
+                return session
+
+            session._dc_id = row.dc_id or 0
+            session._server_address = row.server_address
+            session._port = row.port
+            session._auth_key = AuthKey(data=row.auth_key) if row.auth_key else None
+            session._takeout_id = row.takeout_id
+
+            entity_table = TelethonEntity.__table__
+            result = await conn.execute(
+                select(entity_table.c.id, entity_table.c.hash, entity_table.c.username, entity_table.c.phone, entity_table.c.name)
+                .where(entity_table.c.session_key == session_key)
+            )
+            for entity_row in result:
+                session._remember(tuple(entity_row))
+
+            state_table = TelethonUpdateState.__table__
+            result = await conn.execute(select(state_table).where(state_table.c.session_key == session_key))
+            for state_row in result:
+                date = datetime.datetime.fromtimestamp(state_row.date, tz=datetime.timezone.utc)
+                session._update_states[state_row.entity_id] = State(state_row.pts, state_row.qts, date, state_row.seq, unread_count=0)
+        return session
+
+# UPSERT по первичному ключу таблицы с обновлением остальных колонок
+def _upsert(table):
+    statement = dialect_insert(table)
+    primary_key = [column.name for column in table.primary_key]
+    values = {column.name: statement.excluded[column.name] for column in table.columns if column.name not in primary_key}
+    if "updated_at" in values:
+        values["updated_at"] = func.now()
+    return statement.on_conflict_do_update(index_elements=primary_key, set_=values)
+
+class SessionStore:
+    """Пакетная запись изменённых сессий Telethon в базу."""
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, DatabaseSession] = {}
+        self._deleted: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, session: DatabaseSession):
+        self._pending[session.session_key] = session
+        # Новый ключ авторизации пишем сразу, остальное — по таймеру
+        if session._dirty:
+            self._wakeup.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def schedule_delete(self, session_key: str):
+        self._pending.pop(session_key, None)
+        self._deleted.add(session_key)
+        self._wakeup.set()
+
+    async def delete(self, session_key: str):
+        self.schedule_delete(session_key)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        deleted, self._deleted = self._deleted, set()
+        changes = [(session, session.take_changes()) for session in pending.values() if session.has_changes()]
+        if not changes and not deleted:
+            return
+
+        session_rows, entity_rows, state_rows = [], [], []
+        now = int(time.time())
+        for session, (session_row, entities, states) in changes:
+            if session_row:
+                session_rows.append(session_row)
+            entity_rows.extend(
+                {"session_key": session.session_key, "id": row[0], "hash": row[1], "username": row[2], "phone": row[3], "name": row[4], "date": now}
+                for row in entities.values()
+            )
+            state_rows.extend(
+                {"session_key": session.session_key, "entity_id": entity_id, "pts": state.pts, "qts": state.qts, "date": int(state.date.timestamp()), "seq": state.seq}
+                for entity_id, state in states.items()
+            )
+
+        try:
+            async with engine.begin() as conn:
+                for session_key in deleted:
+                    for model in (TelethonSession, TelethonEntity, TelethonUpdateState):
+                        await conn.execute(delete(model.__table__).where(model.__table__.c.session_key == session_key))
+                if session_rows:
+                    await conn.execute(_upsert(TelethonSession.__table__), session_rows)
+                if entity_rows:
+                    await conn.execute(_upsert(TelethonEntity.__table__), entity_rows)
+                if state_rows:
+                    await conn.execute(_upsert(TelethonUpdateState.__table__), state_rows)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении сессий Telethon: {e}")
+            self._deleted |= deleted
+            for session, session_changes in changes:
+                session.return_changes(*session_changes)
+                self._pending.setdefault(session.session_key, session)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+session_store = SessionStore()
@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+
+@dataclass
+class ParserStats:
+    """Счётчики одного парсера (аккаунт, чат) для /status.
+
+    Обновляются в цикле парсера простыми присваиваниями; всё, что требует
+    вычислений (скорость, отставание), считается только при показе.
+    """
+
+    account_id: int
+    chat: str
+    chat_id: Optional[int] = None  # Числовой ID чата
+    task: Optional[asyncio.Task] = None
+    started_at: float = field(default_factory=time.monotonic)
+    last_message_id: Optional[int] = None  # Последнее обработанное сообщение
+    last_message_date: Optional[datetime.datetime] = None
+    head_message_id: Optional[int] = None  # Самое новое сообщение в чате при последнем опросе
+    processed: int = 0
+    forwarded: int = 0
+    last_error: Optional[str] = None
+    last_error_at: Optional[float] = None
+    flood_wait_until: Optional[float] = None
+    restarts: int = 0  # Перезапусков супервизором
+    retry_at: Optional[float] = None  # Когда супервизор перезапустит упавший парсер
+    _recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1000), repr=False)
+
+    def record_head(self, message_id: int):
+        if self.head_message_id is None or message_id > self.head_message_id:
+            self.head_message_id = message_id
+
+    def record_message(self, message):
+        self.processed += 1
+        self._recent.append(time.monotonic())
+        if self.last_message_id is None or message.id > self.last_message_id:
+            self.last_message_id = message.id
+            self.last_message_date = message.date
+
+    def record_error(self, error: BaseException):
+        self.last_error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        self.last_error_at = time.monotonic()
+
+    def record_flood_wait(self, seconds: float):
+        self.flood_wait_until = time.monotonic() + seconds
+
+    @property
+    def alive(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    @property
+    def flood_wait_left(self) -> float:
+        return max(0.0, self.flood_wait_until - time.monotonic()) if self.flood_wait_until else 0.0
+
+    @property
+    def retry_in(self) -> float:
+        return max(0.0, self.retry_at - time.monotonic()) if self.retry_at else 0.0
+
+    @property
+    def lag_messages(self) -> Optional[int]:
+        if self.head_message_id is None or self.last_message_id is None:
+            return None
+        return max(0, self.head_message_id - self.last_message_id)
+
+    @property
+    def lag_seconds(self) -> Optional[float]:
+        if self.last_message_date is None:
+            return None
+        return (datetime.datetime.now(datetime.timezone.utc) - self.last_message_date).total_seconds()
+
+    def messages_per_minute(self, window: float = 300) -> float:
+        now = time.monotonic()
+        border = now - window
+        count = sum(1 for moment in self._recent if moment >= border)
+        return count * 60 / min(window, max(now - self.started_at, 1))
+
+# (account_id, чат) -> счётчики; записи живут, пока парсер не остановлен
+parser_stats: Dict[Tuple[int, str], ParserStats] = {}
@@ -0,0 +1,96 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional
+from aiogram import Bot
+from sqlalchemy import select
+from telethon.errors import (
+    FloodWaitError, UnauthorizedError, ForbiddenError, ChannelPrivateError, ChannelInvalidError, ChatIdInvalidError,
+    UserBannedInChannelError, UserKickedError, UsernameNotOccupiedError, UsernameInvalidError, InviteHashExpiredError
+)
+from loguru import logger
+from database.db import get_db
+from database.models import Settings
+from parser.stats import ParserStats
+
+class PermanentParserError(Exception):
+    """Ошибка, после которой перезапуск парсера бессмыслен."""
+
+# Нет доступа к чату или аккаунту: исключили, забанили, чат удалён, сессия отозвана
+PERMANENT_ERRORS = (
+    PermanentParserError,
+    UnauthorizedError,  # AuthKeyUnregistered, SessionRevoked, UserDeactivated и т. п.
+    ForbiddenError,  # ChatForbidden, ChatWriteForbidden и другие ошибки 403
+    ChannelPrivateError,
+    ChannelInvalidError,
+    ChatIdInvalidError,
+    UserBannedInChannelError,
+    UserKickedError,
+    UsernameNotOccupiedError,
+    UsernameInvalidError,
+    InviteHashExpiredError,
+)
+
+def is_permanent(error: BaseException) -> bool:
+    return isinstance(error, PERMANENT_ERRORS)
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Экспоненциальная задержка с джиттером: половина фиксирована, половина случайна."""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+async def notify_admins(bot: Optional[Bot], text: str):
+    """Сообщение в Settings.notification_chat_id; без настроенного чата — только в лог."""
+    try:
+        async with get_db() as db:
+            result = await db.execute(select(Settings.notification_chat_id).where(Settings.notification_chat_id.isnot(None)))
+            chat_id = result.scalars().first()
+        if bot is None or not chat_id:
+            logger.warning(f"Чат для уведомлений не настроен: {text}")
+            return
+        await bot.send_message(chat_id=chat_id, text=text)
+    except Exception as e:
+        logger.error(f"Не удалось отправить уведомление: {e}")
+
+async def supervise_parser(
+    run: Callable[[], Awaitable],
+    stats: ParserStats,
+    bot: Optional[Bot] = None,
+    base_delay: float = 5,
+    max_delay: float = 600,
+    healthy_after: float = 300
+):
+    """Запускает парсер и перезапускает его после сбоев.
+
+    Временные ошибки (сеть, FloodWait, сбои Telegram) ведут к перезапуску с
+    растущей задержкой; если парсер проработал дольше healthy_after, счётчик
+    попыток сбрасывается. На постоянных ошибках супервизор останавливается и
+    уведомляет администраторов.
+    """
+    attempt = 0
+    while True:
+        started = time.monotonic()
+        try:
+            await run()
+            logger.info(f"Парсер аккаунта ID {stats.account_id} для чата {stats.chat} завершил работу")
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats.record_error(e)
+            if is_permanent(e):
+                logger.error(f"Парсер аккаунта ID {stats.account_id} для чата {stats.chat} остановлен: {e}")
+                await notify_admins(bot, f"⛔ Парсер остановлен без перезапуска\nАккаунт ID: {stats.account_id}\nЧат: {stats.chat}\nПричина: {stats.last_error}")
+                return
+            if time.monotonic() - started > healthy_after:
+                attempt = 0
+            attempt += 1
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if isinstance(e, FloodWaitError):
+                stats.record_flood_wait(e.seconds)
+                delay = max(delay, e.seconds + random.uniform(1, 5))
+            stats.restarts += 1
+            stats.retry_at = time.monotonic() + delay
+            logger.warning(f"Парсер аккаунта ID {stats.account_id} для чата {stats.chat} упал ({e}), перезапуск через {delay:.0f} с (попытка {attempt})")
+            await asyncio.sleep(delay)
+            stats.retry_at = None
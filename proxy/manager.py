@@ -1,9 +1,274 @@
+import asyncio
 import logging
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select
+from database.db import get_db
+from database.models import Proxy
+from bot.config import PROXY_CHECK_INTERVAL, PROXY_CHECK_TIMEOUT, PROXY_AUTO_ASSIGN
 
 logger = logging.getLogger(__name__)
 
+# Сколько подряд неудачных проверок переводят прокси в нерабочие
+MAX_FAILURES = 2
+
+@dataclass
+class ProxyStats:
+    alive: Optional[bool] = None  # None — ещё не проверялся
+    latency: Optional[float] = None  # Сглаженная задержка, секунды
+    failures: int = 0  # Неудачи подряд
+    checked_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @property
+    def score(self) -> float:
+        """Чем меньше, тем лучше; нерабочие прокси в выбор не попадают."""
+        if self.alive is False:
+            return float("inf")
+        latency = self.latency if self.latency is not None else 5.0
+        return latency * (1 + self.failures)
+
+    def record_success(self, latency: float):
+        self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        self.alive = True
+        self.failures = 0
+        self.last_error = None
+        self.checked_at = time.monotonic()
+
+    def record_failure(self, error: str):
+        self.failures += 1
+        self.last_error = error
+        self.checked_at = time.monotonic()
+        if self.failures >= MAX_FAILURES:
+            self.alive = False
+
+# Параметры прокси в формате, который принимает Telethon
+def to_telethon_proxy(proxy: Proxy) -> dict:
+    return {
+        "proxy_type": (proxy.type or "socks5").lower(),
+        "addr": proxy.host,
+        "port": proxy.port,
+        "username": proxy.user or None,
+        "password": proxy.password or None,
+        "rdns": True
+    }
+
+PROXY_FORMAT_ERROR = "Неверный формат. Введите данные в формате: айпи порт пользователь пароль"
+
+# "айпи:порт" с последним двоеточием как разделителем; IPv6 — в квадратных скобках
+def split_host_port(address: str) -> Tuple[str, str]:
+    host, separator, port = address.rpartition(":")
+    if not separator or not host:
+        raise ValueError(PROXY_FORMAT_ERROR)
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    return host, port
+
+# Разбор строки прокси. Поддерживаются форматы:
+#   айпи порт [пользователь пароль]
+#   айпи:порт [пользователь пароль]
+#   пользователь:пароль@айпи:порт
+#   айпи:порт:пользователь:пароль
+# Двоеточия в пароле сохраняются; IPv6 без скобок — только в формате через пробелы
+def parse_proxy_line(line: str) -> Proxy:
+    parts = line.split()
+    user = password = None
+    if len(parts) == 1 and "@" in parts[0]:
+        credentials, address = parts[0].rsplit("@", 1)
+        user, _, password = credentials.partition(":")
+        host, port = split_host_port(address)
+    elif len(parts) == 1 and not parts[0].startswith("["):
+        fields = parts[0].split(":", 3)
+        if len(fields) not in (2, 4):
+            raise ValueError(PROXY_FORMAT_ERROR)
+        host, port = fields[0], fields[1]
+        if len(fields) == 4:
+            user, password = fields[2], fields[3]
+    elif len(parts) in (1, 3):
+        host, port = split_host_port(parts[0])
+        if len(parts) == 3:
+            user, password = parts[1], parts[2]
+    elif len(parts) in (2, 4):
+        host, port = parts[0], parts[1]
+        if len(parts) == 4:
+            user, password = parts[2], parts[3]
+    else:
+        raise ValueError(PROXY_FORMAT_ERROR)
+    if not host or not port.isdigit():
+        raise ValueError(PROXY_FORMAT_ERROR)
+    port = int(port)
+    if port > 65535:
+        raise ValueError("Порт должен быть в диапазоне от 0 до 65535")
+    return Proxy(host=host, port=port, user=user or None, password=password or None, type="SOCKS5")
+
+async def probe_proxy(proxy: Proxy, timeout: float) -> float:
+    """Подключается к прокси и проходит приветствие SOCKS5 с аутентификацией; возвращает задержку."""
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(proxy.host, proxy.port), timeout)
+    try:
+        if (proxy.type or "socks5").lower() == "socks5":
+            method = b"\x02" if proxy.user else b"\x00"
+            writer.write(b"\x05\x01" + method)
+            await writer.drain()
+            version, chosen = await asyncio.wait_for(reader.readexactly(2), timeout)
+            if version != 5 or chosen == 0xFF:
+                raise ConnectionError("SOCKS5: метод аутентификации отклонён")
+            if chosen == 2:
+                user = (proxy.user or "").encode()
+                password = (proxy.password or "").encode()
+                writer.write(b"\x01" + bytes([len(user)]) + user + bytes([len(password)]) + password)
+                await writer.drain()
+                _, status = await asyncio.wait_for(reader.readexactly(2), timeout)
+                if status != 0:
+                    raise ConnectionError("SOCKS5: неверный логин или пароль")
+        return time.perf_counter() - started
+    finally:
+        writer.close()
+        with suppress(Exception):
+            await writer.wait_closed()
+
 class ProxyManager:
-    @staticmethod
-    async def load_proxies():
-        logger.info("Загрузка прокси (заглушка)")
-        # Здесь будет реальная логика загрузки прокси
\ No newline at end of file
+    """Пул прокси: периодические проверки, выбор самого быстрого и переключение аккаунтов."""
+
+    def __init__(self, check_interval: float = 300, check_timeout: float = 10, concurrency: int = 20, auto_assign: bool = False):
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.concurrency = concurrency
+        self.auto_assign = auto_assign  # Аккаунты без привязки тоже ходят через лучший прокси
+        self.proxies: Dict[int, Proxy] = {}
+        self.stats: Dict[int, ProxyStats] = {}
+        self.assignments: Dict[int, Optional[int]] = {}  # account_id -> proxy_id, через который подключён клиент
+        self._task: Optional[asyncio.Task] = None
+
+    async def load_proxies(self):
+        async with get_db() as db:
+            result = await db.execute(select(Proxy))
+            proxies = result.scalars().all()
+        self.proxies = {proxy.id: proxy for proxy in proxies}
+        for proxy_id in list(self.stats):
+            if proxy_id not in self.proxies:
+                del self.stats[proxy_id]
+        for proxy_id in self.proxies:
+            self.stats.setdefault(proxy_id, ProxyStats())
+        logger.info(f"Загружено прокси: {len(self.proxies)}")
+
+    def forget(self, proxy_id: int):
+        self.proxies.pop(proxy_id, None)
+        self.stats.pop(proxy_id, None)
+
+    async def check_proxy(self, proxy: Proxy) -> ProxyStats:
+        stats = self.stats.setdefault(proxy.id, ProxyStats())
+        try:
+            stats.record_success(await probe_proxy(proxy, self.check_timeout))
+        except Exception as e:
+            stats.record_failure(str(e) or type(e).__name__)
+        return stats
+
+    async def check_all(self, proxy_ids: Optional[Iterable[int]] = None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        proxies = [self.proxies[proxy_id] for proxy_id in (proxy_ids or self.proxies) if proxy_id in self.proxies]
+
+        async def check(proxy):
+            async with semaphore:
+                await self.check_proxy(proxy)
+
+        await asyncio.gather(*(check(proxy) for proxy in proxies))
+        alive = sum(1 for proxy in proxies if self.stats[proxy.id].alive)
+        logger.info(f"Проверка прокси завершена: рабочих {alive} из {len(proxies)}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.load_proxies()
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"Ошибка при проверке прокси: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def best_proxy(self, exclude: Iterable[int] = ()) -> Optional[Proxy]:
+        candidates = [
+            (self.stats[proxy_id].score, proxy_id) for proxy_id in self.proxies
+            if proxy_id not in exclude and self.stats[proxy_id].alive is not False
+        ]
+        if not candidates:
+            return None
+        return self.proxies[min(candidates)[1]]
+
+    async def select_proxy(self, account) -> Optional[Proxy]:
+        """Привязанный к аккаунту прокси, если он жив, иначе самый быстрый рабочий."""
+        proxy = None
+        if account.proxy_id:
+            if account.proxy_id not in self.proxies:
+                await self.load_proxies()
+            proxy = self.proxies.get(account.proxy_id)
+            if proxy and self.stats[proxy.id].alive is False:
+                fallback = self.best_proxy(exclude={proxy.id})
+                if fallback:
+                    logger.warning(f"Прокси ID {proxy.id} аккаунта ID {account.id} не работает, используем прокси ID {fallback.id}")
+                    proxy = fallback
+        elif self.auto_assign:
+            proxy = self.best_proxy()
+        self.assignments[account.id] = proxy.id if proxy else None
+        return proxy
+
+    def report_failure(self, account_id: int, error: Exception):
+        proxy_id = self.assignments.get(account_id)
+        if proxy_id in self.stats:
+            self.stats[proxy_id].record_failure(str(error) or type(error).__name__)
+
+    async def failover(self, client, account_id: int, error: Exception) -> bool:
+        """Переключает клиента на другой рабочий прокси; False, если переключаться некуда."""
+        current = self.assignments.get(account_id)
+        if current is None:
+            return False
+        self.report_failure(account_id, error)
+        # С заведомо мёртвого или уже удалённого прокси переключаемся сразу, иначе сначала убеждаемся, что он действительно не отвечает
+        stats, current_proxy = self.stats.get(current), self.proxies.get(current)
+        if stats is not None and current_proxy is not None and stats.alive is not False:
+            await self.check_proxy(current_proxy)
+            if stats.alive:
+                return False
+        proxy = self.best_proxy(exclude={current})
+        if proxy is None:
+            logger.error(f"Нет рабочих прокси для переключения аккаунта ID {account_id}")
+            return False
+        client.set_proxy(to_telethon_proxy(proxy))
+        self.assignments[account_id] = proxy.id
+        logger.warning(f"Аккаунт ID {account_id} переключён с прокси ID {current} на прокси ID {proxy.id}")
+        return True
+
+    async def import_proxies(self, db, raw: str) -> Tuple[List[int], List[str]]:
+        """Массовое добавление: по одному прокси на строку. Новые прокси сразу проверяются."""
+        added, errors = [], []
+        for number, line in enumerate(raw.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                added.append(parse_proxy_line(line))
+            except ValueError as e:
+                errors.append(f"Строка {number}: {e}")
+        if added:
+            db.add_all(added)
+            await db.flush()
+            added_ids = [proxy.id for proxy in added]
+            await db.commit()
+            await self.load_proxies()
+            await self.check_all(added_ids)
+        else:
+            added_ids = []
+        return added_ids, errors
+
+proxy_manager = ProxyManager(check_interval=PROXY_CHECK_INTERVAL, check_timeout=PROXY_CHECK_TIMEOUT, auto_assign=PROXY_AUTO_ASSIGN)
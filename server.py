@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from bot.config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, METRICS_HOST, METRICS_PORT
+from monitoring import metrics
+
+logger = logging.getLogger(__name__)
+
+# Проверка живости для балансировщика
+async def healthcheck(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+# Метрики в текстовом формате Prometheus
+async def metrics_handler(request: web.Request) -> web.Response:
+    response = web.Response(body=metrics.render())
+    response.headers["Content-Type"] = metrics.CONTENT_TYPE
+    return response
+
+async def start_metrics_server() -> web.AppRunner:
+    """Отдельный локальный сервер для /metrics, не открытый наружу вместе с вебхуком."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """aiohttp-приложение для приёма обновлений через вебхук.
+
+    Обновления обрабатываются в фоне (handle_in_background), поэтому Telegram
+    сразу получает ответ, а медленный обработчик не задерживает остальные.
+    Запросы без правильного секретного токена отклоняются.
+    """
+    # Без секрета любой, кто узнал адрес, может слать поддельные обновления в админку.
+    # Случайный секрет не подходит: экземпляры за балансировщиком должны знать один и тот же
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_SECRET: без него вебхук принимает любые запросы")
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", healthcheck)
+    # Запуск и остановка диспетчера (on_startup/on_shutdown) вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    app = create_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        # Несколько экземпляров за балансировщиком регистрируют один и тот же адрес, это безопасно
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            logger.info(f"Вебхук зарегистрирован: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    from bot.main import dp, bot
+    asyncio.run(run_webhook(dp, bot))